@@ -1,13 +1,12 @@
 import sys
 import os
 import subprocess
-import importlib.util
 from pathlib import Path
 import torch
 import json
 import uuid
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import threading
 import time
@@ -30,14 +29,74 @@ def check_cuda_availability():
         return False
 
 # Sentence transformer intent modülünü import et
-from sentence_transformer_intent import load_models, predict_intent
+from sentence_transformer_intent import load_models, predict_intent, predict_intents
+
+# Niyet yönlendirme ve RAG'in paylaştığı önbellekli embedding servisi
+from embedding_service import EmbeddingService
+
+# Eşzamanlı tekil çağrıları tek batch'te işleyen kuyruk
+from micro_batcher import MicroBatcher
 
 # PDF generator modülünü import et
 from pdf_generator import PDFGenerator
 
+# Modelleri süreç boyunca bir kez yükleyen kayıt defteri
+from model_registry import registry, load_backend_module, ModelKey, resolve_device, default_dtype
+
+# LLM yanıtları için birebir + anlamsal önbellek
+from response_cache import ResponseCache
+
+# Eşzamanlı istekleri tek decode batch'inde birleştiren scheduler
+from generation_scheduler import GenerationScheduler
+
+# Sabit system prompt öneklerinin KV cache'i
+from prefix_cache import PrefixKVCache
+
+# Tek base model üzerinde intent başına LoRA adapter'ları
+from lora_manager import MultiLoRAModel, BASE_ADAPTER
+
+# GENERATION_BATCHING=1 ile LLM istekleri continuous batching ile üretilir
+GENERATION_BATCHING = os.getenv("GENERATION_BATCHING", "0") == "1"
+GENERATION_MAX_BATCH = int(os.getenv("GENERATION_MAX_BATCH", "8"))
+
+# SHARED_BASE_MODEL=1 ile tüm LLM backend'leri tek base modeli paylaşır
+SHARED_BASE_MODEL = os.getenv("SHARED_BASE_MODEL", "0") == "1"
+
+# Niyet tahmini micro-batching ayarları
+INTENT_MAX_BATCH = int(os.getenv("INTENT_MAX_BATCH", "32"))
+INTENT_BATCH_WAIT_MS = float(os.getenv("INTENT_BATCH_WAIT_MS", "0"))
+
+# RAG'de LLM'e verilecek chunk sayısı (hibrit arama ve reranker ile daha az chunk yeterli)
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "5"))
+# İstekte verilebilecek dönem filtreleri (RAG araması o dönem ve genel chunk'larla sınırlanır)
+CHAT_STAGES = ("pregnancy", "postpartum")
+
+# Ortak embedding önbelleğinin boyutu
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+
+# Yanıt önbelleği ayarları (RESPONSE_CACHE=0 ile kapatılır)
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "1") == "1"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+# Kişisel olmayan, tekrar eden sorular; duygusal destek yanıtları varsayılan olarak önbelleğe alınmaz
+RESPONSE_CACHE_INTENTS = set(filter(None, os.getenv("RESPONSE_CACHE_INTENTS", "health_rag_info,diet_exercise").split(",")))
+
 app = Flask(__name__)
 CORS(app)  # Flutter uygulamasından gelen isteklere izin ver
 
+EMPTY_RESPONSE_MESSAGE = "I'm sorry, I couldn't generate a response. Please try rephrasing your question."
+
+def clean_model_response(response):
+    """Model çıktısındaki system tag'lerini ve diğer karakterleri temizler"""
+    response = response.replace('<|system|>', '').replace('<|user|>', '').replace('<|assistant|>', '')
+    response = response.replace('<', '').replace('>', '').replace('b', '').replace('span', '').replace('style', '').replace('font-size', '').replace('18pt', '').replace(';', '').replace('"', '').replace('=', '').replace('/', '')
+    return response.strip()
+
+def format_sse(event, data):
+    """Bir olayı Server-Sent Events formatına çevirir"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 class APIChatbot:
     def __init__(self):
         """API chatbot sınıfını başlatır"""
@@ -58,6 +117,17 @@ class APIChatbot:
         
         print("✅ Niyet tanıma modelleri yüklendi!")
         
+        # Niyet modeli ve RAG aynı all-MiniLM-L6-v2 encoder'ını ve önbelleğini kullanır
+        self.sentence_model = EmbeddingService(self.sentence_model, max_entries=EMBEDDING_CACHE_SIZE)
+        
+        # Eşzamanlı mesajların niyetleri tek encoder çağrısında tahmin edilir
+        self.intent_batcher = MicroBatcher(
+            self.classify_user_messages,
+            max_batch_size=INTENT_MAX_BATCH,
+            max_wait_ms=INTENT_BATCH_WAIT_MS,
+            name="intent-batcher"
+        )
+        
         # Modül yollarını tanımla
         self.modules = {
             "nutrition": {
@@ -82,6 +152,31 @@ class APIChatbot:
             }
         }
         
+        # Üretim modellerinin (modül adı, dosya yolu, sınıf adı) bilgileri
+        self.generation_backends = {
+            "diet_exercise": ("diet_exercise_inference", "empamomodeldeneme/inference.py", "DietExerciseModel"),
+            "emotional_support": ("emotional_inference", "empamom_emotional_support/inferance.py", "EmotionalSupportModel")
+        }
+        
+        # Uzun ömürlü RAG servisi (embedder, indeks ve LLM ayrı yüklenir)
+        rag_service_module = load_backend_module("rag_service", "rag_info/rag_service.py")
+        self.rag_service = rag_service_module.RAGService(
+            embedding_model=self.sentence_model,
+            decoder_factory=self.make_rag_decoder if (GENERATION_BATCHING or SHARED_BASE_MODEL) else None,
+            # Ön yükleme dahil her yolda RAG, paylaşılan base modeli kullanır (üçüncü kopya yüklenmez)
+            llm_factory=self.shared_rag_llm if SHARED_BASE_MODEL else None
+        )
+        if os.getenv("RAG_PRELOAD", "0") == "1":
+            print("📚 RAG servisi arka planda yükleniyor...")
+            self.rag_service.warmup(background=True)
+        
+        # Aynı sorular için LLM'i tekrar çalıştırmamak adına yanıt önbelleği
+        self.response_cache = ResponseCache(
+            max_entries=RESPONSE_CACHE_SIZE,
+            ttl_seconds=RESPONSE_CACHE_TTL,
+            similarity_threshold=RESPONSE_CACHE_SIMILARITY
+        ) if RESPONSE_CACHE else None
+        
         # Nutrition session'ları için storage
         self.nutrition_sessions = {}
         
@@ -124,9 +219,157 @@ class APIChatbot:
         print("🚀 API Chatbot hazır!")
     
     def predict_user_intent(self, user_message):
-        intent, confidence = predict_intent(user_message, self.sentence_model, self.scaler, self.intent_model)
+        intent, confidence, _ = self.classify_user_message(user_message)
         return intent, confidence
     
+    def classify_user_message(self, user_message):
+        """Mesajın niyetini, güven skorunu ve MiniLM embedding'ini döndürür"""
+        return self.intent_batcher(user_message)
+    
+    def classify_user_messages(self, user_messages):
+        """Birden fazla mesaj için (niyet, güven, embedding) listesini tek batch'te hesaplar"""
+        results, embeddings = predict_intents(
+            user_messages, self.sentence_model, self.scaler, self.intent_model, return_embeddings=True
+        )
+        if embeddings is None:
+            embeddings = [None] * len(results)
+        return [(intent, confidence, embedding) for (intent, confidence), embedding in zip(results, embeddings)]
+    
+    def predict_user_intents(self, user_messages):
+        """Birden fazla mesajın niyetini tek batch'te tahmin eder"""
+        return predict_intents(user_messages, self.sentence_model, self.scaler, self.intent_model)
+    
+    def response_version(self, intent, stage=None):
+        """Önbellek girişlerinin bağlı olduğu model/adapter (RAG için indeks ve dönem filtresi) sürümü.
+        
+        Adapter sürümü model yüklenirken bir kez okunur; model yüklü değilse None döner.
+        """
+        if intent == "health_rag_info":
+            snapshot = self.rag_service.snapshot
+            index_version = f"{snapshot.path}@{snapshot.loaded_at}" if snapshot is not None else "none"
+            return f"{self.rag_service.llm_model_path}|{index_version}|{stage or 'all'}"
+        module_name, relative_path, _ = self.generation_backends[intent]
+        module = load_backend_module(module_name, relative_path)
+        key = self.shared_base_key()[0] if SHARED_BASE_MODEL else self.generation_model_key(module)
+        # Diskteki değil, yüklü modelin sürümü; model henüz yüklenmediyse önbellek kullanılmaz
+        version = registry.loaded_adapter_version(key, module.DEFAULT_ADAPTER_PATH)
+        if version is None:
+            return None
+        return f"{module.BASE_MODEL_ID}|{module.DEFAULT_ADAPTER_PATH}@{version}"
+    
+    def get_cached_response(self, intent, user_message, embedding, stage=None):
+        """Önbellekteki yanıtı ve eşleşme türünü döndürür, yoksa (None, None)"""
+        if self.response_cache is None or intent not in RESPONSE_CACHE_INTENTS:
+            return None, None
+        version = self.response_version(intent, stage)
+        if version is None:
+            return None, None
+        return self.response_cache.get(intent, version, user_message, embedding)
+    
+    def cache_response(self, intent, user_message, embedding, response, stage=None):
+        if self.response_cache is None or intent not in RESPONSE_CACHE_INTENTS:
+            return
+        version = self.response_version(intent, stage)
+        if version is not None:
+            self.response_cache.put(intent, version, user_message, response, embedding)
+    
+    def run_generation_module(self, intent, user_message, embedding=None, stage=None):
+        """LLM modülünü önbellek üzerinden çalıştırır; (başarı, yanıt, önbellek eşleşmesi) döndürür"""
+        cached_response, cache_hit = self.get_cached_response(intent, user_message, embedding, stage)
+        if cached_response is not None:
+            return True, cached_response, cache_hit
+        
+        if intent == "health_rag_info":
+            success, response = self.run_health_rag_module(user_message, stage)
+        elif intent == "diet_exercise":
+            success, response = self.run_diet_exercise_module(user_message)
+        else:
+            success, response = self.run_emotional_support_module(user_message)
+        
+        if success and response:
+            self.cache_response(intent, user_message, embedding, response, stage)
+        return success, response, None
+    
+    def make_decoder(self, model, tokenizer):
+        """Batch'li üretim için modele ait scheduler'ı oluşturur"""
+        print(f"🔀 Continuous batching aktif (max batch: {GENERATION_MAX_BATCH})")
+        return GenerationScheduler(
+            model, tokenizer, max_batch_size=GENERATION_MAX_BATCH,
+            prefix_cache=PrefixKVCache(model, tokenizer)
+        )
+    
+    def make_rag_decoder(self, model, tokenizer):
+        """RAG için token üreticisi; paylaşılan modda adapter'sız base model satırı olarak çalışır"""
+        if SHARED_BASE_MODEL:
+            return self.get_shared_base().decoder_for(BASE_ADAPTER)
+        return self.make_decoder(model, tokenizer)
+    
+    def shared_base_key(self):
+        """Paylaşılan base modelin kayıt defteri anahtarı ve {intent: adapter yolu}"""
+        modules = {
+            intent: load_backend_module(module_name, relative_path)
+            for intent, (module_name, relative_path, _) in self.generation_backends.items()
+        }
+        base_model_id = next(iter(modules.values())).BASE_MODEL_ID
+        adapters = {intent: module.DEFAULT_ADAPTER_PATH for intent, module in modules.items()}
+        
+        device = resolve_device()
+        return ModelKey(base_model_id, tuple(sorted(adapters.values())), device, default_dtype(device)), adapters
+    
+    def get_shared_base(self):
+        """Tüm backend'lerin paylaştığı base modeli ve LoRA adapter'larını döndürür"""
+        key, adapters = self.shared_base_key()
+        
+        def factory(key):
+            shared = MultiLoRAModel(key.model_id, adapters, key.device)
+            shared.load()
+            if GENERATION_BATCHING:
+                # Tüm adapter'lar ve RAG aynı decode batch'inde çalışır
+                shared.scheduler = GenerationScheduler(
+                    shared.peft_model, shared.tokenizer,
+                    max_batch_size=GENERATION_MAX_BATCH, multi_adapter=True,
+                    prefix_cache=shared.prefix_cache
+                )
+            return shared
+        
+        return registry.get_or_load(key, factory)
+    
+    def generation_model_key(self, module):
+        """Inference modülünün kendi modelinin kayıt defteri anahtarı"""
+        device = resolve_device()
+        return ModelKey(module.BASE_MODEL_ID, module.DEFAULT_ADAPTER_PATH, device, default_dtype(device))
+    
+    def get_generation_model(self, intent):
+        """Intent'e ait üretim modelini kayıt defterinden döndürür, ilk çağrıda bir kez yükler"""
+        module_name, relative_path, class_name = self.generation_backends[intent]
+        module = load_backend_module(module_name, relative_path)
+        key = self.generation_model_key(module)
+        
+        def factory(key):
+            model = getattr(module, class_name)(key.model_id, key.adapter_path, key.device)
+            if SHARED_BASE_MODEL:
+                # Kendi kopyası yerine paylaşılan base model üzerindeki adapter'ı kullan
+                shared = self.get_shared_base()
+                model.attach_shared_model(shared.view(intent), shared.tokenizer, shared.decoder_for(intent), key.device)
+                return model
+            if not model.load_model():
+                raise RuntimeError(f"{class_name} yüklenemedi")
+            if GENERATION_BATCHING:
+                model.decoder = self.make_decoder(model.model, model.tokenizer)
+                model.register_prompt_prefix()
+            return model
+        
+        return registry.get_or_load(key, factory)
+    
+    def shared_rag_llm(self):
+        """RAG'in LLM'i: paylaşılan base modelin adapter'sız görünümü"""
+        shared = self.get_shared_base()
+        return shared.tokenizer, shared.view(BASE_ADAPTER)
+    
+    def get_rag_system(self):
+        """Sıcak RAG sistemini servis üzerinden döndürür, ilk çağrıda bileşenleri yükler"""
+        return self.rag_service.get_system()
+    
     def create_nutrition_session(self):
         """Yeni bir nutrition session oluşturur"""
         session_id = str(uuid.uuid4())
@@ -251,30 +494,20 @@ class APIChatbot:
             if nutrition_dir in sys.path:
                 sys.path.remove(nutrition_dir)
     
-    def run_health_rag_module(self, user_message):
-        """Sağlık RAG modülünü çalıştırır"""
+    def run_health_rag_module(self, user_message, stage=None):
+        """Sağlık RAG modülünü çalıştırır (stage: pregnancy/postpartum ile arama o döneme sınırlanır)"""
         try:
-            # RAG sistemini import et
-            spec = importlib.util.spec_from_file_location(
-                "rag_system", 
-                "rag_info/rag_system.py"
-            )
-            rag_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(rag_module)
-            
-            # RAG sistemini başlat
-            rag_system = rag_module.RAGSystem()
+            # Sıcak RAG sistemini al
+            rag_system = self.get_rag_system()
             
             # Benzer chunk'ları ara
-            similar_chunks = rag_system.search_similar_chunks(user_message, top_k=5)
-            context = rag_system.create_context(similar_chunks)
-            
-            # Yanıt üret
-            response = rag_system.generate_response(user_message, context)
+            similar_chunks = rag_system.retrieve(
+                user_message, top_k=RAG_TOP_K, filters=rag_system.stage_filters(user_message, stage)
+            )
+            context = rag_system.create_context(similar_chunks, user_message)
             
-            # Generator ise string'e çevir
-            if hasattr(response, '__iter__') and not isinstance(response, str):
-                response = ''.join(response)
+            # Yanıt üret (KV cache'li decoder ya da batch scheduler üzerinden)
+            response = ''.join(rag_system.generate_response_streaming(user_message, context)).strip()
             
             return True, response
                 
@@ -284,30 +517,22 @@ class APIChatbot:
     def run_diet_exercise_module(self, user_message):
         """Diyet ve egzersiz modülünü çalıştırır"""
         try:
-            # Inference modülünü import et
-            spec = importlib.util.spec_from_file_location(
-                "inference", 
-                "empamomodeldeneme/inference.py"
-            )
-            inference_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(inference_module)
+            # Sıcak modeli kayıt defterinden al
+            model = self.get_generation_model("diet_exercise")
             
-            # Inference.py'nin kendi fonksiyonunu kullan
-            if hasattr(inference_module, 'generate_single_response'):
-                response = inference_module.generate_single_response(user_message)
+            if hasattr(model, 'generate_response_letter_by_letter'):
+                response = model.generate_response_letter_by_letter(user_message)
                 
                 # Generator ise string'e çevir
                 if hasattr(response, '__iter__') and not isinstance(response, str):
                     response = ''.join(response)
                 
                 # System tag'lerini ve diğer karakterleri temizle
-                response = response.replace('<|system|>', '').replace('<|user|>', '').replace('<|assistant|>', '')
-                response = response.replace('<', '').replace('>', '').replace('b', '').replace('span', '').replace('style', '').replace('font-size', '').replace('18pt', '').replace(';', '').replace('"', '').replace('=', '').replace('/', '')
-                response = response.strip()
+                response = clean_model_response(response)
                 
                 return True, response
             else:
-                return False, "Inference modülünde generate_single_response fonksiyonu bulunamadı!"
+                return False, "Diyet/Egzersiz modelinde generate_response_letter_by_letter fonksiyonu bulunamadı!"
                 
         except Exception as e:
             return False, f"Diyet/Egzersiz modülü çalıştırılırken hata: {str(e)}"
@@ -317,24 +542,18 @@ class APIChatbot:
         try:
             print(f"🔍 Duygusal destek modülü başlatılıyor...")
             
-            # Emotional support modülünü import et
-            spec = importlib.util.spec_from_file_location(
-                "emotional_inference", 
-                "empamom_emotional_support/inferance.py"
-            )
-            emotional_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(emotional_module)
+            # Sıcak modeli kayıt defterinden al
+            model = self.get_generation_model("emotional_support")
             
-            print(f"✅ Emotional support modülü başarıyla import edildi")
+            print(f"✅ Emotional support modeli hazır")
             
-            # Emotional support modülünün kendi fonksiyonunu kullan
-            if hasattr(emotional_module, 'generate_single_response'):
+            if hasattr(model, 'generate_response_letter_by_letter'):
                 print(f"🔄 Duygusal destek yanıtı üretiliyor...")
                 
-                # generate_single_response bir generator olduğu için tüm karakterleri topla
+                # generate_response_letter_by_letter bir generator olduğu için tüm karakterleri topla
                 response_chars = []
                 char_count = 0
-                for char in emotional_module.generate_single_response(user_message):
+                for char in model.generate_response_letter_by_letter(user_message):
                     response_chars.append(char)
                     char_count += 1
                     if char_count % 50 == 0:  # Her 50 karakterde bir log
@@ -344,22 +563,20 @@ class APIChatbot:
                 print(f"✅ Toplam {len(response_chars)} karakter üretildi")
                 
                 # System tag'lerini ve diğer karakterleri temizle
-                response = response.replace('<|system|>', '').replace('<|user|>', '').replace('<|assistant|>', '')
-                response = response.replace('<', '').replace('>', '').replace('b', '').replace('span', '').replace('style', '').replace('font-size', '').replace('18pt', '').replace(';', '').replace('"', '').replace('=', '').replace('/', '')
-                response = response.strip()
+                response = clean_model_response(response)
                 
                 print(f"📝 Temizlenmiş yanıt uzunluğu: {len(response)}")
                 
                 # Boş yanıt kontrolü
-                if not response or response == "I'm sorry, I couldn't generate a response. Please try rephrasing your question.":
+                if not response or response == EMPTY_RESPONSE_MESSAGE:
                     print(f"❌ Boş yanıt üretildi")
                     return False, "Duygusal destek modülü yanıt üretemedi. Lütfen mesajınızı tekrar deneyin."
                 
                 print(f"✅ Duygusal destek yanıtı başarıyla üretildi")
                 return True, response
             else:
-                print(f"❌ generate_single_response fonksiyonu bulunamadı")
-                return False, "Emotional support modülünde generate_single_response fonksiyonu bulunamadı!"
+                print(f"❌ generate_response_letter_by_letter fonksiyonu bulunamadı")
+                return False, "Emotional support modelinde generate_response_letter_by_letter fonksiyonu bulunamadı!"
                 
         except Exception as e:
             print(f"❌ Duygusal destek modülü hatası: {str(e)}")
@@ -367,10 +584,10 @@ class APIChatbot:
             traceback.print_exc()
             return False, f"Duygusal Destek modülü çalıştırılırken hata: {str(e)}"
     
-    def process_user_message(self, user_message):
+    def process_user_message(self, user_message, stage=None):
         """Kullanıcı mesajını işler ve uygun modülü çalıştırır"""
-        # Niyet tahmini yap
-        intent, confidence = self.predict_user_intent(user_message)
+        # Niyet tahmini yap (embedding yanıt önbelleğinde de kullanılır)
+        intent, confidence, embedding = self.classify_user_message(user_message)
         
         # Güven skoru kontrolü
         if confidence < 0.6:
@@ -395,48 +612,116 @@ class APIChatbot:
                 "message": "Beslenme planı oluşturmak için size bazı sorular soracağım. İlk soru: " + next_question["question"]
             }
             
-        elif intent == "health_rag_info":
-            success, response = self.run_health_rag_module(user_message)
+        elif intent in ("health_rag_info", "diet_exercise", "emotional_support"):
+            success, response, cache_hit = self.run_generation_module(intent, user_message, embedding, stage)
             return {
                 "success": success,
                 "intent": intent,
                 "confidence": confidence,
-                "message": response
+                "message": response,
+                "cached": cache_hit
             }
             
-        elif intent == "diet_exercise":
-            success, response = self.run_diet_exercise_module(user_message)
+        elif intent == "anlasilamadi":
             return {
-                "success": success,
+                "success": False,
                 "intent": intent,
                 "confidence": confidence,
-                "message": response
+                "message": "Mesajınız anlaşılamadı. Lütfen mesajınızı daha açık bir şekilde ifade edin."
             }
             
-        elif intent == "emotional_support":
-            success, response = self.run_emotional_support_module(user_message)
+        else:
             return {
-                "success": success,
+                "success": False,
                 "intent": intent,
                 "confidence": confidence,
-                "message": response
+                "message": f"Bilinmeyen kategori: {intent}"
             }
-            
-        elif intent == "anlasilamadi":
-            return {
-                "success": False,
+    
+    def stream_user_message(self, user_message, stage=None):
+        """Kullanıcı mesajını işler ve (olay, veri) çiftlerini üretildikçe döndürür.
+        
+        Olaylar: intent, token, final, error
+        """
+        intent, confidence, embedding = self.classify_user_message(user_message)
+        confidence = float(confidence)
+        
+        if confidence < 0.6 or intent == "anlasilamadi":
+            yield "error", {
                 "intent": intent,
                 "confidence": confidence,
                 "message": "Mesajınız anlaşılamadı. Lütfen mesajınızı daha açık bir şekilde ifade edin."
             }
-            
+            return
+        
+        yield "intent", {"intent": intent, "confidence": confidence}
+        
+        if intent == "nutrition":
+            # Nutrition soru-cevap akışıyla devam eder, token üretimi yok
+            session_id = self.create_nutrition_session()
+            next_question = self.get_next_nutrition_question(session_id)
+            yield "final", {
+                "success": True,
+                "intent": intent,
+                "confidence": confidence,
+                "session_id": session_id,
+                "next_question": next_question,
+                "message": "Beslenme planı oluşturmak için size bazı sorular soracağım. İlk soru: " + next_question["question"]
+            }
+            return
+        
+        cached_response, cache_hit = self.get_cached_response(intent, user_message, embedding, stage)
+        if cached_response is not None:
+            yield "token", {"text": cached_response}
+            yield "final", {
+                "success": True,
+                "intent": intent,
+                "confidence": confidence,
+                "message": cached_response,
+                "cached": cache_hit
+            }
+            return
+        
+        if intent == "health_rag_info":
+            rag_system = self.get_rag_system()
+            similar_chunks = rag_system.retrieve(
+                user_message, top_k=RAG_TOP_K, filters=rag_system.stage_filters(user_message, stage)
+            )
+            context = rag_system.create_context(similar_chunks, user_message)
+            token_stream = rag_system.generate_response_streaming(user_message, context)
+        elif intent in self.generation_backends:
+            model = self.get_generation_model(intent)
+            token_stream = model.generate_response_streaming(user_message)
         else:
-            return {
-                "success": False,
+            yield "error", {
                 "intent": intent,
                 "confidence": confidence,
                 "message": f"Bilinmeyen kategori: {intent}"
             }
+            return
+        
+        response_parts = []
+        for text in token_stream:
+            response_parts.append(text)
+            yield "token", {"text": text}
+        
+        response = clean_model_response(''.join(response_parts))
+        if not response or response == EMPTY_RESPONSE_MESSAGE:
+            yield "error", {
+                "intent": intent,
+                "confidence": confidence,
+                "message": "Yanıt üretilemedi. Lütfen mesajınızı tekrar deneyin."
+            }
+            return
+        
+        self.cache_response(intent, user_message, embedding, response, stage)
+        yield "final", {
+            "success": True,
+            "intent": intent,
+            "confidence": confidence,
+            "message": response,
+            "cached": None
+        }
     
     def cleanup_expired_sessions(self):
         """Süresi dolmuş session'ları temizler"""
@@ -459,6 +744,7 @@ def chat():
     try:
         data = request.get_json()
         user_message = data.get('message', '').strip()
+        stage = data.get('stage')
         
         if not user_message:
             return jsonify({
@@ -466,11 +752,17 @@ def chat():
                 "message": "Mesaj boş olamaz"
             }), 400
         
+        if stage is not None and stage not in CHAT_STAGES:
+            return jsonify({
+                "success": False,
+                "message": f"Geçersiz dönem: {stage} (pregnancy veya postpartum olmalı)"
+            }), 400
+        
         # Session temizliği
         chatbot.cleanup_expired_sessions()
         
         # Mesajı işle
-        result = chatbot.process_user_message(user_message)
+        result = chatbot.process_user_message(user_message, stage)
         
         return jsonify(result)
         
@@ -480,6 +772,72 @@ def chat():
             "message": f"Sunucu hatası: {str(e)}"
         }), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Ana chat endpoint'inin SSE ile token token yanıt veren versiyonu"""
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message', '').strip()
+    stage = data.get('stage')
+    
+    if not user_message:
+        return jsonify({
+            "success": False,
+            "message": "Mesaj boş olamaz"
+        }), 400
+    
+    if stage is not None and stage not in CHAT_STAGES:
+        return jsonify({
+            "success": False,
+            "message": f"Geçersiz dönem: {stage} (pregnancy veya postpartum olmalı)"
+        }), 400
+    
+    # Session temizliği
+    chatbot.cleanup_expired_sessions()
+    
+    def event_stream():
+        try:
+            for event, payload in chatbot.stream_user_message(user_message, stage):
+                yield format_sse(event, payload)
+        except Exception as e:
+            yield format_sse("error", {"message": f"Sunucu hatası: {str(e)}"})
+    
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@app.route('/api/intents', methods=['POST'])
+def classify_intents():
+    """Birden fazla mesajın niyetini tek batch'te tahmin eder (log analizi için)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        messages = data.get('messages', [])
+        
+        if not isinstance(messages, list) or not messages:
+            return jsonify({
+                "success": False,
+                "message": "Mesaj listesi boş olamaz"
+            }), 400
+        
+        results = chatbot.predict_user_intents(messages)
+        return jsonify({
+            "success": True,
+            "results": [
+                {"message": message, "intent": intent, "confidence": float(confidence)}
+                for message, (intent, confidence) in zip(messages, results)
+            ]
+        })
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": f"Sunucu hatası: {str(e)}"
+        }), 500
+
 @app.route('/api/nutrition/answer', methods=['POST'])
 def nutrition_answer():
     """Nutrition sorularına cevap endpoint'i"""
@@ -547,9 +905,52 @@ def health_check():
         "status": "healthy",
         "cuda_available": chatbot.cuda_available,
         "models_loaded": all([chatbot.intent_model, chatbot.scaler, chatbot.sentence_model]),
+        "generation_models": registry.status(),
+        "rag": chatbot.rag_service.status(),
+        "embedding_cache": chatbot.sentence_model.stats(),
+        "response_cache": chatbot.response_cache.stats() if chatbot.response_cache is not None else None,
         "active_sessions": len(chatbot.nutrition_sessions)
     })
 
+@app.route('/api/rag/reload', methods=['POST'])
+def reload_rag_index():
+    """RAG indeksini ve metadata'sını LLM'i yeniden yüklemeden yeniler.
+    
+    İsteğe bağlı JSON: {"version": "<sürüm>"} ile belirli bir sürüme geçilir (geri alma),
+    {"background": true} ile yükleme arka planda yapılır ve hemen 202 döner.
+    """
+    data = request.get_json(silent=True) or {}
+    version = data.get('version')
+    try:
+        if data.get('background'):
+            started = chatbot.rag_service.reload_index_async(version)
+            return jsonify({
+                "success": started,
+                "message": "Yenileme başlatıldı" if started else "Zaten bir yenileme sürüyor",
+                "reload": chatbot.rag_service.reload_state
+            }), 202 if started else 409
+        snapshot = chatbot.rag_service.reload_index(version=version)
+        return jsonify({
+            "success": True,
+            "index": snapshot.info()
+        })
+    except ValueError as e:
+        # Bilinmeyen ya da versions/ dışını gösteren sürüm adı
+        return jsonify({
+            "success": False,
+            "message": str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": f"RAG indeksi yenilenirken hata: {str(e)}"
+        }), 500
+
+@app.route('/api/rag/versions', methods=['GET'])
+def list_rag_versions():
+    """Diskteki RAG indeksi sürümlerini, etkin ve sunulan sürümü listeler"""
+    return jsonify(chatbot.rag_service.versions())
+
 @app.route('/api/modules', methods=['GET'])
 def get_modules():
     """Mevcut modülleri listeler"""
@@ -649,12 +1050,16 @@ if __name__ == '__main__':
     print("📡 Sunucu http://localhost:5000 adresinde çalışacak")
     print("🔗 Endpoint'ler:")
     print("   POST /api/chat - Ana chat")
+    print("   POST /api/chat/stream - Ana chat (SSE streaming)")
+    print("   POST /api/intents - Toplu niyet tahmini")
     print("   POST /api/nutrition/answer - Nutrition sorularına cevap")
     print("   GET  /api/health - Sağlık kontrolü")
+    print("   POST /api/rag/reload - RAG indeksini yenile (sürüm seçimi, arka planda)")
+    print("   GET  /api/rag/versions - RAG indeksi sürümleri")
     print("   GET  /api/modules - Modül listesi")
     print("   GET  /api/programs/<user_id> - Kullanıcı programlarını listele")
     print("   GET  /api/programs/<program_id>/download - Program PDF'ini indir")
     print("   GET  /api/programs/<program_id>/view - Program PDF'ini görüntüle")
     print("   DELETE /api/programs/<program_id> - Programı sil")
     
-    app.run(host='0.0.0.0', port=5000, debug=False) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True) 
\ No newline at end of file
@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+
+# Kullanım:
+#   python benchmark_cpu.py                                   # emotional_support, fp32 / int8 / compile
+#   python benchmark_cpu.py --intent diet_exercise --backends fp32 int8 --max-new-tokens 64
+#   python benchmark_cpu.py --backends int8 --prompt-lookup-tokens 0 10   # prompt-lookup taslaklarıyla/taslaksız
+#
+# Her backend ayrı bir süreçte yüklenir; RSS ölçümleri birbirini etkilemez.
+#
+# Sunucular varsayılan olarak fp32 çalışır (cpu_backend.CPU_BACKEND). int8 daha az bellek
+# ve genelde daha yüksek tok/s verir, ancak nicemleme greedy çıktıyı fp32'den ayırır:
+# "fp32 uyumu" sütunu cevapların ne kadarının aynı kaldığını gösterir. int8'e geçmeden önce
+# bu tabloyu hedef makinede ve gerçek adapter'larla alın, cevapları gözden geçirin; uygunsa
+# sunucuyu CPU_BACKEND=int8 ile başlatın.
+
+BACKENDS = {
+    "diet_exercise": ("diet_exercise_inference", "empamomodeldeneme/inference.py", "DietExerciseModel"),
+    "emotional_support": ("emotional_inference", "empamom_emotional_support/inferance.py", "EmotionalSupportModel")
+}
+
+DEFAULT_PROMPTS = [
+    "I feel exhausted and guilty because I can't enjoy time with my newborn. What can I do?",
+    "What are safe exercises during the second trimester of pregnancy?",
+    "How can I keep my energy up while breastfeeding and sleeping only a few hours a night?"
+]
+
+
+def memory_mb(field="VmRSS"):
+    """Sürecin bellek kullanımı (MB); VmRSS anlık, VmHWM en yüksek değerdir"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def common_prefix(a, b):
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+def _timed_generation(model, module, prompt, max_new_tokens, prompt_lookup_tokens=0):
+    """Greedy üretim; ilk token süresi (prefill dahil) ve sonraki token'ların süresi ayrı ölçülür"""
+    from streaming_decoder import SamplingParams
+
+    formatted_prompt = model.tokenizer.apply_chat_template(module.build_messages(prompt), tokenize=False)
+    inputs = model.tokenizer(formatted_prompt, return_tensors="pt")
+    params = SamplingParams(max_new_tokens=max_new_tokens, do_sample=False,
+                            prompt_lookup_num_tokens=prompt_lookup_tokens)
+
+    token_ids = []
+    start = time.perf_counter()
+    first_token_at = None
+    for token_id in model.decoder.generate_token_ids(inputs["input_ids"], inputs.get("attention_mask"), params):
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        token_ids.append(token_id)
+    end = time.perf_counter()
+
+    first_token_at = first_token_at or end
+    return {
+        "prompt_tokens": inputs["input_ids"].shape[1],
+        "token_ids": token_ids,
+        "first_token_s": first_token_at - start,
+        "decode_s": end - first_token_at
+    }
+
+
+def _run_backend(intent, base_model_id, adapter_path, prompts, max_new_tokens, prompt_lookup_tokens, results):
+    """Alt süreçte modeli CPU_BACKEND ortam değişkeniyle yükler ve ölçer"""
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    import torch
+    from model_registry import load_backend_module
+
+    module_name, relative_path, class_name = BACKENDS[intent]
+    module = load_backend_module(module_name, relative_path)
+    baseline_mb = memory_mb()
+
+    start = time.perf_counter()
+    model = getattr(module, class_name)(base_model_id or module.BASE_MODEL_ID,
+                                        adapter_path or module.DEFAULT_ADAPTER_PATH, "cpu")
+    if not model.load_model():
+        results.put({"error": "model yüklenemedi"})
+        return
+    load_s = time.perf_counter() - start
+    loaded_mb = memory_mb()
+
+    # İlk çağrı (torch.compile için derleme) ölçüme katılmaz
+    start = time.perf_counter()
+    _timed_generation(model, module, prompts[0], 4)
+    warmup_s = time.perf_counter() - start
+
+    runs = [_timed_generation(model, module, prompt, max_new_tokens, prompt_lookup_tokens) for prompt in prompts]
+    results.put({
+        "acceptance": model.decoder.accepted_tokens / max(model.decoder.draft_tokens, 1),
+        "threads": torch.get_num_threads(),
+        "load_s": load_s,
+        "warmup_s": warmup_s,
+        "model_mb": loaded_mb - baseline_mb,
+        "rss_mb": memory_mb(),
+        "peak_mb": memory_mb("VmHWM"),
+        "runs": runs
+    })
+
+
+def run_backend(backend, prompt_lookup_tokens, args):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    # Inference modülleri backend'i ortam değişkeninden okur
+    os.environ["CPU_BACKEND"] = backend
+    process = context.Process(
+        target=_run_backend,
+        args=(args.intent, args.base_model, args.adapter, args.prompts, args.max_new_tokens, prompt_lookup_tokens,
+              results)
+    )
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU inference backend'leri için token/s ve bellek benchmark'ı")
+    parser.add_argument("--intent", choices=sorted(BACKENDS), default="emotional_support")
+    parser.add_argument("--backends", nargs="+", default=["fp32", "int8", "compile"])
+    parser.add_argument("--base-model", default=None, help="Base model (varsayılan: modülün BASE_MODEL_ID'si)")
+    parser.add_argument("--adapter", default=None, help="LoRA adapter dizini (varsayılan: modülün adapter'ı)")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--prompts", nargs="+", default=DEFAULT_PROMPTS)
+    parser.add_argument("--prompt-lookup-tokens", nargs="+", type=int, default=[0],
+                        help="Adım başına prompt-lookup taslak token sayıları (0: kapalı)")
+    args = parser.parse_args()
+
+    results = {}
+    for backend in args.backends:
+        for prompt_lookup_tokens in args.prompt_lookup_tokens:
+            label = f"{backend}+pl{prompt_lookup_tokens}" if prompt_lookup_tokens else backend
+            print(f"⏱️ {label} ölçülüyor...")
+            results[label] = run_backend(backend, prompt_lookup_tokens, args)
+            if "error" in results[label]:
+                print(f"❌ {label}: {results[label]['error']}")
+
+    reference = results.get("fp32")
+    print(f"\n{args.intent}, {len(args.prompts)} prompt, en fazla {args.max_new_tokens} token (greedy)")
+    print(f"{'Backend':<12}{'Yükleme (s)':>12}{'Isınma (s)':>12}{'İlk token (ms)':>16}{'Decode tok/s':>14}"
+          f"{'Model (MB)':>12}{'RSS (MB)':>10}{'Tepe (MB)':>11}{'fp32 uyumu':>12}{'Taslak kabul':>14}")
+    print("-" * 125)
+    for label, result in results.items():
+        if "error" in result:
+            continue
+        runs = result["runs"]
+        first_token_ms = 1000 * sum(run["first_token_s"] for run in runs) / len(runs)
+        decoded = sum(max(len(run["token_ids"]) - 1, 0) for run in runs)
+        decode_s = sum(run["decode_s"] for run in runs)
+        tokens_per_s = decoded / decode_s if decode_s > 0 else 0.0
+
+        # Greedy çıktının fp32 ile aynı kalan kısmının oranı
+        agreement = "-"
+        if reference is not None and "error" not in reference:
+            matched = sum(common_prefix(run["token_ids"], ref["token_ids"]) for run, ref in zip(runs, reference["runs"]))
+            total = sum(max(len(ref["token_ids"]), 1) for ref in reference["runs"])
+            agreement = f"{100 * matched / total:.1f}%"
+
+        acceptance = f"{100 * result['acceptance']:.1f}%" if "+pl" in label else "-"
+        print(f"{label:<12}{result['load_s']:>12.1f}{result['warmup_s']:>12.1f}{first_token_ms:>16.0f}"
+              f"{tokens_per_s:>14.2f}{result['model_mb']:>12.0f}{result['rss_mb']:>10.0f}{result['peak_mb']:>11.0f}"
+              f"{agreement:>12}{acceptance:>14}")
+    threads = next((result["threads"] for result in results.values() if "threads" in result), None)
+    print(f"\nThread sayısı: {threads} (CPU_THREADS ile değiştirilebilir)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional
+
+import numpy as np
+
+# Bir batch'in dolgu dahil toplam token sayısı (batch boyutu x en uzun metin)
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "4096"))
+# Encoder süreç sayısı (0: CPU çekirdeği sayısı, 1: tek süreç)
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))
+# Bir worker'ı başlatmanın (modeli yüklemenin) maliyetine değecek en az metin sayısı
+MIN_TEXTS_PER_WORKER = 512
+MAX_BATCH_SIZE = 512
+
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int):
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+    # Süreçler çekirdekleri paylaşır, her biri kendi payı kadar thread kullanır
+    torch.set_num_threads(threads)
+    _worker_model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode_batch_worker(batch_id: int, texts: List[str], normalize_embeddings: bool):
+    """Worker süreçte tek bir batch'i encode eder (pickle edilebilmesi için modül seviyesinde)"""
+    embeddings = _worker_model.encode(texts, batch_size=len(texts), normalize_embeddings=normalize_embeddings)
+    return batch_id, np.asarray(embeddings, dtype=np.float32)
+
+
+def token_budget_batches(lengths: np.ndarray, max_tokens: int = EMBED_BATCH_TOKENS,
+                         max_batch_size: int = MAX_BATCH_SIZE) -> List[np.ndarray]:
+    """Metinleri uzunluğa göre (uzundan kısaya) sıralayıp token bütçesine göre batch'lere ayırır.
+
+    Her batch'in dolgulu boyutu (metin sayısı x batch'teki en uzun metin)
+    max_tokens'ı aşmaz; kısa metinlerin batch'leri bu yüzden daha kalabalıktır.
+    Batch'ler orijinal pozisyonları içerir.
+    """
+    order = np.argsort(-lengths, kind="stable")
+    batches = []
+    start = 0
+    while start < len(order):
+        longest = max(int(lengths[order[start]]), 1)
+        size = max(1, min(max_batch_size, max_tokens // longest))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+
+class BulkEmbedder:
+    """Toplu embedding işleri için (RAG korpusu, niyet eğitim seti) SentenceTransformer sarmalayıcısı.
+
+    Metinler token uzunluğuna göre sıralanıp sabit sayı yerine token bütçesiyle
+    batch'lenir; böylece her batch benzer uzunluktaki metinlerden oluşur ve
+    dolguya harcanan hesap azalır. CPU'da büyük işler, modeli kendisi yükleyen
+    worker süreçlerine dağıtılır. Sonuç her zaman girdi sırasındadır.
+    """
+
+    def __init__(self, model, model_name: Optional[str] = None, max_tokens: int = EMBED_BATCH_TOKENS,
+                 workers: Optional[int] = None):
+        self.model = model
+        # Worker süreçleri modeli bu adla yükler; verilmezse tek süreçte çalışılır
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        workers = EMBED_WORKERS if workers is None else workers
+        self.workers = workers or os.cpu_count() or 1
+
+    def token_lengths(self, texts: List[str]) -> np.ndarray:
+        """Her metnin encoder'ın göreceği (max_seq_length ile kırpılmış) token sayısı"""
+        tokenizer = getattr(self.model, "tokenizer", None)
+        max_length = getattr(self.model, "max_seq_length", None) or 512
+        if tokenizer is None:
+            return np.array([min(len(text.split()), max_length) for text in texts], dtype=np.int64)
+        encoded = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_length)
+        return np.array([len(ids) for ids in encoded["input_ids"]], dtype=np.int64)
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = False,
+               show_progress_bar: bool = False) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        batches = token_budget_batches(self.token_lengths(texts), self.max_tokens)
+        embeddings = np.zeros((len(texts), self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        workers = self._pool_size(len(texts))
+        if workers <= 1:
+            for positions in self._progress(batches, show_progress_bar):
+                embeddings[positions] = self.model.encode(
+                    [texts[position] for position in positions],
+                    batch_size=len(positions),
+                    normalize_embeddings=normalize_embeddings
+                )
+            return embeddings
+
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        print(f"Embedding: {len(texts)} metin, {len(batches)} batch, {workers} süreç")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(self.model_name, threads)) as executor:
+            futures = [
+                executor.submit(_encode_batch_worker, batch_id, [texts[position] for position in positions],
+                                normalize_embeddings)
+                for batch_id, positions in enumerate(batches)
+            ]
+            for future in self._progress(as_completed(futures), show_progress_bar, total=len(futures)):
+                batch_id, batch_embeddings = future.result()
+                embeddings[batches[batch_id]] = batch_embeddings
+        return embeddings
+
+    def _pool_size(self, n_texts: int) -> int:
+        device = getattr(self.model, "device", None)
+        if self.model_name is None or (device is not None and getattr(device, "type", "cpu") != "cpu"):
+            return 1
+        return min(self.workers, n_texts // MIN_TEXTS_PER_WORKER)
+
+    @staticmethod
+    def _progress(iterable, show_progress_bar: bool, total: Optional[int] = None):
+        if not show_progress_bar:
+            return iterable
+        from tqdm import tqdm
+        return tqdm(iterable, total=total, desc="Batches")
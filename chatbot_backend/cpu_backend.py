@@ -0,0 +1,154 @@
+import gc
+import os
+import ctypes
+
+import torch
+import torch.nn as nn
+import torch.ao.nn.quantized.dynamic as nnqd
+
+# GPU olmayan sunucularda LLM'lerin çalıştırılma biçimi:
+#   fp32    : düz PyTorch (eski davranış)
+#   int8    : Linear katmanlarının ağırlıkları int8'e dinamik nicemlenir, aktivasyonlar fp32 kalır
+#   compile : fp32 model torch.compile ile derlenir (ilk isteklerde derleme süresi ödenir)
+# Varsayılan fp32'dir; int8 çıktıyı değiştirdiği için yalnızca benchmark_cpu.py ile
+# ölçüldükten sonra CPU_BACKEND=int8 ile açılır.
+CPU_BACKENDS = ("fp32", "int8", "compile")
+CPU_BACKEND = os.getenv("CPU_BACKEND", "fp32")
+# Inference thread sayısı (0: PyTorch varsayılanı)
+CPU_THREADS = int(os.getenv("CPU_THREADS", "0"))
+
+_DTYPE_LABELS = {"fp32": "float32", "int8": "int8-dynamic", "compile": "float32-compiled"}
+
+
+def resolve_backend(backend=None):
+    backend = backend or CPU_BACKEND
+    if backend not in CPU_BACKENDS:
+        raise ValueError(f"Geçersiz CPU_BACKEND: {backend} (seçenekler: {', '.join(CPU_BACKENDS)})")
+    return backend
+
+
+def cpu_dtype_label(backend=None):
+    """Model kayıt defteri anahtarında kullanılan dtype adı"""
+    return _DTYPE_LABELS[resolve_backend(backend)]
+
+
+def quantizable_linears(model):
+    """Nicemlenecek nn.Linear modüllerinin adları.
+
+    PEFT'in lora_A/lora_B matrisleri küçüktür ve düşük ranklı güncellemeyi
+    taşıdıkları için fp32 kalır; sarmalanan base_layer nicemlenir.
+    """
+    return {
+        name for name, module in model.named_modules()
+        if isinstance(module, nn.Linear) and not any(part.startswith("lora_") for part in name.split("."))
+    }
+
+
+def quantize_int8(model):
+    """Linear ağırlıklarını yerinde int8'e çevirir (dinamik nicemleme)"""
+    names = quantizable_linears(model)
+    return torch.ao.quantization.quantize_dynamic(model, qconfig_spec=names, dtype=torch.qint8, inplace=True)
+
+
+def is_int8_quantized(model):
+    """Model zaten dinamik int8 nicemlenmiş mi (ör. hazır checkpoint'ten açıldı)"""
+    return any(isinstance(module, nnqd.Linear) for module in model.modules())
+
+
+def int8_state(model):
+    """Nicemlenmiş modelin kaydedilecek durumu.
+
+    state_dict'e girmeyen buffer'lar (ör. RoPE inv_freq) da eklenir; model
+    meta cihazında kurulduğunda bunlar config'ten yeniden hesaplanmaz.
+    """
+    state_dict = model.state_dict()
+    return {
+        "linears": sorted(name for name, module in model.named_modules() if isinstance(module, nnqd.Linear)),
+        "state_dict": state_dict,
+        "buffers": {name: buffer for name, buffer in model.named_buffers() if name not in state_dict}
+    }
+
+
+def load_int8_state(model, state):
+    """int8_state çıktısını meta cihazında kurulmuş modele yükler.
+
+    Linear'lar nicemlenmiş ağırlıklarla değiştirilir, diğer tensörler kopyalanmadan
+    (mmap) atanır; fp32 ağırlıklar hiç oluşturulmaz.
+    """
+    state_dict = dict(state["state_dict"])
+    for name in state["linears"]:
+        linear = model.get_submodule(name)
+        weight, bias = state_dict.pop(f"{name}._packed_params._packed_params")
+        for key in ("scale", "zero_point", "_packed_params.dtype"):
+            state_dict.pop(f"{name}.{key}", None)
+        quantized = nnqd.Linear(linear.in_features, linear.out_features, bias_=bias is not None, dtype=torch.qint8)
+        quantized.set_weight_bias(weight, bias)
+        parent_name, _, child = name.rpartition(".")
+        setattr(model.get_submodule(parent_name), child, quantized)
+
+    assign_tensors(model, {**state_dict, **state["buffers"]})
+    return model
+
+
+def assign_tensors(model, tensors, tie_weights=False):
+    """Tensörleri modelin parametre ve buffer'larına kopyalamadan (ör. mmap'li haliyle) atar.
+
+    Model meta cihazında kurulmuş olmalıdır; eşleşmeyen ya da atanmadan kalan
+    (meta) tensör varsa ValueError fırlatılır. tie_weights: dosyada tek kopyası
+    saklanan bağlı ağırlıklar (ör. lm_head = embed_tokens) yeniden bağlanır.
+    """
+    unexpected = []
+    for name, tensor in tensors.items():
+        parent_name, _, child = name.rpartition(".")
+        module = model.get_submodule(parent_name)
+        if child in module._parameters:
+            module._parameters[child] = nn.Parameter(tensor, requires_grad=False)
+        elif child in module._buffers:
+            module._buffers[child] = tensor
+        else:
+            unexpected.append(name)
+
+    if tie_weights:
+        model.tie_weights()
+    missing = [name for name, tensor in list(model.named_parameters()) + list(model.named_buffers()) if tensor.is_meta]
+    if unexpected or missing:
+        raise ValueError(f"Ağırlıklar modelle uyuşmuyor (fazla: {unexpected[:3]}, eksik: {missing[:3]})")
+    return model
+
+
+def release_freed_memory():
+    """Nicemlemeyle serbest kalan fp32 ağırlık bloklarını işletim sistemine geri verir (glibc)"""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def compile_model(model):
+    """forward'ı değişken dizi uzunlukları için derler; generate ve PEFT sarmalayıcıları aynen çalışır"""
+    model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+
+def optimize_for_cpu(model, backend=None):
+    """Eval modundaki (LoRA'sı merge edilmiş ya da PEFT) modeli seçilen CPU backend'ine hazırlar.
+
+    Önek KV cache'i ve decoder bu fonksiyondan sonra oluşturulmalıdır.
+    """
+    backend = resolve_backend(backend)
+    if CPU_THREADS > 0:
+        torch.set_num_threads(CPU_THREADS)
+
+    if backend == "int8" and is_int8_quantized(model):
+        print(f"⚡ CPU backend: int8, nicemlenmiş checkpoint ({torch.get_num_threads()} thread)")
+    elif backend == "int8":
+        model = quantize_int8(model)
+        release_freed_memory()
+        print(f"⚡ CPU backend: int8 dinamik nicemleme ({torch.get_num_threads()} thread)")
+    elif backend == "compile":
+        model = compile_model(model)
+        print(f"⚡ CPU backend: torch.compile ({torch.get_num_threads()} thread)")
+    else:
+        print(f"📱 CPU backend: fp32 ({torch.get_num_threads()} thread)")
+    return model
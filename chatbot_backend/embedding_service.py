@@ -0,0 +1,98 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EmbeddingService:
+    """SentenceTransformer'ı içerik hash'li LRU önbellekle saran ortak embedding servisi.
+
+    Niyet yönlendirme ve RAG araması aynı MiniLM modelini kullandığından tek
+    örnek paylaşılır; aynı metin için encoder yalnızca bir kez çalışır.
+    encode() SentenceTransformer.encode ile uyumludur (str için tek vektör,
+    liste için matris döndürür); önbellekte olmayan metinler tek batch'te
+    encode edilir.
+    """
+
+    def __init__(self, model, max_entries=4096):
+        self.model = model
+        self.max_entries = max_entries
+        # (içerik hash'i, normalize) -> embedding, en eski kullanılan başta
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, normalize_embeddings=False, **kwargs):
+        """Metinleri embedding'e çevirir, önbellekteki metinler için encoder çalıştırılmaz"""
+        if kwargs.get("convert_to_tensor") or kwargs.get("output_value") not in (None, "sentence_embedding"):
+            # Numpy dışı çıktılar önbelleğe alınmaz
+            return self.model.encode(
+                sentences, batch_size=batch_size, show_progress_bar=show_progress_bar,
+                normalize_embeddings=normalize_embeddings, **kwargs
+            )
+
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        keys = [(_content_hash(text), normalize_embeddings) for text in texts]
+        embeddings = [None] * len(texts)
+        missing = {}
+
+        with self._lock:
+            for position, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    embeddings[position] = cached
+                    self.hits += 1
+                else:
+                    # Aynı çağrıdaki tekrar eden metinler bir kez encode edilir
+                    missing.setdefault(key, []).append(position)
+
+        if missing:
+            missing_keys = list(missing)
+            missing_texts = [texts[missing[key][0]] for key in missing_keys]
+            encoded = np.asarray(self.model.encode(
+                missing_texts, batch_size=batch_size, show_progress_bar=show_progress_bar,
+                normalize_embeddings=normalize_embeddings, **kwargs
+            ), dtype=np.float32)
+
+            with self._lock:
+                for key, embedding in zip(missing_keys, encoded):
+                    # Önbellekteki vektörlerin çağıranlar tarafından değiştirilmesini önle
+                    embedding.setflags(write=False)
+                    self._cache[key] = embedding
+                    self._cache.move_to_end(key)
+                    for position in missing[key]:
+                        embeddings[position] = embedding
+                    self.misses += 1
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+
+        result = np.stack(embeddings)
+        return result[0] if single else result
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._cache),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def __getattr__(self, name):
+        # get_sentence_embedding_dimension, device vb. modele yönlendirilir
+        return getattr(self.model, name)
+
+
+def _content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).digest()
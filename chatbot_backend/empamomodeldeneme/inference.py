@@ -2,22 +2,57 @@ import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
 from peft import PeftModel, PeftConfig
 import os
+import sys
 import time
 import warnings
 
+# Ana dizini Python path'ine ekle (ortak streaming decoder için)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming_decoder import StreamingDecoder, SamplingParams
+from prefix_cache import PrefixKVCache, prompt_prefix
+from model_registry import adapter_version
+from cpu_backend import optimize_for_cpu
+from merged_checkpoint import (find_merged_checkpoint, autosave_merged_checkpoint, load_merged_checkpoint,
+                               load_int8_checkpoint, save_int8_checkpoint)
+
 warnings.filterwarnings("ignore", category=UserWarning)
 warnings.filterwarnings("ignore", category=FutureWarning)
 
+BASE_MODEL_ID = "stabilityai/stablelm-2-zephyr-1_6b"
+DEFAULT_ADAPTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stablelm-2-zephyr-1_6b")
+
+SYSTEM_PROMPT = "You are a registered dietitian and fitness expert. You provide professional diet and exercise advice. IMPORTANT: You must respond ONLY in English. Never use any other language. Provide comprehensive, detailed responses. Always give complete answers with practical advice. Do not use any HTML tags or formatting."
+
+# Kullanıcı mesajı yerine konup chat template'in sabit önekini bulmak için kullanılır
+PROMPT_SENTINEL = "<<user_message>>"
+
+
+def build_messages(prompt):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
 class DietExerciseModel:
-    def __init__(self):
+    def __init__(self, base_model_id=BASE_MODEL_ID, adapter_path=DEFAULT_ADAPTER_PATH, device=None):
         """Model sınıfını başlatır ama henüz yüklemez"""
         self.model = None
         self.tokenizer = None
         self.base_model = None
+        self.decoder = None
         self.is_loaded = False
-        self.device = "cpu"
+        self.base_model_id = base_model_id
+        self.adapter_path = adapter_path
+        # Cihaz verilmişse (ör. model kayıt defterinden) otomatik seçim yapılmaz
+        self.forced_device = device
+        self.device = device or "cpu"
         
     def _check_cuda(self):
+        if self.forced_device is not None:
+            self.device = self.forced_device
+            return self.device == "cuda"
         if torch.cuda.is_available():
             print(f"GPU: {torch.cuda.get_device_name(0)}")
             torch.cuda.empty_cache()
@@ -28,6 +63,35 @@ class DietExerciseModel:
             self.device = "cpu"
             return False
     
+    def attach_shared_model(self, model, tokenizer, decoder, device):
+        """Kendi kopyasını yüklemek yerine paylaşılan base model üzerindeki adapter görünümünü kullanır"""
+        self.model = model
+        self.tokenizer = tokenizer
+        self.decoder = decoder
+        self.device = device
+        self.is_loaded = True
+        self.register_prompt_prefix()
+
+    def register_prompt_prefix(self):
+        """Sabit system prompt önekinin KV cache'ini decoder'ın önek önbelleğine kaydeder"""
+        prefix_cache = getattr(self.decoder, "prefix_cache", None)
+        if prefix_cache is None:
+            return
+        formatted_prompt = self.tokenizer.apply_chat_template(build_messages(PROMPT_SENTINEL), tokenize=False)
+        prefix_cache.register(
+            "diet_exercise",
+            prompt_prefix(formatted_prompt, PROMPT_SENTINEL),
+            adapter_name=getattr(self.decoder, "adapter_name", None),
+            version=adapter_version(self.adapter_path)
+        )
+
+    def prefix_past_key_values(self, input_ids, attention_mask=None):
+        """model.generate için kayıtlı önekin KV cache'i (eşleşme yoksa None)"""
+        prefix_cache = getattr(self.decoder, "prefix_cache", None)
+        if prefix_cache is None:
+            return None
+        return prefix_cache.past_key_values_for(input_ids, attention_mask, getattr(self.decoder, "adapter_name", None))
+
     def load_model(self):
         if self.is_loaded:
             return True
@@ -39,8 +103,15 @@ class DietExerciseModel:
             self._check_cuda()
             print(f"📱 Cihaz: {self.device}")
             
-            base_model_id = "stabilityai/stablelm-2-zephyr-1_6b"
+            base_model_id = self.base_model_id
             print(f"📦 Base model: {base_model_id}")
+            # Adapter'ı önceden merge edilmiş checkpoint varsa base model yerine o açılır, PEFT merge atlanır
+            merged_path = find_merged_checkpoint(base_model_id, self.adapter_path)
+            # CPU'da checkpoint kopyalanmadan açılır: CPU_BACKEND=int8 ise nicemlenmiş kopyası
+            # (yeniden nicemleme yapılmaz), değilse fp32 safetensors dosyaları mmap ile
+            cpu_model = load_int8_checkpoint(merged_path) if self.device == "cpu" else None
+            if cpu_model is None and self.device == "cpu" and merged_path is not None:
+                cpu_model = load_merged_checkpoint(merged_path)
             
             quantization_config = None
             if self.device == "cuda":
@@ -55,15 +126,18 @@ class DietExerciseModel:
                 print(f"⚡ CUDA quantization aktif")
             
             print(f"📥 Base model yükleniyor...")
-            self.base_model = AutoModelForCausalLM.from_pretrained(
-                base_model_id,
-                device_map="auto" if self.device == "cuda" else None,
-                quantization_config=quantization_config,
-                trust_remote_code=True,
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                low_cpu_mem_usage=True,
-                offload_folder="offload" if self.device == "cuda" else None
-            )
+            if cpu_model is not None:
+                self.base_model = cpu_model
+            else:
+                self.base_model = AutoModelForCausalLM.from_pretrained(
+                    merged_path or base_model_id,
+                    device_map="auto" if self.device == "cuda" else None,
+                    quantization_config=quantization_config,
+                    trust_remote_code=True,
+                    torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
+                    low_cpu_mem_usage=True,
+                    offload_folder="offload" if self.device == "cuda" else None
+                )
             print(f"✅ Base model yüklendi")
             
             print(f"📝 Tokenizer yükleniyor...")
@@ -76,11 +150,13 @@ class DietExerciseModel:
             self.tokenizer.pad_token = self.tokenizer.eos_token
             print(f"✅ Tokenizer yüklendi")
             
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            peft_model_id = os.path.join(current_dir, "stablelm-2-zephyr-1_6b")
+            peft_model_id = self.adapter_path
             print(f"🔍 PEFT model yolu: {peft_model_id}")
             
-            if not os.path.exists(peft_model_id):
+            if merged_path is not None:
+                print(f"✅ Merge edilmiş checkpoint kullanıldı: {merged_path}")
+                self.model = self.base_model
+            elif not peft_model_id or not os.path.exists(peft_model_id):
                 print(f"⚠️  PEFT model bulunamadı, base model kullanılıyor")
                 self.model = self.base_model
             else:
@@ -95,8 +171,16 @@ class DietExerciseModel:
                 )
                 self.model = self.model.merge_and_unload()
                 print(f"✅ PEFT model yüklendi ve merge edildi")
+                if self.device == "cpu":
+                    # Bu açılışta yazılan checkpoint, int8 kopyası da yanına kaydedilsin diye kullanılır
+                    merged_path = autosave_merged_checkpoint(self.model, base_model_id, peft_model_id) or merged_path
             
             self.model.eval()
+            if self.device == "cpu":
+                self.model = optimize_for_cpu(self.model)
+                save_int8_checkpoint(self.model, merged_path)
+            self.decoder = StreamingDecoder(self.model, self.tokenizer, PrefixKVCache(self.model, self.tokenizer))
+            self.register_prompt_prefix()
             print(f"✅ Model eval moduna alındı")
             
             del self.base_model
@@ -123,49 +207,27 @@ class DietExerciseModel:
                 yield "Model yüklenemedi"
                 return
         
-        messages = [
-            {"role": "system", "content": "You are a registered dietitian and fitness expert. You provide professional diet and exercise advice. IMPORTANT: You must respond ONLY in English. Never use any other language. Provide comprehensive, detailed responses. Always give complete answers with practical advice. Do not use any HTML tags or formatting."},
-            {"role": "user", "content": prompt}
-        ]
+        messages = build_messages(prompt)
         formatted_prompt = self.tokenizer.apply_chat_template(messages, tokenize=False)
         
         inputs = self.tokenizer(formatted_prompt, return_tensors="pt")
-        if self.device == "cuda":
-            inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
         
         input_ids = inputs['input_ids'] if 'input_ids' in inputs else inputs.input_ids
+        attention_mask = inputs.get('attention_mask', None)
 
-        generated_text = ""
-        tokens_generated = 0
-        
-        with torch.no_grad():
-            for _ in range(max_length):
-                outputs = self.model.generate(
-                    input_ids,
-                    max_new_tokens=1,
-                    do_sample=True,
-                    temperature=temperature,
-                    top_p=top_p,
-                    repetition_penalty=1.05,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                    eos_token_id=self.tokenizer.eos_token_id,
-                    use_cache=True
-                )
-                
-                new_token = outputs[0][-1:]
-                
-                if new_token.item() == self.tokenizer.eos_token_id:
-                    break
-                
-                new_text = self.tokenizer.decode(new_token, skip_special_tokens=True)
-                
-                if new_text.strip(): 
-                    generated_text += new_text
-                    tokens_generated += 1
-                    yield new_text
-                
+        # Prompt bir kez işlenir, KV cache adımlar arasında taşınır
+        params = SamplingParams(
+            max_new_tokens=max_length,
+            temperature=temperature,
+            top_p=top_p,
+            repetition_penalty=1.05
+        )
 
-                input_ids = outputs
+        tokens_generated = 0
+        for new_text in self.decoder.stream_text(input_ids, attention_mask, params):
+            if new_text.strip():
+                tokens_generated += 1
+            yield new_text
 
         if tokens_generated == 0:
             yield "I'm sorry, I couldn't generate a response. Please try rephrasing your question."
@@ -176,10 +238,7 @@ class DietExerciseModel:
             if not self.load_model():
                 return "Model yüklenemedi!"
         
-        messages = [
-            {"role": "system", "content": "You are a registered dietitian and fitness expert. You provide professional diet and exercise advice. IMPORTANT: You must respond ONLY in English. Never use any other language. Provide comprehensive, detailed responses. Always give complete answers with practical advice. Do not use any HTML tags or formatting."},
-            {"role": "user", "content": prompt}
-        ]
+        messages = build_messages(prompt)
         formatted_prompt = self.tokenizer.apply_chat_template(messages, tokenize=False)
         
         inputs = self.tokenizer(formatted_prompt, return_tensors="pt")
@@ -196,7 +255,9 @@ class DietExerciseModel:
             "pad_token_id": self.tokenizer.eos_token_id,
             "eos_token_id": self.tokenizer.eos_token_id,
             "repetition_penalty": 1.05,
-            "use_cache": True
+            "use_cache": True,
+            # Sabit system prompt öneki yeniden işlenmez
+            "past_key_values": self.prefix_past_key_values(input_ids, inputs.get("attention_mask"))
         }
         
         with torch.no_grad():
@@ -230,59 +291,35 @@ class DietExerciseModel:
                 return
         
         print(f"🔄 Chat template uygulanıyor...")
-        messages = [
-            {"role": "system", "content": "You are a registered dietitian and fitness expert. You provide professional diet and exercise advice. IMPORTANT: You must respond ONLY in English. Never use any other language. Provide comprehensive, detailed responses. Always give complete answers with practical advice. Do not use any HTML tags or formatting."},
-            {"role": "user", "content": prompt}
-        ]
+        messages = build_messages(prompt)
         formatted_prompt = self.tokenizer.apply_chat_template(messages, tokenize=False)
         print(f"📝 Formatlanmış prompt uzunluğu: {len(formatted_prompt)} karakter")
         
         print(f"🔄 Tokenization yapılıyor...")
         inputs = self.tokenizer(formatted_prompt, return_tensors="pt")
-        if self.device == "cuda":
-            inputs = {k: v.to(self.model.device) for k, v in inputs.items()}
-            print(f"📱 Inputs CUDA'ya taşındı")
         
         input_ids = inputs['input_ids'] if 'input_ids' in inputs else inputs.input_ids
+        attention_mask = inputs.get('attention_mask', None)
         print(f"✅ Tokenization tamamlandı, input shape: {input_ids.shape}")
 
-        generated_text = ""
+        params = SamplingParams(
+            max_new_tokens=max_length,
+            temperature=temperature,
+            top_p=top_p,
+            repetition_penalty=1.05
+        )
+
         tokens_generated = 0
         
         print(f"🔄 Token üretimi başlatılıyor...")
-        with torch.no_grad():
-            for iteration in range(max_length):
-                outputs = self.model.generate(
-                    input_ids,
-                    max_new_tokens=1,
-                    do_sample=True,
-                    temperature=temperature,
-                    top_p=top_p,
-                    repetition_penalty=1.05,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                    eos_token_id=self.tokenizer.eos_token_id,
-                    use_cache=True
-                )
-                
-                new_token = outputs[0][-1:]
-                
-                if new_token.item() == self.tokenizer.eos_token_id:
-                    print(f"✅ EOS token bulundu, üretim durduruluyor")
-                    break
-                
-                new_text = self.tokenizer.decode(new_token, skip_special_tokens=True)
-                
-                if new_text.strip():  
-                    generated_text += new_text
-                    tokens_generated += 1
+        for new_text in self.decoder.stream_text(input_ids, attention_mask, params):
+            if new_text.strip():
+                tokens_generated += 1
+                if tokens_generated % 50 == 0:
+                    print(f"📝 {tokens_generated} token üretildi")
 
-                    for char in new_text:
-                        yield char 
-                
-                input_ids = outputs
-                
-                if iteration % 50 == 0 and iteration > 0:
-                    print(f"📝 {iteration} iterasyon tamamlandı, {tokens_generated} token üretildi")
+            for char in new_text:
+                yield char
 
         if tokens_generated == 0:
             print(f"❌ Hiç token üretilmedi")
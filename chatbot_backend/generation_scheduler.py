@@ -0,0 +1,344 @@
+import queue
+import threading
+
+import torch
+
+from streaming_decoder import (
+    SamplingParams,
+    IncrementalDetokenizer,
+    build_logits_processors,
+    select_next_token,
+    cache_to_layers,
+    layers_to_cache,
+    truncate_at_stop_strings
+)
+
+# Kuyruğa konan "istek bitti" işareti
+_FINISHED = object()
+
+
+class GenerationRequest:
+    """Scheduler'a gönderilmiş tek bir üretim isteği"""
+
+    def __init__(self, prompt_ids, params, adapter_name=None):
+        self.prompt_ids = prompt_ids
+        self.params = params
+        self.adapter_name = adapter_name
+        self.processors = build_logits_processors(params)
+        self.generated_ids = []
+        self.cancelled = False
+        self._outputs = queue.Queue()
+
+    def cancel(self):
+        """İsteği iptal eder; satır bir sonraki adımda batch'ten çıkarılır"""
+        self.cancelled = True
+
+    def iter_token_ids(self):
+        """Üretilen token id'lerini geldikçe döndürür"""
+        while True:
+            item = self._outputs.get()
+            if item is _FINISHED:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def _emit(self, token_id):
+        self.generated_ids.append(token_id)
+        self._outputs.put(token_id)
+
+    def _finish(self, error=None):
+        if error is not None:
+            self._outputs.put(error)
+        self._outputs.put(_FINISHED)
+
+
+class _BatchState:
+    """Devam eden satırların sola dolgulu ortak KV cache'i"""
+
+    def __init__(self):
+        self.requests = []
+        self.sequences = []
+        self.layers = None
+        self.attention_mask = None
+        self.next_tokens = None
+
+    def __len__(self):
+        return len(self.requests)
+
+
+class GenerationScheduler:
+    """Eşzamanlı üretim isteklerini tek bir decode batch'inde birleştiren scheduler.
+
+    Yeni istekler ayrı ayrı prefill edilir ve KV cache'leri sola dolgu ile
+    çalışan batch'e eklenir; her decode adımında tüm satırlar tek forward
+    pass'te ilerler. Her satır kendi örnekleme ayarları ve durdurma koşullarıyla
+    örneklenir; biten satırlar batch'ten hemen çıkarılır. StreamingDecoder ile
+    aynı stream_text arayüzünü sunar.
+
+    multi_adapter=True ile model bir PEFT modelidir ve her satır kendi LoRA
+    adapter'ı ile (adapter_names) aynı forward pass'te çalışır.
+
+    prefix_cache (PrefixKVCache) verilirse kayıtlı sabit önekle başlayan
+    isteklerin prefill'i önekin KV cache'inden devam eder.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=8, idle_timeout=0.05, multi_adapter=False,
+                 prefix_cache=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix_cache = prefix_cache
+        self.max_batch_size = max_batch_size
+        self.multi_adapter = multi_adapter
+        self.idle_timeout = idle_timeout
+        self._pending = queue.Queue()
+        self._batch = _BatchState()
+        self._running = False
+        self._thread = None
+        self._lock = threading.Lock()
+
+        eos_token_id = tokenizer.eos_token_id
+        if isinstance(eos_token_id, (list, tuple)):
+            self.eos_token_ids = set(eos_token_id)
+        else:
+            self.eos_token_ids = {eos_token_id} if eos_token_id is not None else set()
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._loop, name="generation-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, input_ids, attention_mask=None, params=None, adapter_name=None):
+        """İsteği kuyruğa ekler ve GenerationRequest döndürür"""
+        self.start()
+        prompt_ids = input_ids[0]
+        if attention_mask is not None:
+            prompt_ids = prompt_ids[attention_mask[0].bool()]
+        request = GenerationRequest(prompt_ids.tolist(), params or SamplingParams(), adapter_name)
+        self._pending.put(request)
+        return request
+
+    def stream_text(self, input_ids, attention_mask=None, params=None, adapter_name=None):
+        """StreamingDecoder.stream_text ile aynı arayüz; üretim ortak batch'te yapılır"""
+        params = params or SamplingParams()
+        request = self.submit(input_ids, attention_mask, params, adapter_name)
+        try:
+            yield from truncate_at_stop_strings(self._stream_request(request), params.stop_strings)
+        finally:
+            request.cancel()
+
+    def _stream_request(self, request):
+        detokenizer = IncrementalDetokenizer(self.tokenizer)
+        for token_id in request.iter_token_ids():
+            text = detokenizer.push(token_id)
+            if text:
+                yield text
+
+    def stats(self):
+        return {
+            "active_requests": len(self._batch),
+            "pending_requests": self._pending.qsize(),
+            "max_batch_size": self.max_batch_size,
+            "prefix_cache": self.prefix_cache.stats() if self.prefix_cache is not None else None
+        }
+
+    def _loop(self):
+        while self._running:
+            try:
+                self._admit_pending()
+                if len(self._batch) > 0:
+                    self._decode_step()
+            except Exception as e:
+                print(f"❌ Generation scheduler hatası: {e}")
+                self._fail_all(e)
+
+    def _admit_pending(self):
+        """Boş yer varsa bekleyen istekleri prefill edip batch'e ekler"""
+        while len(self._batch) < self.max_batch_size:
+            try:
+                # Batch boşsa yeni istek gelene kadar bekle, doluysa beklemeden devam et
+                timeout = self.idle_timeout if len(self._batch) == 0 else None
+                request = self._pending.get(timeout=timeout) if timeout else self._pending.get_nowait()
+            except queue.Empty:
+                return
+            if request.cancelled:
+                request._finish()
+                continue
+            try:
+                self._prefill(request)
+            except Exception as e:
+                request._finish(e)
+
+    def _model_kwargs(self, requests):
+        if not self.multi_adapter:
+            return {}
+        return {"adapter_names": [request.adapter_name or "__base__" for request in requests]}
+
+    def _prefill(self, request):
+        input_ids = torch.tensor([request.prompt_ids], dtype=torch.long, device=self.device)
+        past_key_values = None
+        step_input = input_ids
+        prefix = self.prefix_cache.match(request.prompt_ids, request.adapter_name) if self.prefix_cache is not None else None
+        if prefix is not None:
+            past_key_values = layers_to_cache(prefix.layers)
+            step_input = input_ids[:, len(prefix):]
+
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=step_input,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=past_key_values,
+                use_cache=True,
+                **self._model_kwargs([request])
+            )
+
+        scores = request.processors(input_ids, outputs.logits[:, -1, :])
+        next_token = select_next_token(scores, request.params)
+        if self._append_token(request, next_token.item()):
+            request._finish()
+            return
+
+        self._merge_into_batch(request, input_ids, cache_to_layers(outputs.past_key_values), next_token)
+
+    def _merge_into_batch(self, request, sequence, layers, next_token):
+        batch = self._batch
+        attention_mask = torch.ones_like(sequence)
+        next_tokens = next_token.view(1, 1)
+
+        if len(batch) == 0:
+            batch.layers = [(keys, values) for keys, values in layers]
+            batch.attention_mask = attention_mask
+            batch.next_tokens = next_tokens
+        else:
+            batch_length = batch.attention_mask.shape[1]
+            new_length = attention_mask.shape[1]
+            target_length = max(batch_length, new_length)
+
+            merged = []
+            for (batch_keys, batch_values), (keys, values) in zip(batch.layers, layers):
+                merged.append((
+                    torch.cat([_left_pad(batch_keys, target_length), _left_pad(keys, target_length)], dim=0),
+                    torch.cat([_left_pad(batch_values, target_length), _left_pad(values, target_length)], dim=0)
+                ))
+            batch.layers = merged
+            batch.attention_mask = torch.cat([
+                _left_pad_mask(batch.attention_mask, target_length),
+                _left_pad_mask(attention_mask, target_length)
+            ], dim=0)
+            batch.next_tokens = torch.cat([batch.next_tokens, next_tokens], dim=0)
+
+        batch.requests.append(request)
+        batch.sequences.append(torch.cat([sequence, next_tokens], dim=-1))
+
+    def _decode_step(self):
+        batch = self._batch
+        batch_size = len(batch)
+
+        attention_mask = torch.cat([batch.attention_mask, batch.attention_mask.new_ones((batch_size, 1))], dim=-1)
+        # Sola dolgu olduğu için pozisyonlar satırın gerçek uzunluğundan hesaplanır
+        position_ids = batch.attention_mask.sum(dim=-1, keepdim=True)
+
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=batch.next_tokens,
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+                past_key_values=layers_to_cache(batch.layers),
+                use_cache=True,
+                **self._model_kwargs(batch.requests)
+            )
+
+        batch.layers = cache_to_layers(outputs.past_key_values)
+        batch.attention_mask = attention_mask
+
+        next_tokens = []
+        keep_rows = []
+        for row, request in enumerate(batch.requests):
+            if request.cancelled:
+                request._finish()
+                next_tokens.append(0)
+                continue
+
+            scores = request.processors(batch.sequences[row], outputs.logits[row:row + 1, -1, :])
+            token_id = select_next_token(scores, request.params).item()
+            next_tokens.append(token_id)
+
+            if self._append_token(request, token_id):
+                request._finish()
+                continue
+
+            batch.sequences[row] = torch.cat(
+                [batch.sequences[row], batch.sequences[row].new_tensor([[token_id]])], dim=-1
+            )
+            keep_rows.append(row)
+
+        batch.next_tokens = torch.tensor(next_tokens, dtype=torch.long, device=self.device).view(-1, 1)
+        if len(keep_rows) < batch_size:
+            self._keep_rows(keep_rows)
+
+    def _append_token(self, request, token_id):
+        """Token'ı isteğe iletir; istek bittiyse True döndürür"""
+        if request.cancelled or token_id in self.eos_token_ids:
+            return True
+        request._emit(token_id)
+        return len(request.generated_ids) >= request.params.max_new_tokens
+
+    def _keep_rows(self, rows):
+        """Biten satırları batch'ten çıkarır ve tamamen dolgu olan sütunları kırpar"""
+        batch = self._batch
+        batch.requests = [batch.requests[row] for row in rows]
+        batch.sequences = [batch.sequences[row] for row in rows]
+        if not rows:
+            batch.layers = None
+            batch.attention_mask = None
+            batch.next_tokens = None
+            return
+
+        index = torch.tensor(rows, dtype=torch.long, device=batch.attention_mask.device)
+        attention_mask = batch.attention_mask.index_select(0, index)
+        # Kalan satırların hiçbirinin kullanmadığı soldaki dolgu sütunları
+        first_column = int((attention_mask.cumsum(dim=-1) == 0).sum(dim=-1).min().item())
+
+        batch.attention_mask = attention_mask[:, first_column:]
+        batch.next_tokens = batch.next_tokens.index_select(0, index.to(batch.next_tokens.device))
+        batch.layers = [
+            (
+                keys.index_select(0, index.to(keys.device))[:, :, first_column:],
+                values.index_select(0, index.to(values.device))[:, :, first_column:]
+            )
+            for keys, values in batch.layers
+        ]
+
+    def _fail_all(self, error):
+        for request in self._batch.requests:
+            request._finish(error)
+        self._batch = _BatchState()
+
+
+def _left_pad(tensor, target_length):
+    """[batch, heads, seq, dim] tensörünü seq boyutunda sola sıfırla doldurur"""
+    pad = target_length - tensor.shape[2]
+    if pad <= 0:
+        return tensor
+    zeros = tensor.new_zeros((tensor.shape[0], tensor.shape[1], pad, tensor.shape[3]))
+    return torch.cat([zeros, tensor], dim=2)
+
+
+def _left_pad_mask(mask, target_length):
+    pad = target_length - mask.shape[1]
+    if pad <= 0:
+        return mask
+    return torch.cat([mask.new_zeros((mask.shape[0], pad)), mask], dim=1)
@@ -0,0 +1,144 @@
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+
+# Kayıtlı hızlı niyet sınıflandırıcısı
+HEAD_FILENAME = "intent_head.npz"
+
+
+class IdentityScaler:
+    """Scaler'ı head'e katlanmış modeller için predict_intent uyumlu boş scaler"""
+
+    def transform(self, X):
+        return X
+
+
+class LinearIntentHead:
+    """Embedding'ler üzerinde tek matris çarpımıyla çalışan niyet sınıflandırıcısı.
+
+    logits = (x / ||x|| ise) x @ W.T + b, olasılıklar = softmax(logits / temperature).
+    StandardScaler W ve b'ye katlanmıştır; SVC gibi predict_proba ve classes_
+    sunar, böylece predict_intent sözleşmesi değişmez.
+
+    kind:
+        "logistic": scaler + lojistik regresyon (ham embedding üzerinde)
+        "centroid": L2 normalize embedding ile sınıf merkezlerine kosinüs benzerliği
+    """
+
+    def __init__(self, weights, bias, classes, kind="logistic", temperature=1.0):
+        self.weights = np.ascontiguousarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.classes_ = np.asarray(classes)
+        self.kind = kind
+        self.temperature = float(temperature)
+        self.normalize = kind == "centroid"
+
+    def decision_function(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        if self.normalize:
+            X = X / np.maximum(np.linalg.norm(X, axis=1, keepdims=True), 1e-12)
+        return X @ self.weights.T + self.bias
+
+    def predict_proba(self, X):
+        # SVC.predict_proba gibi float64 döner (güven skorları JSON'a doğrudan yazılır)
+        return _softmax(self.decision_function(X).astype(np.float64) / self.temperature)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.decision_function(X), axis=1)]
+
+    def save(self, path):
+        np.savez(
+            path,
+            weights=self.weights,
+            bias=self.bias,
+            classes=self.classes_.astype(str),
+            kind=np.array(self.kind),
+            temperature=np.array(self.temperature, dtype=np.float32)
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["weights"],
+                data["bias"],
+                data["classes"],
+                kind=str(data["kind"]),
+                temperature=float(data["temperature"])
+            )
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def fit_logistic_head(X_train, y_train, C=1.0):
+    """Scaler + lojistik regresyonu eğitip tek lineer katmana katlar"""
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X_train)
+
+    classifier = LogisticRegression(C=C, max_iter=2000, class_weight='balanced')
+    classifier.fit(X_scaled, y_train)
+
+    # (x - mean) / scale @ W.T + b  ==  x @ (W / scale).T + (b - W @ (mean / scale))
+    weights = classifier.coef_ / scaler.scale_
+    bias = classifier.intercept_ - classifier.coef_ @ (scaler.mean_ / scaler.scale_)
+
+    # İki sınıflı durumda sklearn tek satır döndürür
+    if weights.shape[0] == 1:
+        weights = np.vstack([-weights, weights]) / 2
+        bias = np.concatenate([-bias, bias]) / 2
+
+    return LinearIntentHead(weights, bias, classifier.classes_, kind="logistic")
+
+
+def fit_centroid_head(X_train, y_train):
+    """Her sınıfın normalize embedding merkezini hesaplar (kosinüs benzerliği)"""
+    X_train = np.asarray(X_train, dtype=np.float32)
+    X_norm = X_train / np.maximum(np.linalg.norm(X_train, axis=1, keepdims=True), 1e-12)
+    y_train = np.asarray(y_train)
+
+    classes = np.unique(y_train)
+    centroids = np.stack([X_norm[y_train == label].mean(axis=0) for label in classes])
+    centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+    return LinearIntentHead(centroids, np.zeros(len(classes)), classes, kind="centroid", temperature=0.05)
+
+
+def calibrate_temperature(head, X_val, y_val, temperatures=None):
+    """Doğrulama setinde log-loss'u en küçük yapan sıcaklığı seçer.
+
+    Güven skoru 0.6 eşiğiyle karşılaştırıldığı için olasılıkların kalibre
+    olması gerekir; sıcaklık sınıf sırasını değiştirmez.
+    """
+    if temperatures is None:
+        temperatures = np.geomspace(0.005, 5.0, 60)
+
+    logits = head.decision_function(X_val)
+    label_index = {label: i for i, label in enumerate(head.classes_)}
+    targets = np.array([label_index[label] for label in y_val])
+
+    best_temperature, best_loss = head.temperature, np.inf
+    for temperature in temperatures:
+        probs = _softmax(logits / temperature)
+        loss = -np.mean(np.log(np.maximum(probs[np.arange(len(targets)), targets], 1e-12)))
+        if loss < best_loss:
+            best_temperature, best_loss = temperature, loss
+
+    head.temperature = float(best_temperature)
+    return head
+
+
+def fit_intent_head(X_train, y_train, X_val, y_val, kind="logistic"):
+    """İstenen türde head'i eğitir ve sıcaklığını doğrulama setinde kalibre eder"""
+    if kind == "logistic":
+        head = fit_logistic_head(X_train, y_train)
+    elif kind == "centroid":
+        head = fit_centroid_head(X_train, y_train)
+    else:
+        raise ValueError(f"Bilinmeyen head türü: {kind}")
+    return calibrate_temperature(head, X_val, y_val)
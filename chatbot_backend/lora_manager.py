@@ -0,0 +1,148 @@
+import time
+import threading
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
+from peft import PeftModel
+
+from streaming_decoder import StreamingDecoder
+from prefix_cache import PrefixKVCache
+from cpu_backend import optimize_for_cpu
+
+# PEFT'in adapter_names içinde "adapter uygulanmasın" anlamına gelen özel adı
+BASE_ADAPTER = "__base__"
+
+
+class AdapterView:
+    """Paylaşılan PEFT modelinin tek bir adapter'a bağlı görünümü.
+
+    forward ve generate çağrılarına satır başına adapter_names ekler; böylece
+    aynı base model farklı isteklerde farklı adapter'larla, set_adapter
+    çağrısı ve kilit gerekmeden kullanılabilir.
+    """
+
+    def __init__(self, peft_model, adapter_name):
+        self.peft_model = peft_model
+        self.adapter_name = adapter_name
+
+    def _adapter_names(self, args, kwargs):
+        input_ids = kwargs.get("input_ids", args[0] if args else None)
+        batch_size = input_ids.shape[0] if input_ids is not None else 1
+        return [self.adapter_name] * batch_size
+
+    def __call__(self, *args, **kwargs):
+        kwargs["adapter_names"] = self._adapter_names(args, kwargs)
+        return self.peft_model(*args, **kwargs)
+
+    def generate(self, *args, **kwargs):
+        kwargs["adapter_names"] = self._adapter_names(args, kwargs)
+        return self.peft_model.generate(*args, **kwargs)
+
+    def eval(self):
+        self.peft_model.eval()
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self.peft_model, name)
+
+
+class AdapterDecoder:
+    """Ortak GenerationScheduler'a isteği kendi adapter adıyla gönderen decoder"""
+
+    def __init__(self, scheduler, adapter_name):
+        self.scheduler = scheduler
+        self.adapter_name = adapter_name
+
+    @property
+    def prefix_cache(self):
+        return self.scheduler.prefix_cache
+
+    def stream_text(self, input_ids, attention_mask=None, params=None):
+        return self.scheduler.stream_text(input_ids, attention_mask, params, adapter_name=self.adapter_name)
+
+
+class MultiLoRAModel:
+    """Tek bir StableLM base modelini bellekte tutup LoRA adapter'larını istek başına uygular.
+
+    Adapter'lar merge edilmez; her istek (ya da batch satırı) adapter_names ile
+    kendi adapter'ını seçer, BASE_ADAPTER adapter'sız base modeli kullanır.
+    """
+
+    def __init__(self, base_model_id, adapters, device="cpu"):
+        self.base_model_id = base_model_id
+        # {adapter_adı: adapter_yolu}
+        self.adapters = dict(adapters)
+        self.device = device
+        self.peft_model = None
+        self.tokenizer = None
+        self.scheduler = None
+        # Tüm adapter'ların sabit prompt önekleri (adapter adıyla anahtarlanır)
+        self.prefix_cache = None
+        self.is_loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self.is_loaded:
+                return True
+
+            start_time = time.time()
+            print(f"🔄 Paylaşılan base model yükleniyor: {self.base_model_id} ({len(self.adapters)} adapter)")
+
+            quantization_config = None
+            if self.device == "cuda":
+                quantization_config = BitsAndBytesConfig(
+                    load_in_4bit=True,
+                    bnb_4bit_compute_dtype=torch.float16,
+                    bnb_4bit_use_double_quant=True,
+                    bnb_4bit_quant_type="nf4"
+                )
+
+            base_model = AutoModelForCausalLM.from_pretrained(
+                self.base_model_id,
+                device_map="auto" if self.device == "cuda" else None,
+                quantization_config=quantization_config,
+                trust_remote_code=True,
+                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
+                low_cpu_mem_usage=True
+            )
+
+            self.tokenizer = AutoTokenizer.from_pretrained(
+                self.base_model_id,
+                trust_remote_code=True,
+                use_fast=True,
+                model_max_length=2048
+            )
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+            peft_model = None
+            for adapter_name, adapter_path in self.adapters.items():
+                print(f"📥 Adapter yükleniyor: {adapter_name} ({adapter_path})")
+                if peft_model is None:
+                    peft_model = PeftModel.from_pretrained(base_model, adapter_path, adapter_name=adapter_name)
+                else:
+                    peft_model.load_adapter(adapter_path, adapter_name=adapter_name)
+
+            if peft_model is None:
+                raise ValueError("En az bir LoRA adapter gerekli")
+
+            peft_model.eval()
+            if self.device == "cpu":
+                peft_model = optimize_for_cpu(peft_model)
+            self.peft_model = peft_model
+            self.prefix_cache = PrefixKVCache(peft_model, self.tokenizer, multi_adapter=True)
+            self.is_loaded = True
+            print(f"✅ Paylaşılan base model hazır! Süre: {time.time() - start_time:.2f} saniye")
+            return True
+
+    def view(self, adapter_name):
+        """Adapter'a bağlı model görünümünü döndürür (BASE_ADAPTER: adapter'sız)"""
+        if adapter_name != BASE_ADAPTER and adapter_name not in self.adapters:
+            raise KeyError(f"Bilinmeyen adapter: {adapter_name}")
+        return AdapterView(self.peft_model, adapter_name)
+
+    def decoder_for(self, adapter_name):
+        """Adapter için token üreticisi döndürür; scheduler varsa tüm adapter'lar aynı batch'i paylaşır"""
+        if self.scheduler is not None:
+            return AdapterDecoder(self.scheduler, adapter_name)
+        return StreamingDecoder(self.view(adapter_name), self.tokenizer, self.prefix_cache, adapter_name)
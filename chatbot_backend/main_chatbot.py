@@ -1,7 +1,6 @@
 import sys
 import os
 import subprocess
-import importlib.util
 from pathlib import Path
 import torch
 
@@ -25,6 +24,12 @@ def check_cuda_availability():
 # Sentence transformer intent modülünü import et
 from sentence_transformer_intent import load_models, predict_intent
 
+# Niyet yönlendirme ve RAG'in paylaştığı önbellekli embedding servisi
+from embedding_service import EmbeddingService
+
+# Modelleri süreç boyunca bir kez yükleyen kayıt defteri
+from model_registry import registry, load_backend_module, ModelKey, resolve_device
+
 class MainChatbot:
     def __init__(self):
         """Ana chatbot sınıfını başlatır"""
@@ -45,6 +50,9 @@ class MainChatbot:
         
         print(" Niyet tanıma modelleri yüklendi!")
         
+        # RAG araması aynı encoder'ı ve önbelleği kullanır
+        self.sentence_model = EmbeddingService(self.sentence_model)
+        
         # Modül yollarını tanımla
         self.modules = {
             "nutrition": {
@@ -113,15 +121,15 @@ class MainChatbot:
         
         try:
             # RAG sistemini import et
-            spec = importlib.util.spec_from_file_location(
-                "rag_system", 
-                "rag_info/rag_system.py"
-            )
-            rag_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(rag_module)
+            # Modül bir kez import edilir, model singleton'ı korunur
+            rag_module = load_backend_module("rag_system", "rag_info/rag_system.py")
             
-            # RAG sistemini başlat ve streaming yanıt üret
-            rag_system = rag_module.RAGSystem()
+            # RAG sistemini bir kez başlat, sonraki sorularda tekrar kullan
+            device = resolve_device()
+            key = ModelKey("stabilityai/stablelm-2-zephyr-1_6b", None, device, "float16")
+            rag_system = registry.get_or_load(key, lambda key: rag_module.RAGSystem(
+                llm_model_path=key.model_id, embedding_model=self.sentence_model
+            ))
             
             print(" RAG Yanıtı:")
             print("💬 ", end="", flush=True)
@@ -131,8 +139,8 @@ class MainChatbot:
             response_text = ""
             
             # Benzer chunk'ları ara
-            similar_chunks = rag_system.search_similar_chunks(user_message, top_k=5)
-            context = rag_system.create_context(similar_chunks)
+            similar_chunks = rag_system.retrieve(user_message, top_k=5)
+            context = rag_system.create_context(similar_chunks, user_message)
             
             # Streaming yanıt üret
             for token in rag_system.generate_response_streaming(user_message, context):
@@ -156,12 +164,8 @@ class MainChatbot:
         
         try:
             # Inference modülünü import et
-            spec = importlib.util.spec_from_file_location(
-                "inference", 
-                "empamomodeldeneme/inference.py"
-            )
-            inference_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(inference_module)
+            # Modül bir kez import edilir, model singleton'ı korunur
+            inference_module = load_backend_module("diet_exercise_inference", "empamomodeldeneme/inference.py")
             
             # Inference.py'nin kendi fonksiyonunu kullan
             if hasattr(inference_module, 'generate_single_response'):
@@ -201,12 +205,8 @@ class MainChatbot:
         
         try:
             # Emotional support modülünü import et
-            spec = importlib.util.spec_from_file_location(
-                "emotional_inference", 
-                "empamom_emotional_support/inferance.py"
-            )
-            emotional_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(emotional_module)
+            # Modül bir kez import edilir, model singleton'ı korunur
+            emotional_module = load_backend_module("emotional_inference", "empamom_emotional_support/inferance.py")
             
             # Emotional support modülünün kendi fonksiyonunu kullan
             if hasattr(emotional_module, 'generate_single_response'):
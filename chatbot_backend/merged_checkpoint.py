@@ -0,0 +1,371 @@
+import os
+import re
+import sys
+import json
+import shutil
+import struct
+import hashlib
+import argparse
+from datetime import datetime
+
+import torch
+
+from cpu_backend import (resolve_backend, quantize_int8, is_int8_quantized, int8_state, load_int8_state,
+                         assign_tensors)
+
+# LoRA'sı base modele önceden merge edilmiş checkpoint'lerin dizini.
+# Her checkpoint base model revizyonu + adapter içeriği + dtype ile anahtarlanır;
+# CPU'daki süreçler açılışta PEFT merge yerine bu safetensors dosyalarını kopyalamadan
+# mmap ile açar (load_merged_checkpoint); sayfalar ilk erişimde okunur ve süreçler arasında paylaşılır.
+# CPU_BACKEND=int8 sunucular ise yanındaki nicemlenmiş kopyayı açar; ağırlıklar her açılışta yeniden nicemlenmez.
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+MERGED_DIR = os.getenv("MERGED_CHECKPOINT_DIR", os.path.join(BACKEND_DIR, "merged_models"))
+# 0: her zaman base model + PEFT merge kullanılır
+USE_MERGED_CHECKPOINTS = os.getenv("USE_MERGED_CHECKPOINTS", "1") == "1"
+# 1: checkpoint yoksa açılışta yapılan merge'ün sonucu kaydedilir (sonraki açılışlar hızlanır)
+MERGED_CHECKPOINT_AUTOSAVE = os.getenv("MERGED_CHECKPOINT_AUTOSAVE", "0") == "1"
+INFO_FILE = "merge_info.json"
+# int8 backend'i için nicemlenmiş kopya; paketlenmiş ağırlık biçimi torch sürümüne bağlı olduğundan ada eklenir
+INT8_FILE_PREFIX = "int8_state-torch"
+
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8, "U8": torch.uint8,
+    "BOOL": torch.bool
+}
+
+# Build komutunun merge ettiği adapter'lar (api_chatbot'taki üretim backend'leri)
+ADAPTERS = {
+    "diet_exercise": ("diet_exercise_inference", "empamomodeldeneme/inference.py"),
+    "emotional_support": ("emotional_inference", "empamom_emotional_support/inferance.py")
+}
+
+
+def _hash_file(hasher, path):
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+
+
+def adapter_hash(adapter_path):
+    """Adapter config ve ağırlık dosyalarının içerik özeti (mtime'dan bağımsız)"""
+    hasher = hashlib.sha256()
+    for name in sorted(os.listdir(adapter_path)):
+        if name == "adapter_config.json" or name.startswith("adapter_model."):
+            hasher.update(name.encode("utf-8"))
+            _hash_file(hasher, os.path.join(adapter_path, name))
+    return hasher.hexdigest()
+
+
+def base_revision(base_model_id):
+    """Base modelin revizyonu: Hub modelleri için önbellekteki commit, yerel dizinler için dosya özeti.
+
+    Model henüz indirilmemişse None döner (ağa çıkılmaz).
+    """
+    if os.path.isdir(base_model_id):
+        hasher = hashlib.sha256()
+        for name in sorted(os.listdir(base_model_id)):
+            path = os.path.join(base_model_id, name)
+            if name == "config.json":
+                _hash_file(hasher, path)
+            elif name.endswith((".safetensors", ".bin")):
+                stat = os.stat(path)
+                hasher.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        return "local-" + hasher.hexdigest()[:16]
+
+    from huggingface_hub import try_to_load_from_cache
+    config_path = try_to_load_from_cache(base_model_id, "config.json")
+    if not isinstance(config_path, str):
+        return None
+    # .../snapshots/<commit>/config.json
+    return os.path.basename(os.path.dirname(config_path))
+
+
+def checkpoint_name(adapter_path):
+    """Adapter yolundan okunabilir dizin adı (backend dizini + adapter adı)"""
+    adapter_path = os.path.abspath(adapter_path)
+    if adapter_path.startswith(BACKEND_DIR + os.sep):
+        adapter_path = os.path.relpath(adapter_path, BACKEND_DIR)
+    else:
+        adapter_path = os.path.basename(adapter_path)
+    return adapter_path.replace(os.sep, "__")
+
+
+def checkpoint_key(base_model_id, adapter_path, dtype=torch.float32):
+    """(base revizyonu, adapter özeti, dtype) anahtarı; base revizyonu bilinmiyorsa None"""
+    revision = base_revision(base_model_id)
+    if revision is None:
+        return None
+    key = f"{base_model_id}|{revision}|{adapter_hash(adapter_path)}|{str(dtype).replace('torch.', '')}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def checkpoint_dir(base_model_id, adapter_path, dtype=torch.float32, merged_dir=MERGED_DIR):
+    key = checkpoint_key(base_model_id, adapter_path, dtype)
+    if key is None:
+        return None
+    return os.path.join(merged_dir, f"{checkpoint_name(adapter_path)}-{key}")
+
+
+def find_merged_checkpoint(base_model_id, adapter_path, dtype=torch.float32, merged_dir=MERGED_DIR):
+    """Güncel merge edilmiş checkpoint'in dizini; yoksa, devre dışıysa ya da adapter yoksa None"""
+    if not USE_MERGED_CHECKPOINTS or not adapter_path or not os.path.isdir(adapter_path):
+        return None
+    try:
+        path = checkpoint_dir(base_model_id, adapter_path, dtype, merged_dir)
+    except OSError as e:
+        print(f"⚠️ Merge edilmiş checkpoint anahtarı hesaplanamadı: {e}")
+        return None
+    if path is None:
+        # Hub modeli yerel önbellekte değil; her açılışta merge yapılacağı için sessizce geçilmez
+        print(f"⚠️ Base model revizyonu bulunamadı ({base_model_id} önbellekte yok), "
+              f"merge edilmiş checkpoint kullanılamıyor")
+        return None
+    # Dizin yalnızca tamamen yazıldıktan sonra yerine taşınır; bilgi dosyası tamlığın işaretidir
+    if not os.path.exists(os.path.join(path, INFO_FILE)):
+        return None
+    return path
+
+
+def save_merged_checkpoint(model, base_model_id, adapter_path, merged_dir=MERGED_DIR):
+    """Merge edilmiş modeli safetensors olarak kaydeder ve adapter'ın eski checkpoint'lerini siler.
+
+    Önce geçici dizine yazılır, sonra tek rename ile yerine taşınır; aynı anda
+    kaydeden süreçlerden yalnızca biri kazanır, yarım dizin hiç okunmaz.
+    """
+    dtype = next(model.parameters()).dtype
+    path = checkpoint_dir(base_model_id, adapter_path, dtype, merged_dir)
+    if path is None:
+        raise ValueError(f"Base model revizyonu bulunamadı: {base_model_id}")
+    if os.path.exists(os.path.join(path, INFO_FILE)):
+        return path
+
+    os.makedirs(merged_dir, exist_ok=True)
+    staging = os.path.join(merged_dir, f".staging-{os.path.basename(path)}-{os.getpid()}")
+    shutil.rmtree(staging, ignore_errors=True)
+    model.save_pretrained(staging, safe_serialization=True)
+    with open(os.path.join(staging, INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "base_model_id": base_model_id,
+            "base_revision": base_revision(base_model_id),
+            "adapter_path": os.path.abspath(adapter_path),
+            "adapter_sha256": adapter_hash(adapter_path),
+            "dtype": str(dtype).replace("torch.", ""),
+            "created_at": datetime.now().isoformat()
+        }, f, ensure_ascii=False, indent=2)
+
+    try:
+        os.rename(staging, path)
+    except OSError:
+        # Başka bir süreç aynı checkpoint'i önce yerine taşıdı
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.exists(os.path.join(path, INFO_FILE)):
+            raise
+    prune_checkpoints(adapter_path, keep=os.path.basename(path), merged_dir=merged_dir)
+    print(f"💾 Merge edilmiş checkpoint kaydedildi: {path}")
+    return path
+
+
+def autosave_merged_checkpoint(model, base_model_id, adapter_path):
+    """MERGED_CHECKPOINT_AUTOSAVE açıksa açılışta merge edilen modeli kaydeder; hata yüklemeyi durdurmaz"""
+    if not (MERGED_CHECKPOINT_AUTOSAVE and USE_MERGED_CHECKPOINTS):
+        return None
+    try:
+        return save_merged_checkpoint(model, base_model_id, adapter_path)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Merge edilmiş checkpoint kaydedilemedi: {e}")
+        return None
+
+
+def mmap_safetensors(file_path):
+    """safetensors dosyasındaki tensörleri dosyayı eşleyen tensörler olarak döndürür (kopya yok).
+
+    Dosya salt okunur anlamda eşlenir (MAP_PRIVATE); tensörlere yazılırsa değişiklik diske gitmez.
+    """
+    with open(file_path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    storage = torch.UntypedStorage.from_file(file_path, shared=False, nbytes=os.path.getsize(file_path))
+
+    tensors = {}
+    for name, entry in header.items():
+        if name == "__metadata__":
+            continue
+        tensor = torch.empty(0, dtype=_SAFETENSORS_DTYPES[entry["dtype"]])
+        offset = 8 + header_size + entry["data_offsets"][0]
+        if offset % tensor.element_size():
+            raise ValueError(f"{file_path}: {name} hizalı değil")
+        tensors[name] = tensor.set_(storage, offset // tensor.element_size(), entry["shape"])
+    return tensors
+
+
+def load_merged_checkpoint(path):
+    """Merge edilmiş fp32 checkpoint'i ağırlıkları kopyalamadan açar.
+
+    Parametreler meta cihazında kurulup mmap'li tensörlerle değiştirilir; buffer'lar
+    (ör. RoPE) config'ten normal şekilde hesaplanır. Açılamazsa None döner ve
+    çağıran from_pretrained'e döner.
+    """
+    from accelerate import init_empty_weights
+    from transformers import AutoConfig, AutoModelForCausalLM, GenerationConfig
+
+    try:
+        tensors = {}
+        for name in sorted(os.listdir(path)):
+            if name.endswith(".safetensors"):
+                tensors.update(mmap_safetensors(os.path.join(path, name)))
+        if any(tensor.dtype != torch.float32 for tensor in tensors.values() if tensor.is_floating_point()):
+            raise ValueError("checkpoint float32 değil")
+
+        config = AutoConfig.from_pretrained(path, trust_remote_code=True)
+        with init_empty_weights(include_buffers=False):
+            model = AutoModelForCausalLM.from_config(config, trust_remote_code=True, torch_dtype=torch.float32)
+        model = assign_tensors(model, tensors, tie_weights=True)
+        if os.path.exists(os.path.join(path, "generation_config.json")):
+            model.generation_config = GenerationConfig.from_pretrained(path)
+    except (OSError, RuntimeError, ValueError, KeyError) as e:
+        print(f"⚠️ Merge edilmiş checkpoint mmap ile açılamadı, from_pretrained kullanılacak: {e}")
+        return None
+    return model.eval()
+
+
+def int8_state_file(path):
+    return os.path.join(path, f"{INT8_FILE_PREFIX}{torch.__version__}.pt")
+
+
+def save_int8_checkpoint(model, path, backend=None):
+    """int8 backend'inde nicemlenmiş modeli checkpoint dizinine kaydeder.
+
+    Sonraki açılışlar fp32 ağırlıkları okuyup yeniden nicemlemek yerine bu dosyayı
+    açar. Başka torch sürümleriyle yazılmış kopyalar silinir; hata yüklemeyi durdurmaz.
+    """
+    if path is None or resolve_backend(backend) != "int8" or not is_int8_quantized(model):
+        return None
+    state_file = int8_state_file(path)
+    if os.path.exists(state_file):
+        return state_file
+
+    staging = f"{state_file}.{os.getpid()}.tmp"
+    try:
+        torch.save(int8_state(model), staging)
+        os.replace(staging, state_file)
+    except OSError as e:
+        print(f"⚠️ int8 checkpoint kaydedilemedi: {e}")
+        if os.path.exists(staging):
+            os.remove(staging)
+        return None
+    for name in os.listdir(path):
+        if name.startswith(INT8_FILE_PREFIX) and os.path.join(path, name) != state_file:
+            os.remove(os.path.join(path, name))
+    print(f"💾 int8 checkpoint kaydedildi: {state_file}")
+    return state_file
+
+
+def load_int8_checkpoint(path, backend=None):
+    """Merge edilmiş checkpoint'in nicemlenmiş kopyasını açar; backend int8 değilse ya da kopya yoksa None"""
+    if path is None or resolve_backend(backend) != "int8" or not os.path.exists(int8_state_file(path)):
+        return None
+    from transformers import AutoConfig, AutoModelForCausalLM, GenerationConfig
+
+    try:
+        state = torch.load(int8_state_file(path), mmap=True, weights_only=True)
+        config = AutoConfig.from_pretrained(path, trust_remote_code=True)
+        # Model meta cihazında kurulur; fp32 ağırlıklar için bellek ayrılmaz
+        with torch.device("meta"):
+            model = AutoModelForCausalLM.from_config(config, trust_remote_code=True, torch_dtype=torch.float32)
+        model = load_int8_state(model, state)
+        if os.path.exists(os.path.join(path, "generation_config.json")):
+            model.generation_config = GenerationConfig.from_pretrained(path)
+    except (OSError, RuntimeError, ValueError, KeyError) as e:
+        print(f"⚠️ int8 checkpoint açılamadı, yeniden nicemlenecek: {e}")
+        return None
+    print(f"✅ int8 checkpoint kullanıldı: {int8_state_file(path)}")
+    return model.eval()
+
+
+def read_merge_info(path):
+    try:
+        with open(os.path.join(path, INFO_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def prune_checkpoints(adapter_path, keep, merged_dir=MERGED_DIR):
+    """Adapter'ın aynı dtype'taki güncel olmayan (eski base/adapter sürümlü) checkpoint'lerini siler"""
+    pattern = re.compile(re.escape(checkpoint_name(adapter_path)) + "-[0-9a-f]{16}")
+    dtype = read_merge_info(os.path.join(merged_dir, keep)).get("dtype")
+    for name in os.listdir(merged_dir):
+        if not pattern.fullmatch(name) or name == keep:
+            continue
+        if read_merge_info(os.path.join(merged_dir, name)).get("dtype", dtype) != dtype:
+            continue
+        shutil.rmtree(os.path.join(merged_dir, name), ignore_errors=True)
+        print(f"🗑️ Eski checkpoint silindi: {name}")
+
+
+def build_merged_checkpoint(base_model_id, adapter_path, dtype=torch.float32, merged_dir=MERGED_DIR, force=False):
+    """Base modeli yükler, adapter'ı merge eder ve checkpoint olarak kaydeder"""
+    from transformers import AutoModelForCausalLM
+    from peft import PeftModel
+
+    path = checkpoint_dir(base_model_id, adapter_path, dtype, merged_dir)
+    if not force and path is not None and os.path.exists(os.path.join(path, INFO_FILE)):
+        print(f"✅ Checkpoint güncel: {path}")
+        return path
+
+    print(f"🔄 Merge ediliyor: {base_model_id} + {adapter_path}")
+    base_model = AutoModelForCausalLM.from_pretrained(
+        base_model_id,
+        trust_remote_code=True,
+        torch_dtype=dtype,
+        low_cpu_mem_usage=True
+    )
+    model = PeftModel.from_pretrained(base_model, adapter_path, torch_dtype=dtype).merge_and_unload()
+    if force and path is not None:
+        shutil.rmtree(path, ignore_errors=True)
+    return save_merged_checkpoint(model, base_model_id, adapter_path, merged_dir)
+
+
+def build_int8_checkpoint(path, force=False):
+    """Merge edilmiş checkpoint'i nicemleyip int8 kopyasını yanına kaydeder"""
+    from transformers import AutoModelForCausalLM
+
+    if force and os.path.exists(int8_state_file(path)):
+        os.remove(int8_state_file(path))
+    elif os.path.exists(int8_state_file(path)):
+        print(f"✅ int8 checkpoint güncel: {int8_state_file(path)}")
+        return int8_state_file(path)
+
+    model = AutoModelForCausalLM.from_pretrained(path, trust_remote_code=True, torch_dtype=torch.float32,
+                                                 low_cpu_mem_usage=True)
+    return save_int8_checkpoint(quantize_int8(model.eval()), path, "int8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LoRA adapter'larını base modele merge edip checkpoint olarak kaydeder")
+    parser.add_argument("--intents", nargs="+", choices=sorted(ADAPTERS), default=sorted(ADAPTERS))
+    parser.add_argument("--dtype", choices=["float32", "bfloat16", "float16"], default="float32",
+                        help="Yüklemede kullanılacak dtype (CPU backend'leri float32 yükler)")
+    parser.add_argument("--backend", choices=["fp32", "int8"], default="fp32",
+                        help="int8: nicemlenmiş kopyayı da oluştur (CPU_BACKEND=int8 sunucular için)")
+    parser.add_argument("--output", default=MERGED_DIR)
+    parser.add_argument("--force", action="store_true", help="Güncel olsa da yeniden oluştur")
+    args = parser.parse_args()
+
+    sys.path.append(BACKEND_DIR)
+    from model_registry import load_backend_module
+
+    for intent in args.intents:
+        module = load_backend_module(*ADAPTERS[intent])
+        if not os.path.isdir(module.DEFAULT_ADAPTER_PATH):
+            print(f"⚠️ {intent}: adapter bulunamadı ({module.DEFAULT_ADAPTER_PATH})")
+            continue
+        path = build_merged_checkpoint(module.BASE_MODEL_ID, module.DEFAULT_ADAPTER_PATH,
+                                       getattr(torch, args.dtype), args.output, args.force)
+        if args.backend == "int8":
+            build_int8_checkpoint(path, args.force)
+
+
+if __name__ == "__main__":
+    main()
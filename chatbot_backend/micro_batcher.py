@@ -0,0 +1,70 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Farklı thread'lerden gelen tekil çağrıları toplayıp tek batch çağrısında işler.
+
+    Worker thread kuyruktaki tüm istekleri (en fazla max_batch_size) alır ve
+    batch_fn(items) ile işler; batch_fn her item için bir sonuç döndürmelidir.
+    max_wait_ms > 0 ise ilk istekten sonra batch'i doldurmak için o kadar beklenir;
+    0 ise ek gecikme olmaz, yük altında istekler bir önceki batch işlenirken birikir.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait_ms=0, name="micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+        self.batches_processed = 0
+        self.items_processed = 0
+
+    def submit(self, item):
+        """Item'ı kuyruğa ekler, sonucu beklemek için Future döndürür"""
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout=None):
+        """Item'ı işler ve sonucunu döndürür (batch tamamlanana kadar bekler)"""
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            self.batches_processed += 1
+            self.items_processed += len(batch)
+
+    def stats(self):
+        return {
+            "batches_processed": self.batches_processed,
+            "items_processed": self.items_processed,
+            "pending": self._queue.qsize()
+        }
@@ -0,0 +1,149 @@
+import os
+import sys
+import threading
+import importlib.util
+from collections import namedtuple
+from datetime import datetime
+
+import torch
+
+from cpu_backend import cpu_dtype_label
+
+# Backend modüllerinin bulunduğu ana dizin
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Bir modeli benzersiz şekilde tanımlayan anahtar
+ModelKey = namedtuple("ModelKey", ["model_id", "adapter_path", "device", "dtype"])
+
+_module_lock = threading.Lock()
+
+
+def resolve_device():
+    """Modellerin çalışacağı cihazı döndürür"""
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def default_dtype(device):
+    """Cihaza göre inference modüllerinin kullandığı dtype adını döndürür (CPU'da seçili backend)"""
+    return "float16" if device == "cuda" else cpu_dtype_label()
+
+
+def load_backend_module(module_name, relative_path):
+    """Inference modülünü dosya yolundan bir kez import eder.
+
+    Modül sys.modules'a kaydedildiği için modül seviyesindeki singleton'lar
+    (ör. _model_instance) istekler arasında korunur.
+    """
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+
+    with _module_lock:
+        module = sys.modules.get(module_name)
+        if module is not None:
+            return module
+
+        spec = importlib.util.spec_from_file_location(
+            module_name,
+            os.path.join(BACKEND_DIR, relative_path)
+        )
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        try:
+            spec.loader.exec_module(module)
+        except Exception:
+            del sys.modules[module_name]
+            raise
+        return module
+
+
+def adapter_version(adapter_path):
+    """Adapter dizinindeki dosyaların en son değişme zamanını sürüm olarak döndürür.
+
+    Adapter yeniden eğitilip kaydedildiğinde sürüm değişir; önbellekler
+    eski adapter'ın çıktılarını kullanmaz.
+    """
+    try:
+        mtimes = [entry.stat().st_mtime for entry in os.scandir(adapter_path) if entry.is_file()]
+    except OSError:
+        return "missing"
+    return str(int(max(mtimes))) if mtimes else "empty"
+
+
+class ModelRegistry:
+    """Yüklenmiş modelleri süreç boyunca tutan kayıt defteri.
+
+    Her model ModelKey (model id, adapter yolu, cihaz, dtype) ile anahtarlanır
+    ve yalnızca bir kez yüklenir; tüm route'lar aynı sıcak örneği kullanır.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._load_times = {}
+        # Her girdinin yüklendiği andaki adapter sürümleri {adapter yolu: sürüm}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get_or_load(self, key, factory):
+        """Anahtara ait modeli döndürür, yoksa factory(key) ile yükler.
+
+        factory yüklenmiş bir örnek döndürmeli ya da hata fırlatmalıdır.
+        Aynı anahtar için eşzamanlı istekler tek bir yüklemeyi bekler.
+        """
+        instance = self._entries.get(key)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            instance = self._entries.get(key)
+            if instance is not None:
+                return instance
+
+            print(f"📦 Model kayıt defterine yükleniyor: {key.model_id} (adapter: {key.adapter_path}, {key.device}/{key.dtype})")
+            # Sürüm yüklemeden önce bir kez okunur; disk sonradan değişse de yüklü adapter'ın sürümü kalır
+            adapter_paths = key.adapter_path if isinstance(key.adapter_path, tuple) else (key.adapter_path,)
+            versions = {path: adapter_version(path) for path in adapter_paths if path}
+            instance = factory(key)
+            self._versions[key] = versions
+            self._entries[key] = instance
+            self._load_times[key] = datetime.now().isoformat()
+            return instance
+
+    def get(self, key):
+        """Yüklenmiş modeli döndürür, yüklenmemişse None"""
+        return self._entries.get(key)
+
+    def loaded_adapter_version(self, key, adapter_path):
+        """Anahtardaki model yüklenirken okunan adapter sürümü; model yüklü değilse None"""
+        return self._versions.get(key, {}).get(adapter_path)
+
+    def unload(self, key):
+        """Modeli kayıt defterinden çıkarır"""
+        with self._lock:
+            self._load_times.pop(key, None)
+            self._versions.pop(key, None)
+            instance = self._entries.pop(key, None)
+        if instance is not None and key.device == "cuda":
+            torch.cuda.empty_cache()
+        return instance is not None
+
+    def status(self):
+        """Yüklü modellerin listesini döndürür (/api/health için)"""
+        return [
+            {
+                "model_id": key.model_id,
+                "adapter_path": key.adapter_path,
+                "device": key.device,
+                "dtype": key.dtype,
+                "loaded_at": self._load_times.get(key)
+            }
+            for key in list(self._entries)
+        ]
+
+
+# Süreç genelinde tek kayıt defteri
+registry = ModelRegistry()
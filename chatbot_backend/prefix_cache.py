@@ -0,0 +1,124 @@
+import hashlib
+import threading
+
+import torch
+
+from streaming_decoder import cache_to_layers, layers_to_cache
+
+
+class PrefixEntry:
+    """Bir sabit prompt önekinin token id'leri ve katman başına KV tensörleri"""
+
+    def __init__(self, token_ids, layers, adapter_name, version, prompt_hash):
+        self.token_ids = token_ids
+        self.layers = layers
+        self.adapter_name = adapter_name
+        self.version = version
+        self.prompt_hash = prompt_hash
+
+    def __len__(self):
+        return len(self.token_ids)
+
+
+def prompt_prefix(prompt_text, sentinel):
+    """Biçimlendirilmiş prompt'un istekten bağımsız (sentinel'den önceki) kısmı"""
+    position = prompt_text.find(sentinel)
+    return prompt_text[:position] if position > 0 else None
+
+
+class PrefixKVCache:
+    """Backend'lerin sabit system prompt öneklerinin past_key_values'ını bir kez hesaplar.
+
+    Her önek yüklemede (register) bir kez prefill edilir. İstek prompt'unun
+    token'ları bir önekle birebir başlıyorsa prefill yalnızca kalan token'lar
+    için yapılır. Girişler (ad, adapter) ile anahtarlanır; adapter sürümü ya
+    da prompt metni değişince önek yeniden hesaplanır. Saklanan tensörler
+    hiçbir zaman yerinde değiştirilmez, her istek kendi cache nesnesini alır.
+    """
+
+    def __init__(self, model, tokenizer, multi_adapter=False):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.multi_adapter = multi_adapter
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, name, prefix_text, adapter_name=None, version=None):
+        """Öneki kaydeder; aynı sürüm ve metinle zaten kayıtlıysa yeniden hesaplamaz"""
+        if not prefix_text:
+            return None
+        prompt_hash = hashlib.sha1(prefix_text.encode("utf-8")).hexdigest()
+        key = (name, adapter_name)
+        entry = self._entries.get(key)
+        if entry is not None and entry.version == version and entry.prompt_hash == prompt_hash:
+            return entry
+
+        token_ids = self.tokenizer(prefix_text, return_tensors="pt")["input_ids"][0].tolist()
+        # Son token istek metniyle birleşip farklı tokenize edilebilir; sınırdaki token önbelleğe alınmaz
+        token_ids = token_ids[:-1]
+        if not token_ids:
+            return None
+
+        input_ids = torch.tensor([token_ids], dtype=torch.long, device=self.model.device)
+        # Paylaşılan PEFT modelinde önek, isteğin adapter'ı ile (adapter'sız: "__base__") hesaplanır
+        kwargs = {"adapter_names": [adapter_name or "__base__"]} if self.multi_adapter else {}
+        with torch.no_grad():
+            outputs = self.model(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                use_cache=True,
+                **kwargs
+            )
+
+        entry = PrefixEntry(tuple(token_ids), cache_to_layers(outputs.past_key_values), adapter_name, version, prompt_hash)
+        with self._lock:
+            self._entries[key] = entry
+        print(f"🧠 Prompt öneki önbelleğe alındı: {name} ({len(token_ids)} token)")
+        return entry
+
+    def invalidate(self, adapter_name=None):
+        """Adapter'a ait (None: tüm) önekleri siler"""
+        with self._lock:
+            for key in list(self._entries):
+                if adapter_name is None or key[1] == adapter_name:
+                    del self._entries[key]
+
+    def match(self, token_ids, adapter_name=None):
+        """token_ids'in başladığı en uzun kayıtlı öneki döndürür, yoksa None.
+
+        Önekten sonra en az bir token kalmalıdır (son pozisyonun logits'i gerekir).
+        """
+        best = None
+        for entry in list(self._entries.values()):
+            if entry.adapter_name != adapter_name or len(entry) >= len(token_ids):
+                continue
+            if best is not None and len(entry) <= len(best):
+                continue
+            if tuple(token_ids[:len(entry)]) == entry.token_ids:
+                best = entry
+
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return best
+
+    def past_key_values_for(self, input_ids, attention_mask=None, adapter_name=None):
+        """model.generate için önek cache'i (yeni bir cache nesnesi) döndürür, eşleşme yoksa None"""
+        if input_ids.shape[0] != 1 or (attention_mask is not None and not bool(attention_mask.all())):
+            return None
+        entry = self.match(input_ids[0].tolist(), adapter_name)
+        return layers_to_cache(entry.layers) if entry is not None else None
+
+    def stats(self):
+        return {
+            "prefixes": [
+                {"name": name, "adapter": adapter_name, "tokens": len(entry), "version": entry.version}
+                for (name, adapter_name), entry in list(self._entries.items())
+            ],
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,69 @@
+import sys
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from index_builder import evaluate_configs, normalize_vectors, _default_nlist, _pq_subquantizers
+from vector_store import resolve_snapshot_dir, EMBEDDINGS_FILE
+
+# Kullanım:
+#   python benchmark_index.py                      # vector_database/embeddings.npy üzerinde
+#   python benchmark_index.py --synthetic 200000   # büyük korpus benzetimi
+
+
+def synthetic_embeddings(n_vectors: int, dimension: int = 384, n_topics: int = 500, seed: int = 42) -> np.ndarray:
+    """Konu kümeleri etrafında dağılan, gerçek embedding'lere benzer sentetik vektörler"""
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(n_topics, dimension)).astype(np.float32)
+    assignments = rng.integers(0, n_topics, size=n_vectors)
+    noise = rng.normal(scale=0.6, size=(n_vectors, dimension)).astype(np.float32)
+    return topics[assignments] + noise
+
+
+def all_configs(n_vectors: int, dimension: int):
+    """Boyut eşiklerinden bağımsız olarak tüm indeks türleri"""
+    nlist = _default_nlist(n_vectors)
+    configs = [
+        {"type": "Flat"},
+        {"type": "IVFFlat", "nlist": nlist},
+        {"type": "HNSW", "M": 32, "efConstruction": 200}
+    ]
+    # PQ eğitimi her merkez için yeterli vektör ister (2^nbits * 39)
+    if n_vectors >= 256 * 39:
+        configs.append({"type": "IVFPQ", "nlist": nlist, "m": _pq_subquantizers(dimension), "nbits": 8})
+    return configs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS indeks türleri için recall@k ve gecikme benchmark'ı")
+    parser.add_argument("--embeddings", default=str(resolve_snapshot_dir("vector_database") / EMBEDDINGS_FILE))
+    parser.add_argument("--synthetic", type=int, default=0, help="Sentetik vektör sayısı")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--recall-target", type=float, default=0.95)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        embeddings = synthetic_embeddings(args.synthetic)
+    elif Path(args.embeddings).exists():
+        embeddings = np.load(args.embeddings)
+    else:
+        print(f"Embedding dosyası bulunamadı: {args.embeddings} (önce embedding_processor.py çalıştırın)")
+        sys.exit(1)
+
+    vectors = normalize_vectors(embeddings)
+    print(f"{len(vectors)} vektör, boyut {vectors.shape[1]}, k={args.k}, hedef recall={args.recall_target}")
+    print(f"{'İndeks':<10}{'Parametreler':<22}{'recall@k':>10}{'p50 (ms)':>11}{'p99 (ms)':>11}{'Kurulum (s)':>13}")
+    print("-" * 77)
+
+    results = evaluate_configs(vectors, all_configs(len(vectors), vectors.shape[1]),
+                               k=args.k, recall_target=args.recall_target, n_queries=args.queries)
+    for config, _, report in results:
+        params = ", ".join(f"{name}={value}" for name, value in report["search_params"].items()) or "-"
+        print(f"{config['type']:<10}{params:<22}{report['recall']:>10.3f}{report['p50_ms']:>11.3f}"
+              f"{report['p99_ms']:>11.3f}{report['build_seconds']:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import re
+import json
+from pathlib import Path
+from typing import List, Dict, Tuple, Iterable, Optional
+
+import numpy as np
+
+# BM25 indeksinin vector_database içindeki dosyaları
+BM25_INFO_FILE = "bm25_info.json"
+BM25_INDPTR_FILE = "bm25_indptr.npy"
+BM25_DOC_IDS_FILE = "bm25_doc_ids.npy"
+BM25_WEIGHTS_FILE = "bm25_weights.npy"
+
+# Sonuçlara katkısı olmayan, her belgede geçen sık İngilizce kelimeler
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is", "it",
+    "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "will", "with", "you", "your"
+}
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Metni küçük harfli kelime ve sayılara böler (ilaç adları, hafta sayıları korunur)"""
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Chunk'lar üzerinde CSR formatında tutulan BM25 ters indeksi.
+
+    Her terimin posting listesi doc_ids[indptr[t]:indptr[t+1]] aralığındadır.
+    BM25 ağırlıkları (idf * tf-normalizasyonu) ingestion sırasında hesaplanıp
+    posting'lerle birlikte saklanır; arama yalnızca sorgu terimlerinin
+    ağırlıklarını toplar.
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], indptr: np.ndarray, doc_ids: np.ndarray,
+                 weights: np.ndarray, n_docs: int):
+        self.vocabulary = vocabulary
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.n_docs = n_docs
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        vocabulary: Dict[str, int] = {}
+        term_docs: List[List[int]] = []
+        term_freqs: List[List[int]] = []
+        doc_lengths = []
+
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            counts: Dict[int, int] = {}
+            for token in tokens:
+                term_id = vocabulary.setdefault(token, len(vocabulary))
+                counts[term_id] = counts.get(term_id, 0) + 1
+            for term_id, count in counts.items():
+                if term_id == len(term_docs):
+                    term_docs.append([])
+                    term_freqs.append([])
+                term_docs[term_id].append(doc_id)
+                term_freqs[term_id].append(count)
+
+        n_docs = len(doc_lengths)
+        doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        average_length = float(doc_lengths.mean()) if n_docs else 0.0
+
+        indptr = np.zeros(len(term_docs) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(docs) for docs in term_docs])
+        doc_ids = np.fromiter((doc for docs in term_docs for doc in docs), dtype=np.int32, count=int(indptr[-1]))
+        tf = np.fromiter((freq for freqs in term_freqs for freq in freqs), dtype=np.float32, count=int(indptr[-1]))
+
+        document_frequency = np.diff(indptr).astype(np.float32)
+        idf = np.log(1.0 + (n_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+        posting_idf = np.repeat(idf, np.diff(indptr))
+        length_norm = k1 * (1.0 - b + b * doc_lengths[doc_ids] / max(average_length, 1e-9))
+        weights = (posting_idf * tf * (k1 + 1.0) / (tf + length_norm)).astype(np.float32)
+
+        return cls(vocabulary, indptr, doc_ids, weights, n_docs)
+
+    def search(self, query: str, top_k: int = 20, positions: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Sorguya en yüksek BM25 skorlu (chunk pozisyonu, skor) çiftlerini döndürür.
+
+        positions verilirse yalnızca bu chunk'lar arasından seçim yapılır.
+        """
+        term_ids = {self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary}
+        if not term_ids or self.n_docs == 0:
+            return []
+
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            np.add.at(scores, self.doc_ids[start:end], self.weights[start:end])
+
+        if positions is not None:
+            candidates = positions[scores[positions] > 0]
+        else:
+            candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(doc), float(scores[doc])) for doc in order]
+
+    def save(self, output_dir: str = "vector_database"):
+        output_path = Path(output_dir)
+        output_path.mkdir(exist_ok=True)
+        np.save(output_path / BM25_INDPTR_FILE, self.indptr)
+        np.save(output_path / BM25_DOC_IDS_FILE, self.doc_ids)
+        np.save(output_path / BM25_WEIGHTS_FILE, self.weights)
+        terms = [None] * len(self.vocabulary)
+        for term, term_id in self.vocabulary.items():
+            terms[term_id] = term
+        with open(output_path / BM25_INFO_FILE, "w", encoding="utf-8") as f:
+            json.dump({"n_docs": self.n_docs, "terms": terms}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "BM25Index":
+        index_path = Path(index_dir)
+        with open(index_path / BM25_INFO_FILE, "r", encoding="utf-8") as f:
+            info = json.load(f)
+        mmap_mode = "r" if mmap else None
+        return cls(
+            {term: term_id for term_id, term in enumerate(info["terms"])},
+            np.load(index_path / BM25_INDPTR_FILE, mmap_mode=mmap_mode),
+            np.load(index_path / BM25_DOC_IDS_FILE, mmap_mode=mmap_mode),
+            np.load(index_path / BM25_WEIGHTS_FILE, mmap_mode=mmap_mode),
+            info["n_docs"]
+        )
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return (Path(index_dir) / BM25_INFO_FILE).exists()
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Birden fazla sıralamayı RRF ile birleştirir: skor = sum(1 / (k + sıra))"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, 1):
+            scores[doc] = scores.get(doc, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,198 @@
+import json
+import shutil
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+import faiss
+
+# Kompakt chunk deposunun dosyaları
+STORE_INFO_FILE = "chunk_store.json"
+TEXT_FILE = "chunks_text.bin"
+OFFSETS_FILE = "chunks_offsets.npy"
+IDS_FILE = "chunks_ids.npy"
+
+
+def write_chunk_store(chunks: List[Dict[str, Any]], output_dir: str = "vector_database"):
+    """Chunk'ları bellek eşlemeli (mmap) okunabilecek kompakt formatta kaydeder.
+
+    Tüm chunk metinleri tek bir UTF-8 blob'unda ve başlangıç offset'leri bir
+    int64 dizisinde tutulur. Metadata alanları sütun sütun saklanır: sayısal
+    alanlar doğrudan .npy dizisi, diğerleri sözlük kodlamalı (int32 kod +
+    chunk_store.json içindeki değer listesi) olarak yazılır.
+    """
+    output_path = Path(output_dir)
+    output_path.mkdir(exist_ok=True)
+
+    encoded = [chunk["content"].encode("utf-8") for chunk in chunks]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(text) for text in encoded])
+    with open(output_path / TEXT_FILE, "wb") as f:
+        for text in encoded:
+            f.write(text)
+    np.save(output_path / OFFSETS_FILE, offsets)
+    np.save(output_path / IDS_FILE, np.array([chunk["id"] for chunk in chunks], dtype="S"))
+
+    columns = {}
+    keys = []
+    for chunk in chunks:
+        for key in chunk["metadata"]:
+            if key not in keys:
+                keys.append(key)
+
+    for position, key in enumerate(keys):
+        values = [chunk["metadata"].get(key) for chunk in chunks]
+        file_name = f"meta_{position}.npy"
+        if all(isinstance(value, (int, np.integer)) and not isinstance(value, bool) for value in values):
+            np.save(output_path / file_name, np.array(values, dtype=np.int64))
+            columns[key] = {"file": file_name, "kind": "int"}
+        elif all(isinstance(value, (int, float, np.number)) and not isinstance(value, bool) for value in values):
+            np.save(output_path / file_name, np.array(values, dtype=np.float64))
+            columns[key] = {"file": file_name, "kind": "float"}
+        else:
+            # Tekrarlayan değerler (dosya adı, etiket listeleri) tek kez saklanır
+            dictionary = {}
+            codes = np.array([
+                dictionary.setdefault(json.dumps(value, ensure_ascii=False, sort_keys=True), len(dictionary))
+                for value in values
+            ], dtype=np.int32)
+            np.save(output_path / file_name, codes)
+            columns[key] = {"file": file_name, "kind": "dict", "values": list(dictionary)}
+
+    with open(output_path / STORE_INFO_FILE, "w", encoding="utf-8") as f:
+        json.dump({"count": len(chunks), "columns": columns}, f, ensure_ascii=False)
+
+
+class ChunkStore:
+    """write_chunk_store ile yazılmış chunk'lara liste gibi erişim sağlar.
+
+    Diziler ve metin blob'u mmap ile açılır; süreçler aynı sayfa önbelleğini
+    paylaşır ve yalnızca istenen chunk'lar (ör. top-k sonuçları) Python
+    nesnesine dönüştürülür. chunks[i] JSON formatıyla aynı sözlüğü döndürür.
+    """
+
+    def __init__(self, store_dir: str):
+        self.path = Path(store_dir)
+        with open(self.path / STORE_INFO_FILE, "r", encoding="utf-8") as f:
+            info = json.load(f)
+
+        self._count = info["count"]
+        self._offsets = np.load(self.path / OFFSETS_FILE, mmap_mode="r")
+        self._ids = np.load(self.path / IDS_FILE, mmap_mode="r")
+        text_path = self.path / TEXT_FILE
+        # Boş dosya mmap edilemez
+        if text_path.stat().st_size > 0:
+            self._text = np.memmap(text_path, dtype=np.uint8, mode="r")
+        else:
+            self._text = np.zeros(0, dtype=np.uint8)
+
+        self._columns = []
+        for key, column in info["columns"].items():
+            data = np.load(self.path / column["file"], mmap_mode="r")
+            values = [json.loads(value) for value in column["values"]] if column["kind"] == "dict" else None
+            self._columns.append((key, column["kind"], data, values))
+
+    @staticmethod
+    def exists(store_dir: str) -> bool:
+        return (Path(store_dir) / STORE_INFO_FILE).exists()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, position: int) -> Dict[str, Any]:
+        position = int(position)
+        if position < 0:
+            position += self._count
+        if not 0 <= position < self._count:
+            raise IndexError("chunk indeksi aralık dışında")
+        return {
+            "id": self.chunk_id(position),
+            "content": self.content(position),
+            "metadata": self.metadata(position)
+        }
+
+    def __iter__(self):
+        for position in range(self._count):
+            yield self[position]
+
+    def chunk_id(self, position: int) -> str:
+        return self._ids[position].decode("ascii")
+
+    def chunk_ids(self) -> List[str]:
+        return [chunk_id.decode("ascii") for chunk_id in self._ids]
+
+    def content(self, position: int) -> str:
+        start, end = self._offsets[position], self._offsets[position + 1]
+        return self._text[start:end].tobytes().decode("utf-8")
+
+    def metadata(self, position: int) -> Dict[str, Any]:
+        metadata = {}
+        for key, kind, data, values in self._columns:
+            if kind == "dict":
+                value = values[data[position]]
+                # Eksik alanlar yazılırken None olarak kodlanır
+                if value is None:
+                    continue
+                metadata[key] = value
+            elif kind == "int":
+                metadata[key] = int(data[position])
+            else:
+                metadata[key] = float(data[position])
+        return metadata
+
+    def column(self, key: str) -> Optional[np.ndarray]:
+        """Bir metadata sütununun ham dizisi (sözlük kodlamalı alanlarda kodlar)"""
+        for column_key, _, data, _ in self._columns:
+            if column_key == key:
+                return data
+        return None
+
+    def dictionary(self, key: str) -> Optional[tuple]:
+        """Sözlük kodlamalı bir sütunun (kodlar, değerler) çifti; sütun yoksa ya da sayısalsa None"""
+        for column_key, kind, data, values in self._columns:
+            if column_key == key and kind == "dict":
+                return data, values
+        return None
+
+
+def read_index_mmap(index_path: str) -> faiss.Index:
+    """FAISS indeksini mmap ile açar; desteklenmiyorsa normal şekilde okur"""
+    flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    try:
+        return faiss.read_index(str(index_path), flags)
+    except RuntimeError as e:
+        print(f"Uyarı: indeks mmap ile açılamadı ({e}), belleğe okunuyor")
+        return faiss.read_index(str(index_path))
+
+
+def _is_store_file(name: str) -> bool:
+    return name in (STORE_INFO_FILE, TEXT_FILE, OFFSETS_FILE, IDS_FILE) or (
+        name.startswith("meta_") and name.endswith(".npy"))
+
+
+def main(vector_db_path: str = "vector_database"):
+    """Etkin sürümün chunks_metadata.json dosyasından kompakt depoyu yeni bir sürüm olarak oluşturur.
+
+    Etkin sürüm dizinine dokunulmaz; diğer dosyaları kopyalanır, chunk deposu
+    yeniden yazılır ve CURRENT yeni sürüme çevrilir.
+    """
+    # vector_store bu modülü içe aktardığı için burada yüklenir
+    from vector_store import resolve_snapshot_dir, read_manifest, write_snapshot, MANIFEST_FILE
+    source_dir = resolve_snapshot_dir(vector_db_path)
+    with open(source_dir / "chunks_metadata.json", "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+
+    def write_files(output_path: Path):
+        for file_path in source_dir.iterdir():
+            if file_path.is_file() and file_path.name != MANIFEST_FILE and not _is_store_file(file_path.name):
+                shutil.copy2(file_path, output_path / file_path.name)
+        write_chunk_store(chunks, str(output_path))
+
+    manifest = read_manifest(source_dir) or {}
+    info = {key: value for key, value in manifest.items() if key not in ("version", "created_at", "parent", "files")}
+    path = write_snapshot(vector_db_path, write_files, info)
+    print(f"Chunk deposu oluşturuldu: {len(chunks)} chunk ({path})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import re
+from typing import List, Dict, Any, Optional
+
+# Ayırıcının (RecursiveCharacterTextSplitter chunk_overlap=200) bıraktığı en uzun örtüşme
+MAX_OVERLAP_CHARS = 400
+
+# Bütçenin sonunda yarım eklenecek bir bölüm için gereken en az token
+MIN_PARTIAL_TOKENS = 32
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+def _normalize_sentence(sentence: str) -> str:
+    return " ".join(sentence.lower().split())
+
+
+def _merge_overlapping(first: str, second: str) -> str:
+    """İkinci metnin başı birincinin sonuyla örtüşüyorsa örtüşen kısmı bir kez yazar"""
+    limit = min(len(first), len(second), MAX_OVERLAP_CHARS)
+    for size in range(limit, 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+def merge_adjacent_chunks(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Aynı dosyadaki ardışık (chunk_index farkı 1) chunk'ları tek bölümde birleştirir.
+
+    Birleşen bölüm, üyelerinin en iyi sırasında yer alır; sonuç yine
+    retrieval sırasındadır.
+    """
+    by_source: Dict[str, List[tuple]] = {}
+    for rank, chunk in enumerate(chunks):
+        metadata = chunk["metadata"]
+        by_source.setdefault(metadata["source_file"], []).append((metadata.get("chunk_index", rank), rank, chunk))
+
+    sections = []
+    for source_file, members in by_source.items():
+        members.sort(key=lambda member: member[0])
+        current = None
+        for chunk_index, rank, chunk in members:
+            if current is not None and chunk_index == current["last_index"] + 1:
+                current["content"] = _merge_overlapping(current["content"], chunk["content"])
+                current["last_index"] = chunk_index
+                current["rank"] = min(current["rank"], rank)
+                current["chunks"].append(chunk)
+                continue
+            if current is not None:
+                sections.append(current)
+            current = {
+                "source_file": source_file,
+                "content": chunk["content"],
+                "last_index": chunk_index,
+                "rank": rank,
+                "chunks": [chunk]
+            }
+        if current is not None:
+            sections.append(current)
+
+    sections.sort(key=lambda section: section["rank"])
+    return sections
+
+
+class ContextPacker:
+    """RAG context'ini LLM token bütçesine göre paketler.
+
+    Ardışık chunk'lar birleştirilir, daha önce eklenmiş cümleler tekrar
+    yazılmaz ve bölümler retrieval sırasıyla bütçe dolana kadar eklenir.
+    Bütçe, prompt'un geri kalanı (soru ve <|assistant|> etiketi dahil) ve
+    max_new_tokens modele sığacak şekilde hesaplanır; soru hiçbir zaman
+    kesilmez.
+    """
+
+    def __init__(self, tokenizer, max_model_tokens: int = 4096, max_context_tokens: Optional[int] = None):
+        self.tokenizer = tokenizer
+        self.max_model_tokens = max_model_tokens
+        # Modele sığsa bile context için üst sınır (daha kısa prompt = daha hızlı prefill)
+        self.max_context_tokens = max_context_tokens
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def context_budget(self, prompt_without_context: str, max_new_tokens: int) -> int:
+        """Context'e ayrılabilecek token sayısı"""
+        budget = self.max_model_tokens - max_new_tokens - self.count_tokens(prompt_without_context)
+        if self.max_context_tokens is not None:
+            budget = min(budget, self.max_context_tokens)
+        return max(budget, 0)
+
+    def pack(self, chunks: List[Dict[str, Any]], budget: int) -> Dict[str, Any]:
+        """Chunk'ları bütçeye sığacak şekilde context metnine dönüştürür.
+
+        {"context", "tokens", "sources"} döndürür; sources context'e giren chunk'lardır.
+        """
+        seen_sentences = set()
+        parts = []
+        sources = []
+        used_tokens = 0
+
+        for section in merge_adjacent_chunks(chunks):
+            sentences = []
+            for sentence in split_sentences(section["content"]):
+                key = _normalize_sentence(sentence)
+                if key in seen_sentences:
+                    continue
+                seen_sentences.add(key)
+                sentences.append(sentence)
+            if not sentences:
+                continue
+
+            header = f"Source {len(parts) + 1} (File: {section['source_file']}):"
+            text = header + "\n" + " ".join(sentences) + "\n"
+            # Bölümler arasındaki boş satır dahil
+            tokens = self.count_tokens(text) + (1 if parts else 0)
+
+            if used_tokens + tokens <= budget:
+                parts.append(text)
+                sources.extend(section["chunks"])
+                used_tokens += tokens
+                continue
+
+            # Kalan bütçe yeterliyse bölümün sığan cümlelerini ekle ve dur
+            remaining = budget - used_tokens
+            if remaining >= MIN_PARTIAL_TOKENS:
+                partial = self._fit_sentences(header, sentences, remaining - (1 if parts else 0))
+                if partial is not None:
+                    parts.append(partial)
+                    sources.extend(section["chunks"])
+                    used_tokens += self.count_tokens(partial) + (1 if len(parts) > 1 else 0)
+            break
+
+        return {"context": "\n".join(parts), "tokens": used_tokens, "sources": sources}
+
+    def truncate_text(self, text: str, max_tokens: int) -> str:
+        """Metni token sınırına göre (mümkünse cümle sonunda) keser"""
+        token_ids = self.tokenizer(text, add_special_tokens=False)["input_ids"]
+        if len(token_ids) <= max_tokens:
+            return text
+        truncated = self.tokenizer.decode(token_ids[:max_tokens], skip_special_tokens=True)
+        boundary = max(truncated.rfind(". "), truncated.rfind("\n"))
+        return truncated[:boundary + 1] if boundary > 0 else truncated
+
+    def _fit_sentences(self, header: str, sentences: List[str], budget: int) -> Optional[str]:
+        """Bütçeye sığan en uzun cümle önekini ikili aramayla bulur"""
+        low, high = 0, len(sentences)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count_tokens(header + "\n" + " ".join(sentences[:middle]) + "\n") <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        if low == 0:
+            return None
+        return header + "\n" + " ".join(sentences[:low]) + "\n"
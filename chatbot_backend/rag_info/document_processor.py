@@ -1,34 +1,152 @@
 import os
+import sys
 import json
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Callable
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import docx
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import hashlib
 
+from metadata_filter import detect_stage, STAGES
+
+# Dosya başına içerik hash'i ve chunk id'lerini tutan manifest
+MANIFEST_FILE = "ingestion_manifest.json"
+
+# Belgeler dizininde isteğe bağlı etiket dosyası: {"dosya.docx": {"stage": "postpartum", "tags": [...]}}
+TAGS_FILE = "document_tags.json"
+
+# Worker süreçlerinde bir kez oluşturulan processor
+_worker_processor = None
+
+def _init_worker(documents_dir: str):
+    global _worker_processor
+    _worker_processor = DocumentProcessor(documents_dir)
+
+def _process_file_worker(file_path: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Worker süreçte tek bir belgeyi okuyup chunk'lara böler (pickle edilebilmesi için modül seviyesinde)"""
+    return file_path, _worker_processor.process_file(Path(file_path))
+
 class DocumentProcessor:
-    def __init__(self, documents_dir: str = "rag_pregnancy_reports"):
+    def __init__(self, documents_dir: str = "rag_pregnancy_reports", max_workers: Optional[int] = None):
         self.documents_dir = Path(documents_dir)
+        # None: CPU çekirdeği sayısı kadar worker, 1: seri işleme
+        self.max_workers = max_workers or os.cpu_count() or 1
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
             length_function=len,
             separators=["\n\n", "\n", ". ", " ", ""]
         )
+        self.document_tags = self.load_document_tags()
+    
+    def load_document_tags(self) -> Dict[str, Any]:
+        tags_path = self.documents_dir / TAGS_FILE
+        if not tags_path.exists():
+            return {}
+        with open(tags_path, 'r', encoding='utf-8') as f:
+            document_tags = json.load(f)
+        for name, entry in document_tags.items():
+            if entry.get("stage") is not None and entry["stage"] not in STAGES:
+                raise ValueError(f"{TAGS_FILE}: {name} için geçersiz dönem: {entry['stage']}")
+        return document_tags
+    
+    def tags_hash(self) -> Optional[str]:
+        tags_path = self.documents_dir / TAGS_FILE
+        return self._file_hash(tags_path) if tags_path.exists() else None
+    
+    def label_chunks(self, file_name: str, chunks: List[Dict[str, Any]]):
+        """Chunk'lara dönem (stage) ve etiket (tags) metadata'sı ekler.
+        
+        Dönem etiket dosyasında verilmişse o kullanılır; yoksa chunk metninden,
+        chunk belirsizse belgenin tamamından anahtar kelimelerle belirlenir.
+        """
+        entry = self.document_tags.get(file_name, {})
+        document_stage = entry.get("stage") or detect_stage(" ".join(chunk["content"] for chunk in chunks))
+        for chunk in chunks:
+            stage = entry.get("stage")
+            if stage is None:
+                chunk_stage = detect_stage(chunk["content"])
+                stage = chunk_stage if chunk_stage != "general" else document_stage
+            chunk["metadata"]["stage"] = stage
+            chunk["metadata"]["tags"] = list(entry.get("tags", []))
         
     def extract_text_from_docx(self, file_path: Path) -> str:
         """DOCX dosyasından metin çıkarır"""
         try:
             doc = docx.Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text.strip()
+            return "\n".join(paragraph.text for paragraph in doc.paragraphs).strip()
         except Exception as e:
             print(f"Hata: {file_path} dosyası okunamadı: {e}")
             return ""
     
-    def process_documents(self) -> List[Dict[str, Any]]:
+    def process_file(self, file_path: Path) -> List[Dict[str, Any]]:
+        """Tek bir belgeyi chunk'lara böler ve metadata ekler"""
+        print(f"İşleniyor: {file_path.name}")
+        
+        text = self.extract_text_from_docx(file_path)
+        
+        if not text.strip():
+            print(f"Uyarı: {file_path.name} dosyası boş veya okunamadı")
+            return []
+        
+        chunks = self.text_splitter.split_text(text)
+        
+        # Her chunk için metadata oluştur
+        file_chunks = []
+        for i, chunk in enumerate(chunks):
+            chunk_data = {
+                "id": self._generate_chunk_id(file_path.name, i),
+                "content": chunk,
+                "metadata": {
+                    "source_file": file_path.name,
+                    "chunk_index": i,
+                    "total_chunks": len(chunks),
+                    "file_size": file_path.stat().st_size,
+                    "chunk_size": len(chunk)
+                }
+            }
+            file_chunks.append(chunk_data)
+        self.label_chunks(file_path.name, file_chunks)
+        
+        print(f"  - {len(chunks)} chunk oluşturuldu")
+        return file_chunks
+    
+    def iter_processed_files(self, file_paths: List[Path]) -> Iterator[Tuple[Path, List[Dict[str, Any]]]]:
+        """Belgeleri süreç havuzunda paralel işler, (dosya, chunk'lar) çiftlerini biten sırayla döndürür.
+        
+        Sonuçlar geldikçe tüketilebilir; örneğin bir dosyanın chunk'ları diğer
+        dosyalar hâlâ okunurken embedder'a gönderilir (process_files on_file).
+        """
+        if self.max_workers <= 1 or len(file_paths) <= 1:
+            for file_path in file_paths:
+                yield file_path, self.process_file(file_path)
+            return
+        
+        workers = min(self.max_workers, len(file_paths))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(str(self.documents_dir),)) as executor:
+            futures = [executor.submit(_process_file_worker, str(file_path)) for file_path in file_paths]
+            for future in as_completed(futures):
+                file_path, chunks = future.result()
+                yield Path(file_path), chunks
+    
+    def process_files(self, file_paths: List[Path],
+                      on_file: Optional[Callable[[Path, List[Dict[str, Any]]], None]] = None
+                      ) -> Dict[str, List[Dict[str, Any]]]:
+        """Belgeleri paralel işler ve {dosya adı: chunk'lar} döndürür.
+        
+        on_file verilirse her dosyanın chunk'larıyla dosya biter bitmez çağrılır
+        (ör. embed için); bu sırada havuz diğer dosyaları işlemeye devam eder.
+        """
+        chunks_by_file = {}
+        for file_path, chunks in self.iter_processed_files(file_paths):
+            if on_file is not None:
+                on_file(file_path, chunks)
+            chunks_by_file[file_path.name] = chunks
+        return chunks_by_file
+    
+    def process_documents(self, on_file=None) -> List[Dict[str, Any]]:
         """Tüm belgeleri işler ve chunk'lara böler"""
         all_chunks = []
         
@@ -37,36 +155,87 @@ class DocumentProcessor:
         
         print(f"Toplam {len(docx_files)} DOCX dosyası bulundu.")
         
+        # Paralel işlenen sonuçlar dosya sırasına göre birleştirilir
+        chunks_by_file = self.process_files(docx_files, on_file)
         for file_path in docx_files:
-            print(f"İşleniyor: {file_path.name}")
-            
-            text = self.extract_text_from_docx(file_path)
-            
-            if not text.strip():
-                print(f"Uyarı: {file_path.name} dosyası boş veya okunamadı")
-                continue
-            
-            chunks = self.text_splitter.split_text(text)
-            
-            # Her chunk için metadata oluştur
-            for i, chunk in enumerate(chunks):
-                chunk_data = {
-                    "id": self._generate_chunk_id(file_path.name, i),
-                    "content": chunk,
-                    "metadata": {
-                        "source_file": file_path.name,
-                        "chunk_index": i,
-                        "total_chunks": len(chunks),
-                        "file_size": file_path.stat().st_size,
-                        "chunk_size": len(chunk)
-                    }
-                }
-                all_chunks.append(chunk_data)
-            
-            print(f"  - {len(chunks)} chunk oluşturuldu")
+            all_chunks.extend(chunks_by_file[file_path.name])
         
         return all_chunks
     
+    def process_documents_incremental(self, previous_chunks: List[Dict[str, Any]],
+                                      manifest: Dict[str, Any], on_file=None) -> tuple:
+        """Yalnızca eklenen ve değişen belgeleri işler, diğerlerinin chunk'larını korur.
+        
+        Önceki sıradaki dosyalar aynı sırada kalır, yeni dosyalar sona eklenir;
+        böylece sadece ekleme yapıldığında mevcut chunk pozisyonları değişmez.
+        (chunk'lar, yeni manifest, değişiklik özeti) döndürür.
+        """
+        previous_files = manifest.get("files", {})
+        chunks_by_file = {}
+        for chunk in previous_chunks:
+            chunks_by_file.setdefault(chunk["metadata"]["source_file"], []).append(chunk)
+        
+        current_files = {path.name: path for path in self.documents_dir.glob("*.docx")}
+        print(f"Toplam {len(current_files)} DOCX dosyası bulundu.")
+        
+        changes = {"added": [], "changed": [], "removed": [], "unchanged": []}
+        ordered_names = [name for name in previous_files if name in current_files]
+        ordered_names += sorted(name for name in current_files if name not in previous_files)
+        changes["removed"] = [name for name in previous_files if name not in current_files]
+        
+        file_hashes = {name: self._file_hash(current_files[name]) for name in ordered_names}
+        for name in ordered_names:
+            previous = previous_files.get(name)
+            if previous is not None and previous["sha256"] == file_hashes[name] and name in chunks_by_file:
+                changes["unchanged"].append(name)
+            else:
+                changes["changed" if previous is not None else "added"].append(name)
+        
+        # Eklenen ve değişen belgeler paralel işlenir
+        processed = self.process_files([current_files[name] for name in changes["added"] + changes["changed"]],
+                                       on_file)
+        
+        # Etiket dosyası değiştiyse ya da eski chunk'larda etiket yoksa değişmeyen belgeler yeniden etiketlenir
+        tags_hash = self.tags_hash()
+        changes["relabeled"] = tags_hash != manifest.get("tags_sha256") or any(
+            "stage" not in chunk["metadata"] for chunk in previous_chunks
+        )
+        
+        all_chunks = []
+        new_manifest = {"files": {}, "tags_sha256": tags_hash}
+        for name in ordered_names:
+            file_chunks = processed[name] if name in processed else chunks_by_file[name]
+            if name not in processed and changes["relabeled"]:
+                self.label_chunks(name, file_chunks)
+            file_hash = file_hashes[name]
+            all_chunks.extend(file_chunks)
+            new_manifest["files"][name] = {
+                "sha256": file_hash,
+                "chunk_ids": [chunk["id"] for chunk in file_chunks]
+            }
+        
+        print(f"Eklenen: {len(changes['added'])}, değişen: {len(changes['changed'])}, "
+              f"silinen: {len(changes['removed'])}, değişmeyen: {len(changes['unchanged'])}")
+        return all_chunks, new_manifest, changes
+    
+    def build_manifest(self, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Tam işleme sonrası dosya hash'leri ve chunk id'lerinden manifest oluşturur"""
+        manifest = {"files": {}, "tags_sha256": self.tags_hash()}
+        for file_path in self.documents_dir.glob("*.docx"):
+            manifest["files"][file_path.name] = {"sha256": self._file_hash(file_path), "chunk_ids": []}
+        for chunk in chunks:
+            entry = manifest["files"].get(chunk["metadata"]["source_file"])
+            if entry is not None:
+                entry["chunk_ids"].append(chunk["id"])
+        return manifest
+    
+    def _file_hash(self, file_path: Path) -> str:
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha256.update(block)
+        return sha256.hexdigest()
+    
     def _generate_chunk_id(self, filename: str, chunk_index: int) -> str:
         content = f"{filename}_{chunk_index}"
         return hashlib.md5(content.encode()).hexdigest()
@@ -81,6 +250,24 @@ class DocumentProcessor:
         print(f"Chunk'lar {output_path} dosyasına kaydedildi.")
         print(f"Toplam {len(chunks)} chunk işlendi.")
     
+    def load_chunks_from_jsonl(self, input_file: str = "processed_chunks.jsonl") -> List[Dict[str, Any]]:
+        """Önceki çalıştırmada kaydedilmiş chunk'ları okur"""
+        chunks = []
+        with open(input_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    chunks.append(json.loads(line))
+        return chunks
+    
+    def load_manifest(self, manifest_file: str = MANIFEST_FILE) -> Dict[str, Any]:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def save_manifest(self, manifest: Dict[str, Any], manifest_file: str = MANIFEST_FILE):
+        with open(manifest_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        print(f"Manifest {manifest_file} dosyasına kaydedildi.")
+    
     def save_chunks_to_jsonl(self, chunks: List[Dict[str, Any]], output_file: str = "processed_chunks.jsonl"):
         """Chunk'ları JSONL dosyasına kaydeder"""
         output_path = Path(output_file)
@@ -92,11 +279,30 @@ class DocumentProcessor:
         print(f"Chunk'lar {output_path} dosyasına kaydedildi.")
         print(f"Toplam {len(chunks)} chunk işlendi.")
 
-def main():
-    processor = DocumentProcessor()
+def main(incremental: bool = True, max_workers: Optional[int] = None, embed: bool = False):
+    processor = DocumentProcessor(max_workers=max_workers)
     
-    print("Belgeler işleniyor...")
-    chunks = processor.process_documents()
+    # embed: her belgenin yeni/değişen chunk'ları, diğer belgeler hâlâ işlenirken embed edilir
+    embedder, store, embeddings, on_file = None, None, {}, None
+    if embed:
+        from embedding_processor import EmbeddingProcessor
+        embedder = EmbeddingProcessor()
+        store = embedder.load_vector_store("vector_database") if incremental else None
+        on_file = lambda file_path, file_chunks: embeddings.update(embedder.embed_new_chunks(file_chunks, store))
+    
+    # Manifest ve önceki chunk'lar varsa yalnızca değişen belgeler işlenir
+    if incremental and os.path.exists(MANIFEST_FILE) and os.path.exists("processed_chunks.jsonl"):
+        print("Belgeler artımlı olarak işleniyor...")
+        chunks, manifest, changes = processor.process_documents_incremental(
+            processor.load_chunks_from_jsonl(), processor.load_manifest(), on_file
+        )
+        if not (changes["added"] or changes["changed"] or changes["removed"] or changes["relabeled"]):
+            print("Değişiklik yok, chunk dosyaları güncel.")
+            return
+    else:
+        print("Belgeler işleniyor...")
+        chunks = processor.process_documents(on_file)
+        manifest = processor.build_manifest(chunks)
     
     if chunks:
         # JSON formatında kaydet
@@ -105,6 +311,8 @@ def main():
         # JSONL formatında da kaydet (RAG sistemleri için daha uygun)
         processor.save_chunks_to_jsonl(chunks)
         
+        processor.save_manifest(manifest)
+        
         # İstatistikler
         total_content_length = sum(len(chunk["content"]) for chunk in chunks)
         avg_chunk_size = total_content_length / len(chunks)
@@ -114,8 +322,20 @@ def main():
         print(f"- Toplam karakter sayısı: {total_content_length:,}")
         print(f"- Ortalama chunk boyutu: {avg_chunk_size:.0f} karakter")
         
+        if embedder is not None:
+            if store is None:
+                vector_store = embedder.build_vector_store(chunks, embedder.create_embeddings(chunks, embeddings))
+            else:
+                # Silinen chunk'lar çıkarılır, akışta hesaplanan embedding'ler upsert edilir
+                vector_store = embedder.update_vector_store(chunks, embeddings=embeddings, store=store)
+            vector_store.save("vector_database")
+        
     else:
         print("Hiç chunk oluşturulamadı!")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    # --full: manifest'i yok sayıp tüm belgeleri yeniden işler
+    # --serial: belgeleri tek süreçte işler
+    # --embed: chunk'ları işlenirken embed edip vektör veri tabanını da günceller
+    main(incremental="--full" not in sys.argv, max_workers=1 if "--serial" in sys.argv else None,
+         embed="--embed" in sys.argv) 
\ No newline at end of file
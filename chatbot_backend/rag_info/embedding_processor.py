@@ -1,11 +1,17 @@
 import json
 import numpy as np
-from pathlib import Path
-from typing import List, Dict, Any
-import pickle
+from typing import List, Dict, Any, Optional
 from sentence_transformers import SentenceTransformer
 import faiss
 import os
+import sys
+
+# Ana dizini Python path'ine ekle (ortak toplu embedding motoru için)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_embedder import BulkEmbedder
+from index_builder import select_index, build_index, candidate_configs, normalize_vectors
+from vector_store import VectorStore
 
 class EmbeddingProcessor:
     def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
@@ -13,6 +19,11 @@ class EmbeddingProcessor:
         self.model_name = model_name
         self.model = SentenceTransformer(model_name)
         self.vector_dimension = self.model.get_sentence_embedding_dimension()
+        # Uzunluğa göre sıralı, token bütçeli batch'ler; büyük işler CPU çekirdeklerine dağıtılır
+        self.embedder = BulkEmbedder(self.model, model_name)
+        # Son kurulan indeksin türü ve parametreleri (model_info.json'a yazılır)
+        self.index_config = None
+        self.recall_target = float(os.getenv("RAG_RECALL_TARGET", "0.95"))
         print(f"Model yüklendi: {model_name}")
         print(f"Vektör boyutu: {self.vector_dimension}")
         
@@ -24,85 +35,145 @@ class EmbeddingProcessor:
         print(f"{len(chunks)} chunk yüklendi")
         return chunks
     
-    def create_embeddings(self, chunks: List[Dict[str, Any]]) -> tuple:
-        texts = [chunk["content"] for chunk in chunks]
+    def create_embeddings(self, chunks: List[Dict[str, Any]],
+                          precomputed: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        """Chunk'ların embedding'leri; precomputed'da olanlar yeniden embed edilmez"""
+        precomputed = precomputed or {}
+        missing = [chunk for chunk in chunks if chunk["id"] not in precomputed]
         
         print("Embedding'ler oluşturuluyor...")
-        embeddings = self.model.encode(texts, show_progress_bar=True, batch_size=32)
+        encoded = self.embedder.encode([chunk["content"] for chunk in missing], show_progress_bar=bool(missing))
+        vectors = {**precomputed, **{chunk["id"]: vector for chunk, vector in zip(missing, encoded)}}
+        embeddings = np.zeros((len(chunks), self.vector_dimension), dtype=np.float32)
+        for position, chunk in enumerate(chunks):
+            embeddings[position] = vectors[chunk["id"]]
         
-        print(f"Embedding'ler oluşturuldu: {embeddings.shape}")
+        print(f"Embedding'ler oluşturuldu: {embeddings.shape} ({len(chunks) - len(missing)} hazır)")
         return embeddings
     
-    def create_faiss_index(self, embeddings: np.ndarray, index_type: str = "IVFFlat") -> faiss.Index:
-        """FAISS vektör indeksi oluşturur"""
+    def embed_new_chunks(self, chunks: List[Dict[str, Any]], store: Optional[VectorStore] = None
+                         ) -> Dict[str, np.ndarray]:
+        """Bir belgenin yeni ve içeriği değişen chunk'larını embed eder, {chunk id: embedding} döndürür.
+        
+        DocumentProcessor.process_files(on_file=...) ile her belge işlenir
+        işlenmez çağrılır; diğer belgeler bu sırada worker'larda okunur.
+        """
+        pending = []
+        for chunk in chunks:
+            previous = store.get(chunk["id"]) if store is not None else None
+            if previous is None or previous["content"] != chunk["content"]:
+                pending.append(chunk)
+        if not pending:
+            return {}
+        encoded = self.embedder.encode([chunk["content"] for chunk in pending])
+        return {chunk["id"]: vector for chunk, vector in zip(pending, encoded)}
+    
+    def build_vector_store(self, chunks: List[Dict[str, Any]], embeddings: np.ndarray) -> VectorStore:
+        """Tüm chunk'lar için indeksi seçip kurar ve chunk id'leriyle adreslenen depoyu oluşturur"""
+        index = self.create_faiss_index(embeddings)
+        return VectorStore.create(chunks, embeddings, index, self.index_config, self.model_name)
+    
+    def load_vector_store(self, output_dir: str = "vector_database") -> Optional[VectorStore]:
+        """Kayıtlı depo; yoksa, okunamıyorsa ya da başka modelle kurulmuşsa None"""
+        store = None
+        if VectorStore.exists(output_dir):
+            try:
+                store = VectorStore.load(output_dir)
+            except (ValueError, KeyError) as e:
+                print(f"Kayıtlı vektör deposu okunamadı: {e}")
+        if store is None or store.model_name != self.model_name:
+            print("Kayıtlı vektör deposu kullanılamıyor, tüm chunk'lar embed edilecek")
+            return None
+        return store
+    
+    def update_vector_store(self, chunks: List[Dict[str, Any]], output_dir: str = "vector_database",
+                            embeddings: Optional[Dict[str, np.ndarray]] = None,
+                            store: Optional[VectorStore] = None) -> VectorStore:
+        """Kayıtlı depoyu chunk listesine getirir; yalnızca yeni ve içeriği değişen chunk'lar embed edilir.
+        
+        Silinen chunk'lar indeksten id'leriyle çıkarılır, değişenler upsert
+        edilir; indeksin geri kalanı yeniden kurulmaz. Yalnızca metadata'sı
+        (ör. dönem etiketi) değişen chunk'lar kayıtlı embedding'leriyle güncellenir.
+        embeddings: ingestion sırasında embed_new_chunks ile hesaplananlar,
+        store: önceden load_vector_store ile açılmış depo.
+        """
+        if store is None:
+            store = self.load_vector_store(output_dir)
+        if store is None:
+            return self.build_vector_store(chunks, self.create_embeddings(chunks, embeddings))
+        
+        current_ids = {chunk["id"] for chunk in chunks}
+        removed_ids = [chunk["id"] for chunk in store.chunks if chunk["id"] not in current_ids]
+        changed_chunks = []
+        relabeled_chunks = []
+        for chunk in chunks:
+            previous = store.get(chunk["id"])
+            if previous is None or previous["content"] != chunk["content"]:
+                changed_chunks.append(chunk)
+            elif previous["metadata"] != chunk["metadata"]:
+                relabeled_chunks.append(chunk)
+        print(f"Yeni/değişen: {len(changed_chunks)}, yalnızca metadata: {len(relabeled_chunks)}, "
+              f"silinen: {len(removed_ids)}, değişmeyen: {len(chunks) - len(changed_chunks) - len(relabeled_chunks)}")
+        
+        previous_size = len(store)
+        store.delete(removed_ids)
+        if changed_chunks:
+            store.upsert(changed_chunks, self.create_embeddings(changed_chunks, embeddings))
+        if relabeled_chunks:
+            store.upsert(relabeled_chunks, np.stack([store.embedding(chunk["id"]) for chunk in relabeled_chunks]))
+        
+        # Korpus yeni bir boyut aralığına geçtiyse indeks türü yeniden seçilir
+        if (len(candidate_configs(previous_size, self.vector_dimension))
+                != len(candidate_configs(len(store), self.vector_dimension))):
+            print("Korpus boyutu değişti, indeks türü yeniden seçiliyor")
+            store.replace_index(self.create_faiss_index(store.embeddings), self.index_config)
+        self.index_config = store.index_config
+        print(f"Vektör deposu güncellendi: {store.index.ntotal} vektör")
+        return store
+    
+    def create_faiss_index(self, embeddings: np.ndarray, index_type: str = "auto") -> faiss.Index:
+        """FAISS vektör indeksi oluşturur.
+        
+        Vektörler L2 normalize edilir (iç çarpım = kosinüs benzerliği).
+        "auto": korpus boyutuna göre Flat/IVFFlat/HNSW/IVFPQ arasından hedef
+        recall'u (RAG_RECALL_TARGET) sağlayan en hızlısı seçilir.
+        """
         print(f"FAISS indeksi oluşturuluyor (tip: {index_type})...")
         
-        if index_type == "IVFFlat":
-           
-            nlist = min(100, len(embeddings) // 10)  # Cluster sayısı
-            quantizer = faiss.IndexFlatIP(self.vector_dimension)
-            index = faiss.IndexIVFFlat(quantizer, self.vector_dimension, nlist, faiss.METRIC_INNER_PRODUCT)
-            
-            # Eğitim verisi ile indeksi eğit
-            if len(embeddings) > nlist:
-                index.train(embeddings)
-            
+        if index_type == "auto":
+            index, self.index_config, report = select_index(embeddings, recall_target=self.recall_target)
+            for entry in report:
+                print(f"  {entry['config']['type']}: recall@5={entry['recall']:.3f}, "
+                      f"p50={entry['p50_ms']:.3f} ms, p99={entry['p99_ms']:.3f} ms")
+        elif index_type == "IVFFlat":
+            nlist = max(1, min(100, len(embeddings) // 10))  # Cluster sayısı
+            self.index_config = {"type": "IVFFlat", "nlist": nlist, "search_params": {}}
+            index = build_index(normalize_vectors(embeddings), self.index_config)
         elif index_type == "Flat":
             # Basit flat indeks (tam arama)
-            index = faiss.IndexFlatIP(self.vector_dimension)
-            
+            self.index_config = {"type": "Flat", "search_params": {}}
+            index = build_index(normalize_vectors(embeddings), self.index_config)
         else:
             raise ValueError(f"Desteklenmeyen indeks tipi: {index_type}")
         
-        # Embedding'leri indekse ekle
-        index.add(embeddings.astype('float32'))
-        print(f"İndeks oluşturuldu: {index.ntotal} vektör eklendi")
+        print(f"İndeks oluşturuldu ({self.index_config['type']}, {self.index_config['search_params']}): "
+              f"{index.ntotal} vektör eklendi")
         
         return index
     
-    def save_vector_database(self, index: faiss.Index, chunks: List[Dict[str, Any]], 
-                           output_dir: str = "vector_database"):
-        """Vektör veri tabanını kaydeder"""
-        output_path = Path(output_dir)
-        output_path.mkdir(exist_ok=True)
-        
-        # FAISS indeksini kaydesder
-        faiss.write_index(index, str(output_path / "faiss_index.bin"))
-        
-        with open(output_path / "chunks_metadata.json", 'w', encoding='utf-8') as f:
-            json.dump(chunks, f, ensure_ascii=False, indent=2)
-        
-        #Model bilgilerini kaydet
-        model_info = {
-            "model_name": self.model_name,
-            "vector_dimension": self.vector_dimension,
-            "total_vectors": len(chunks),
-            "index_type": "IVFFlat"
-        }
-        
-        with open(output_path / "model_info.json", 'w', encoding='utf-8') as f:
-            json.dump(model_info, f, ensure_ascii=False, indent=2)
-        
-        print(f"Vektör veri tabanı kaydedildi: {output_path}")
-    
-    def test_similarity_search(self, index: faiss.Index, chunks: List[Dict[str, Any]], 
-                             query: str = "hamilelik belirtileri", top_k: int = 5):
+    def test_similarity_search(self, store: VectorStore, query: str = "hamilelik belirtileri", top_k: int = 5):
         print(f"\nTest araması: '{query}'")
         
-        # Sorgu embedding'i oluştur
-        query_embedding = self.model.encode([query])
-        
-        # En yakın vektörleri bul
-        distances, indices = index.search(query_embedding.astype('float32'), top_k)
+        # En yakın chunk'ları bul
+        results = store.search(self.model.encode([query]), top_k)
         
         print(f"En yakın {top_k} sonuç:")
-        for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-            chunk = chunks[idx]
+        for i, (chunk, distance) in enumerate(results):
             print(f"\n{i+1}. Benzerlik: {distance:.4f}")
             print(f"   Dosya: {chunk['metadata']['source_file']}")
             print(f"   İçerik: {chunk['content'][:200]}...")
 
-def main():
+def main(incremental: bool = True):
     processor = EmbeddingProcessor()
     
     chunks = processor.load_chunks()
@@ -111,20 +182,22 @@ def main():
         print("Chunk bulunamadı!")
         return
     
-    # Embedding'leri oluştur
-    embeddings = processor.create_embeddings(chunks)
-    
-    # FAISS indeksi oluştur
-    index = processor.create_faiss_index(embeddings)
+    if incremental:
+        # Yalnızca yeni/değişen chunk'ları embed et, indeksi id'leriyle yerinde güncelle
+        store = processor.update_vector_store(chunks)
+    else:
+        # Embedding'leri oluştur ve indeksi baştan kur
+        store = processor.build_vector_store(chunks, processor.create_embeddings(chunks))
     
-    # Vektör veri tabanını kaydet
-    processor.save_vector_database(index, chunks)
+    # Vektör veri tabanını yeni bir sürüm olarak kaydet
+    store.save("vector_database")
     
     # Test araması yap
-    processor.test_similarity_search(index, chunks)
+    processor.test_similarity_search(store)
     
     print("\nEmbedding işlemi tamamlandı!")
     print("Vektör veri tabanı 'vector_database' klasöründe oluşturuldu.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    # --full: önbelleği yok sayıp tüm chunk'ları yeniden embed eder
+    main(incremental="--full" not in sys.argv) 
\ No newline at end of file
@@ -0,0 +1,236 @@
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+import faiss
+
+# Korpus boyutuna göre denenecek indeks türleri için eşikler
+IVF_MIN_VECTORS = 5_000
+HNSW_MIN_VECTORS = 20_000
+IVFPQ_MIN_VECTORS = 200_000
+
+# Ayar taramasında denenecek nprobe / efSearch değerleri
+NPROBE_CANDIDATES = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+EF_SEARCH_CANDIDATES = [16, 32, 64, 128, 256, 512]
+
+
+def normalize_vectors(embeddings: np.ndarray) -> np.ndarray:
+    """Vektörleri L2 normalize eder; iç çarpım böylece kosinüs benzerliği olur"""
+    vectors = np.ascontiguousarray(embeddings, dtype=np.float32).copy()
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def candidate_configs(n_vectors: int, dimension: int) -> List[Dict[str, Any]]:
+    """Korpus boyutuna uygun indeks yapılandırmalarını döndürür (Flat her zaman dahil)"""
+    configs = [{"type": "Flat"}]
+    nlist = _default_nlist(n_vectors)
+    if n_vectors >= IVF_MIN_VECTORS:
+        configs.append({"type": "IVFFlat", "nlist": nlist})
+    if n_vectors >= HNSW_MIN_VECTORS:
+        configs.append({"type": "HNSW", "M": 32, "efConstruction": 200})
+    if n_vectors >= IVFPQ_MIN_VECTORS:
+        configs.append({"type": "IVFPQ", "nlist": nlist, "m": _pq_subquantizers(dimension), "nbits": 8})
+    return configs
+
+
+def build_index(vectors: np.ndarray, config: Dict[str, Any], ids: Optional[np.ndarray] = None) -> faiss.Index:
+    """Normalize vektörlerden yapılandırmaya göre iç çarpım indeksi kurar.
+
+    ids verilirse vektörler bu id'lerle eklenir (bkz. with_ids).
+    """
+    dimension = vectors.shape[1]
+    index_type = config["type"]
+
+    if index_type == "Flat":
+        index = faiss.IndexFlatIP(dimension)
+    elif index_type == "IVFFlat":
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFFlat(quantizer, dimension, config["nlist"], faiss.METRIC_INNER_PRODUCT)
+    elif index_type == "HNSW":
+        index = faiss.IndexHNSWFlat(dimension, config["M"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = config["efConstruction"]
+    elif index_type == "IVFPQ":
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, config["nlist"], config["m"], config["nbits"],
+                                 faiss.METRIC_INNER_PRODUCT)
+    else:
+        raise ValueError(f"Desteklenmeyen indeks tipi: {index_type}")
+
+    if not index.is_trained:
+        index.train(vectors)
+    if ids is not None:
+        index = with_ids(index, vectors, ids)
+    else:
+        index.add(vectors)
+    apply_search_params(index, config.get("search_params", {}))
+    return index
+
+
+def with_ids(index: faiss.Index, vectors: np.ndarray, ids: np.ndarray) -> faiss.Index:
+    """Kurulmuş bir indeksi vektörleri verilen id'lerle adreslenen indekse çevirir.
+
+    İndeks boşaltılıp vektörler id'leriyle yeniden eklenir; eğitim (IVF
+    kümeleri, PQ kod kitapları) ve arama parametreleri korunur. IVF indeksleri
+    id'leri kendi listelerinde tutar. Diğerleri IndexIDMap2 ile sarılır;
+    IndexIDMap silmede iç indeksin pozisyonları Flat gibi kaydırdığını
+    varsaydığı için IVF'de kullanılmaz.
+    """
+    index.reset()
+    ids = np.asarray(ids, dtype=np.int64)
+    if isinstance(index, faiss.IndexIVF):
+        index.add_with_ids(vectors, ids)
+        return index
+    id_index = faiss.IndexIDMap2(index)
+    id_index.add_with_ids(vectors, ids)
+    return id_index
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """IndexIDMap gibi sarmalayıcıların içindeki asıl indeks"""
+    while isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def apply_search_params(index: faiss.Index, search_params: Dict[str, Any]):
+    """Kaydedilmiş arama parametrelerini (nprobe, efSearch) indekse uygular"""
+    if not search_params:
+        return
+    if "nprobe" in search_params:
+        ivf_index = faiss.try_extract_index_ivf(index)
+        if ivf_index is not None:
+            ivf_index.nprobe = int(search_params["nprobe"])
+    if "efSearch" in search_params:
+        hnsw_index = base_index(index)
+        if hasattr(hnsw_index, "hnsw"):
+            hnsw_index.hnsw.efSearch = int(search_params["efSearch"])
+
+
+def selector_search_params(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """ID seçicili arama parametreleri; indeksin kayıtlı nprobe/efSearch ayarları korunur.
+
+    IndexIDMap'te seçici chunk id'leriyle çalışır, parametreler içteki indekse göre seçilir.
+    """
+    index = base_index(index)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def exact_neighbors(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Recall ölçümü için tam (Flat) arama sonuçları"""
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    _, indices = index.search(queries, k)
+    return indices
+
+
+def measure(index: faiss.Index, queries: np.ndarray, ground_truth: np.ndarray, k: int) -> Dict[str, float]:
+    """recall@k ve tek sorgu gecikmesinin p50/p99 değerlerini (ms) ölçer"""
+    latencies = []
+    hits = 0
+    for query, truth in zip(queries, ground_truth):
+        start = time.perf_counter()
+        _, indices = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(indices[0].tolist()) & set(truth.tolist()))
+    return {
+        "recall": hits / float(ground_truth.size),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99))
+    }
+
+
+def tune_search_params(index: faiss.Index, config: Dict[str, Any], queries: np.ndarray,
+                       ground_truth: np.ndarray, k: int, recall_target: float) -> Dict[str, Any]:
+    """Hedef recall'a ulaşan en küçük nprobe/efSearch değerini bulur.
+
+    Hedefe ulaşılamazsa en yüksek recall'u veren değer seçilir.
+    """
+    if config["type"] in ("IVFFlat", "IVFPQ"):
+        name, candidates = "nprobe", [value for value in NPROBE_CANDIDATES if value <= config["nlist"]]
+    elif config["type"] == "HNSW":
+        name, candidates = "efSearch", [value for value in EF_SEARCH_CANDIDATES if value >= k]
+    else:
+        return {"search_params": {}, **measure(index, queries, ground_truth, k)}
+
+    best = None
+    for value in candidates:
+        apply_search_params(index, {name: value})
+        result = {"search_params": {name: value}, **measure(index, queries, ground_truth, k)}
+        if best is None or result["recall"] > best["recall"]:
+            best = result
+        if result["recall"] >= recall_target:
+            best = result
+            break
+    apply_search_params(index, best["search_params"])
+    return best
+
+
+def sample_queries(vectors: np.ndarray, n_queries: int, seed: int = 42) -> np.ndarray:
+    """Korpustan örneklenen vektörlere küçük gürültü ekleyerek benchmark sorguları üretir"""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)
+    noise = rng.normal(scale=0.05, size=(len(rows), vectors.shape[1])).astype(np.float32)
+    return normalize_vectors(vectors[rows] + noise)
+
+
+def evaluate_configs(vectors: np.ndarray, configs: List[Dict[str, Any]], k: int = 5,
+                     recall_target: float = 0.95, n_queries: int = 200,
+                     queries: Optional[np.ndarray] = None) -> List[Tuple[Dict[str, Any], faiss.Index, Dict[str, Any]]]:
+    """Her yapılandırmayı kurar, arama parametrelerini ayarlar ve ölçer"""
+    if queries is None:
+        queries = sample_queries(vectors, n_queries)
+    k = min(k, len(vectors))
+    ground_truth = exact_neighbors(vectors, queries, k)
+
+    results = []
+    for config in configs:
+        start = time.perf_counter()
+        index = build_index(vectors, config)
+        build_seconds = time.perf_counter() - start
+        report = tune_search_params(index, config, queries, ground_truth, k, recall_target)
+        report["build_seconds"] = build_seconds
+        results.append(({**config, "search_params": report["search_params"]}, index, report))
+    return results
+
+
+def select_index(embeddings: np.ndarray, recall_target: float = 0.95, k: int = 5,
+                 n_queries: int = 200) -> Tuple[faiss.Index, Dict[str, Any], List[Dict[str, Any]]]:
+    """Hedef recall'u sağlayan en düşük p50 gecikmeli indeksi seçer.
+
+    Vektörler L2 normalize edilir. Küçük korpuslarda yalnızca Flat (tam arama)
+    denenir. (indeks, model_info'ya yazılacak yapılandırma, benchmark raporu) döndürür.
+    """
+    vectors = normalize_vectors(embeddings)
+    configs = candidate_configs(len(vectors), vectors.shape[1])
+
+    if len(configs) == 1:
+        config = {**configs[0], "search_params": {}}
+        return build_index(vectors, config), config, []
+
+    results = evaluate_configs(vectors, configs, k, recall_target, n_queries)
+    eligible = [result for result in results if result[2]["recall"] >= recall_target]
+    config, index, _ = min(eligible or results, key=lambda result: (result[2]["p50_ms"], -result[2]["recall"]))
+
+    report = [{"config": result[0], **{key: value for key, value in result[2].items() if key != "search_params"}}
+              for result in results]
+    return index, config, report
+
+
+def _default_nlist(n_vectors: int) -> int:
+    # Yaygın kural: ~4*sqrt(N) küme, her kümede eğitim için yeterli vektör kalacak şekilde
+    return int(max(1, min(4 * np.sqrt(n_vectors), n_vectors // 39)))
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    # Alt vektör başına ~8 boyut; boyutu tam bölen en büyük değer
+    for m in range(max(1, dimension // 8), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
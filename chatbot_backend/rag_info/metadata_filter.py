@@ -0,0 +1,136 @@
+import re
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+# Chunk'lara ingestion sırasında atanan dönem etiketleri
+STAGES = ("pregnancy", "postpartum", "general")
+
+# Anahtar kelimeler tam kelime olarak (isteğe bağlı çoğul "s" ile) eşleşir;
+# "*" ile biten kökler devamındaki harfleri de kapsar (pregnan* -> pregnant, pregnancy)
+STAGE_KEYWORDS = {
+    "pregnancy": [
+        "pregnan*", "trimester", "prenatal", "antenatal", "fetus", "fetal", "gestation*", "expecting",
+        "labor", "labour", "contraction", "ultrasound", "preeclampsia", "morning sickness", "miscarriage"
+    ],
+    "postpartum": [
+        "postpartum", "postnatal", "after birth", "after delivery", "after childbirth", "puerper*", "lochia",
+        "breastfeed*", "breast milk", "lactation", "newborn", "infant", "baby blues", "c-section recovery"
+    ]
+}
+
+# Filtrelenebilen metadata alanları
+FILTER_FIELDS = ("source_file", "stage", "tags")
+
+
+def _keyword_pattern(keyword: str) -> str:
+    if keyword.endswith("*"):
+        return re.escape(keyword[:-1]) + r"\w*"
+    return re.escape(keyword) + "s?"
+
+
+# Kelime sınırlı; "labor" "laboratory" ya da "elaborate" içinde eşleşmez
+_KEYWORD_PATTERNS = {
+    stage: re.compile(r"\b(?:" + "|".join(_keyword_pattern(keyword) for keyword in keywords) + r")\b")
+    for stage, keywords in STAGE_KEYWORDS.items()
+}
+
+
+def detect_stage(text: str) -> str:
+    """Metnin hamilelik mi doğum sonrası mı olduğunu anahtar kelime sayısıyla belirler.
+
+    Bir dönemin eşleşmesi diğerinin en az iki katı değilse "general" döner.
+    """
+    text = text.lower()
+    pregnancy = len(_KEYWORD_PATTERNS["pregnancy"].findall(text))
+    postpartum = len(_KEYWORD_PATTERNS["postpartum"].findall(text))
+    if pregnancy > 0 and pregnancy >= 2 * postpartum:
+        return "pregnancy"
+    if postpartum > 0 and postpartum >= 2 * pregnancy:
+        return "postpartum"
+    return "general"
+
+
+def stage_filter(stage: Optional[str]) -> Optional[Dict[str, List[str]]]:
+    """Belirli bir döneme ait ve genel chunk'ları seçen filtre (dönem yoksa None)"""
+    if stage not in ("pregnancy", "postpartum"):
+        return None
+    return {"stage": [stage, "general"]}
+
+
+def normalize_filters(filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, List[Any]]]:
+    """{alan: değer ya da değer listesi} filtresini doğrular, boş alanları atar"""
+    if not filters:
+        return None
+    normalized = {}
+    for field, values in filters.items():
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"Desteklenmeyen filtre alanı: {field}")
+        if values is None:
+            continue
+        normalized[field] = list(values) if isinstance(values, (list, tuple, set)) else [values]
+    return normalized or None
+
+
+class MetadataPartitions:
+    """Filtre alanlarının her değeri için chunk pozisyonlarını (sıralı int64) tutar.
+
+    Snapshot yüklenirken bir kez kurulur; filtreli sorgular bu listelerin
+    birleşim/kesişimiyle aday kümesini metadata'yı taramadan bulur.
+    Aynı alan içindeki değerler VEYA, farklı alanlar VE ile birleştirilir.
+    """
+
+    def __init__(self, postings: Dict[str, Dict[Any, np.ndarray]], n_chunks: int):
+        self.postings = postings
+        self.n_chunks = n_chunks
+
+    @classmethod
+    def build(cls, chunks) -> "MetadataPartitions":
+        postings: Dict[str, Dict[Any, List[np.ndarray]]] = {field: {} for field in FILTER_FIELDS}
+
+        dictionary = getattr(chunks, "dictionary", None)
+        for field in FILTER_FIELDS:
+            coded = dictionary(field) if dictionary is not None else None
+            if coded is not None:
+                # Sözlük kodlamalı sütun (ChunkStore): kodlara göre tek sıralamayla bölünür
+                codes, values = coded
+                codes = np.asarray(codes)
+                order = np.argsort(codes, kind="stable").astype(np.int64)
+                boundaries = np.cumsum(np.bincount(codes, minlength=len(values)))[:-1]
+                entries = list(zip(values, np.split(order, boundaries)))
+            else:
+                by_value: Dict[Any, List[int]] = {}
+                for position in range(len(chunks)):
+                    value = chunks[position]["metadata"].get(field)
+                    for item in (value if isinstance(value, list) else [value]):
+                        by_value.setdefault(item, []).append(position)
+                entries = [(value, np.asarray(positions, dtype=np.int64)) for value, positions in by_value.items()]
+
+            for value, positions in entries:
+                # Etiket alanında değer bir listedir; her etiket ayrı bölümdür
+                for item in (value if isinstance(value, list) else [value]):
+                    if item is not None:
+                        postings[field].setdefault(item, []).append(positions)
+
+        return cls({
+            field: {value: np.unique(np.concatenate(parts)).astype(np.int64) for value, parts in values.items()}
+            for field, values in postings.items()
+        }, len(chunks))
+
+    def positions(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Filtreye uyan chunk pozisyonları; filtre yoksa None (tüm chunk'lar)"""
+        filters = normalize_filters(filters)
+        if filters is None:
+            return None
+        selected = None
+        for field, values in filters.items():
+            parts = [self.postings[field][value] for value in values if value in self.postings[field]]
+            field_positions = np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+            selected = field_positions if selected is None else np.intersect1d(selected, field_positions)
+        return selected
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        return {
+            field: {str(value): len(positions) for value, positions in values.items()}
+            for field, values in self.postings.items() if field != "source_file"
+        }
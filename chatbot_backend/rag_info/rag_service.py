@@ -0,0 +1,285 @@
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# rag_info dizinini Python path'ine ekle
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sentence_transformers import SentenceTransformer
+
+from rag_system import RAGSystem, IndexSnapshot, load_index_snapshot, load_llm, DEFAULT_VECTOR_DB_PATH
+from reranker import CrossEncoderReranker
+from vector_store import VERSIONS_DIR, current_version, activate_version, list_versions, check_version
+
+# RAG_RERANKER=<cross-encoder model adı> ile aday chunk'lar yeniden sıralanır
+RAG_RERANKER = os.getenv("RAG_RERANKER", "")
+
+# 0'dan büyükse CURRENT bu aralıkla (saniye) kontrol edilir, yeni sürüm arka planda yüklenip devreye alınır
+RAG_INDEX_WATCH_SECONDS = float(os.getenv("RAG_INDEX_WATCH_SECONDS", "0"))
+
+
+class RAGService:
+    """Sunucu boyunca yaşayan RAG servisi.
+
+    Embedding modeli, FAISS indeksi (metadata ile birlikte) ve LLM ayrı ayrı
+    yüklenir. İndeks LLM yeniden yüklenmeden değiştirilebilir, embedding modeli
+    dışarıdan verilebilir ya da diğer bileşenlerle paylaşılabilir.
+    """
+
+    def __init__(self,
+                 llm_model_path: str = "stabilityai/stablelm-2-zephyr-1_6b",
+                 embedding_model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 vector_db_path: Optional[str] = None,
+                 embedding_model=None,
+                 decoder_factory=None,
+                 llm_factory=None,
+                 reranker=None,
+                 watch_interval: float = RAG_INDEX_WATCH_SECONDS):
+        """decoder_factory(model, tokenizer) verilirse RAGSystem'in token üreticisi olarak kullanılır
+        (ör. GenerationScheduler ile batch'li üretim). llm_factory() verilirse LLM kendi
+        kopyası yerine ondan alınır (ör. paylaşılan base model). reranker verilmezse RAG_RERANKER
+        ayarlıysa o model ile oluşturulur. watch_interval > 0 ise yeni indeks sürümleri
+        otomatik olarak devreye alınır."""
+        self.llm_model_path = llm_model_path
+        self.embedding_model_name = embedding_model_name
+        self.vector_db_path = Path(vector_db_path) if vector_db_path is not None else DEFAULT_VECTOR_DB_PATH
+
+        self.embedding_model = embedding_model
+        self.decoder_factory = decoder_factory
+        self.llm_factory = llm_factory
+        if reranker is None and RAG_RERANKER:
+            reranker = CrossEncoderReranker(RAG_RERANKER)
+        self.reranker = reranker
+        self.tokenizer = None
+        self.model = None
+        self.snapshot: Optional[IndexSnapshot] = None
+        self._system: Optional[RAGSystem] = None
+
+        # Her bileşen kendi kilidiyle yüklenir, biri yüklenirken diğerleri kullanılabilir
+        self._embedder_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._llm_lock = threading.Lock()
+        self._system_lock = threading.Lock()
+
+        self.load_times: Dict[str, float] = {}
+        self.last_error: Optional[str] = None
+
+        # Arka planda indeks yenileme durumu (/api/health ve /api/rag/versions için)
+        self.reload_state: Dict[str, Any] = {"state": "idle"}
+        self._reload_lock = threading.Lock()
+        self._reload_thread: Optional[threading.Thread] = None
+        self._watcher: Optional[threading.Thread] = None
+        if watch_interval > 0:
+            self.start_index_watcher(watch_interval)
+
+    def load_embedder(self):
+        """Embedding modelini (yoksa) yükler ve döndürür"""
+        if self.embedding_model is not None:
+            return self.embedding_model
+        with self._embedder_lock:
+            if self.embedding_model is None:
+                start_time = time.time()
+                print("Embedding modeli yükleniyor...")
+                self.embedding_model = SentenceTransformer(self.embedding_model_name)
+                self.load_times["embedder"] = time.time() - start_time
+        return self.embedding_model
+
+    def set_embedder(self, embedding_model):
+        """Başka bir bileşenin embedding modelini paylaşır"""
+        with self._embedder_lock:
+            self.embedding_model = embedding_model
+            if self._system is not None:
+                self._system.embedding_model = embedding_model
+
+    def load_index(self) -> IndexSnapshot:
+        """İndeksi (yoksa) yükler ve döndürür"""
+        if self.snapshot is not None:
+            return self.snapshot
+        with self._index_lock:
+            if self.snapshot is None:
+                start_time = time.time()
+                self.snapshot = load_index_snapshot(self.vector_db_path)
+                self.load_times["index"] = time.time() - start_time
+        return self.snapshot
+
+    def reload_index(self, vector_db_path: Optional[str] = None, version: Optional[str] = None) -> IndexSnapshot:
+        """İndeksi ve metadata'yı yeniden yükleyip değiştirir, LLM'e dokunmaz.
+
+        Yeni snapshot tamamen yüklendikten sonra tek atamayla devreye girer;
+        devam eden sorgular eski snapshot ile tamamlanır. version verilirse
+        (ör. geri alma) o sürüm yüklenir ve CURRENT da o sürüme çevrilir.
+        """
+        with self._index_lock:
+            if vector_db_path is not None:
+                self.vector_db_path = Path(vector_db_path)
+            start_time = time.time()
+            try:
+                if version is not None:
+                    # İstekten gelen ad, yol oluşturulmadan önce diskteki sürümlerle doğrulanır
+                    version = check_version(self.vector_db_path, version)
+                    snapshot = load_index_snapshot(self.vector_db_path / VERSIONS_DIR / version)
+                    activate_version(self.vector_db_path, version)
+                else:
+                    snapshot = load_index_snapshot(self.vector_db_path)
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            self.snapshot = snapshot
+            if self._system is not None:
+                self._system.snapshot = snapshot
+            self.load_times["index"] = time.time() - start_time
+        print(f"✅ RAG indeksi yenilendi: {snapshot.version or snapshot.path} ({snapshot.index.ntotal} vektör)")
+        return snapshot
+
+    def reload_index_async(self, version: Optional[str] = None) -> bool:
+        """Yeni snapshot'ı arka planda yükleyip devreye alır.
+
+        Yükleme sürerken sorgular mevcut snapshot ile yanıtlanmaya devam eder.
+        Zaten bir yenileme sürüyorsa False döner; geçersiz sürümde ValueError fırlatır.
+        """
+        if version is not None:
+            check_version(self.vector_db_path, version)
+        with self._reload_lock:
+            if self._reload_thread is not None and self._reload_thread.is_alive():
+                return False
+            self.reload_state = {
+                "state": "loading",
+                "version": version or current_version(self.vector_db_path),
+                "started_at": datetime.now().isoformat()
+            }
+            self._reload_thread = threading.Thread(target=self._background_reload, args=(version,), daemon=True)
+            self._reload_thread.start()
+        return True
+
+    def _background_reload(self, version: Optional[str]):
+        try:
+            snapshot = self.reload_index(version=version)
+            self.reload_state = {
+                **self.reload_state,
+                "state": "idle",
+                "version": snapshot.version,
+                "finished_at": datetime.now().isoformat()
+            }
+        except Exception as e:
+            self.reload_state = {
+                **self.reload_state,
+                "state": "failed",
+                "error": str(e),
+                "finished_at": datetime.now().isoformat()
+            }
+            print(f"❌ RAG indeksi yenilenemedi: {e}")
+
+    def start_index_watcher(self, interval: float) -> threading.Thread:
+        """CURRENT değiştiğinde yeni sürümü arka planda yükleyen iş parçacığını başlatır"""
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch_index, args=(interval,), daemon=True)
+            self._watcher.start()
+        return self._watcher
+
+    def _watch_index(self, interval: float):
+        while True:
+            time.sleep(interval)
+            snapshot = self.snapshot
+            # İndeks henüz yüklenmediyse ilk istekte zaten güncel sürüm yüklenir
+            if snapshot is None:
+                continue
+            version = current_version(self.vector_db_path)
+            if version is None or version == snapshot.version:
+                continue
+            # Yüklenemeyen bir sürüm, CURRENT yeniden değişene kadar tekrar denenmez
+            if self.reload_state.get("state") == "failed" and self.reload_state.get("version") == version:
+                continue
+            self.reload_index_async()
+
+    def versions(self) -> Dict[str, Any]:
+        """Diskteki indeks sürümleri, etkin (CURRENT) ve sunulan sürüm"""
+        snapshot = self.snapshot
+        return {
+            "current": current_version(self.vector_db_path),
+            "serving": snapshot.version if snapshot is not None else None,
+            "versions": list_versions(self.vector_db_path),
+            "reload": self.reload_state
+        }
+
+    def set_llm(self, tokenizer, model):
+        """Başka bir bileşenin yüklediği LLM'i kullanır (ör. paylaşılan base model)"""
+        with self._llm_lock:
+            self.tokenizer = tokenizer
+            self.model = model
+
+    def load_llm(self):
+        """Tokenizer ve LLM'i (yoksa) yükler"""
+        if self.model is not None:
+            return self.tokenizer, self.model
+        with self._llm_lock:
+            if self.model is None:
+                start_time = time.time()
+                if self.llm_factory is not None:
+                    tokenizer, model = self.llm_factory()
+                else:
+                    tokenizer, model = load_llm(self.llm_model_path)
+                self.tokenizer = tokenizer
+                self.model = model
+                self.load_times["llm"] = time.time() - start_time
+        return self.tokenizer, self.model
+
+    def get_system(self) -> RAGSystem:
+        """Tüm bileşenleri yüklenmiş, paylaşılan RAGSystem örneğini döndürür"""
+        if self._system is not None:
+            return self._system
+        with self._system_lock:
+            if self._system is None:
+                try:
+                    embedding_model = self.load_embedder()
+                    snapshot = self.load_index()
+                    tokenizer, model = self.load_llm()
+                    if self.reranker is not None:
+                        self.reranker.load()
+                except Exception as e:
+                    self.last_error = str(e)
+                    raise
+                self._system = RAGSystem(
+                    llm_model_path=self.llm_model_path,
+                    embedding_model_name=self.embedding_model_name,
+                    vector_db_path=str(self.vector_db_path),
+                    embedding_model=embedding_model,
+                    tokenizer=tokenizer,
+                    model=model,
+                    snapshot=snapshot,
+                    reranker=self.reranker,
+                    decoder=self.decoder_factory(model, tokenizer) if self.decoder_factory is not None else None
+                )
+        return self._system
+
+    def warmup(self, background: bool = True):
+        """Bileşenleri önceden yükler (isteğe bağlı olarak arka planda)"""
+        if background:
+            thread = threading.Thread(target=self._safe_warmup, daemon=True)
+            thread.start()
+            return thread
+        self.get_system()
+
+    def _safe_warmup(self):
+        try:
+            self.get_system()
+        except Exception as e:
+            print(f"❌ RAG ön yüklemesi başarısız: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        """Bileşenlerin yükleme durumunu döndürür (/api/health için)"""
+        snapshot = self.snapshot
+        return {
+            "embedder_loaded": self.embedding_model is not None,
+            "index_loaded": snapshot is not None,
+            "llm_loaded": self.model is not None,
+            "ready": self._system is not None,
+            "index": snapshot.info() if snapshot is not None else None,
+            "index_reload": self.reload_state,
+            "reranker": self.reranker.stats() if self.reranker is not None else None,
+            "load_times": {name: round(seconds, 2) for name, seconds in self.load_times.items()},
+            "last_error": self.last_error
+        }
@@ -1,6 +1,8 @@
 import json
 import torch
 import os
+import sys
+from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 import faiss
@@ -8,177 +10,431 @@ from transformers import AutoTokenizer, AutoModelForCausalLM
 from sentence_transformers import SentenceTransformer
 import numpy as np
 
+# Ana dizini Python path'ine ekle (ortak streaming decoder için)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming_decoder import StreamingDecoder, SamplingParams
+from prefix_cache import PrefixKVCache, prompt_prefix
+from cpu_backend import optimize_for_cpu
+
+# rag_info dizinini Python path'ine ekle (indeks yardımcıları için)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from index_builder import apply_search_params, normalize_vectors, selector_search_params
+from chunk_store import ChunkStore, read_index_mmap
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from context_packer import ContextPacker
+from metadata_filter import MetadataPartitions, detect_stage, stage_filter
+from vector_store import resolve_snapshot_dir, verify_snapshot, chunk_int_ids
+
+# RAG_MMAP=0 ile kompakt depo yerine JSON metadata ve bellekteki indeks kullanılır
+RAG_MMAP = os.getenv("RAG_MMAP", "1") == "1"
+
+# RAG_HYBRID=0 ile yalnızca dense (FAISS) arama yapılır
+RAG_HYBRID = os.getenv("RAG_HYBRID", "1") == "1"
+# Hibrit aramada her koldan top_k * bu kadar aday alınıp RRF ile birleştirilir
+HYBRID_CANDIDATE_FACTOR = 4
+
+# Filtreye uyan chunk sayısı bunun altındaysa indeks yerine embedding'leri doğrudan taranır
+EXACT_SCAN_MAX = int(os.getenv("RAG_EXACT_SCAN_MAX", "4096"))
+
+# RAG_STAGE_FILTER=1 ile dönem belirtilmemiş sorguların dönemi sorgu metninden tahmin edilir
+RAG_STAGE_FILTER = os.getenv("RAG_STAGE_FILTER", "0") == "1"
+
+# RAG_VERIFY_CHECKSUMS=1 ile snapshot yüklenirken dosyaların sha256 özetleri de doğrulanır
+RAG_VERIFY_CHECKSUMS = os.getenv("RAG_VERIFY_CHECKSUMS", "0") == "1"
+
+# Reranker kullanılırken cross-encoder'a verilecek aday sayısı
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "20"))
+
+# Context'e ayrılacak en fazla token (0: yalnızca modelin bağlam penceresi sınırlar)
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1536"))
+
+# Yanıtlar context'ten uzun parçalar aktardığı için her adımda context'teki n-gram
+# eşleşmesinden bu kadar taslak token tek forward'da doğrulanır (0: kapalı)
+RAG_PROMPT_LOOKUP_TOKENS = int(os.getenv("RAG_PROMPT_LOOKUP_TOKENS", "10"))
+
+PROMPT_TEMPLATE = """<|system|>
+You are an expert health consultant specializing in pregnancy and postpartum care.
+Use the following information to answer questions. Provide complete, helpful responses.
+Never mention sources, references, or file names in your response.
+Always give complete answers without cutting off mid-sentence.
+
+{context}
+
+<|user|>
+{query}
+
+<|assistant|>"""
+
+DEFAULT_VECTOR_DB_PATH = Path(__file__).parent / "vector_database"
+
+
+class IndexSnapshot:
+    """FAISS indeksi ve ona ait chunk metadata'sını birlikte tutar.
+
+    İndeks ve metadata her zaman tek nesne olarak değiştirilir; bir sorgu
+    başladığı snapshot ile biter.
+    """
+
+    def __init__(self, index: faiss.Index, chunks: List[Dict[str, Any]], path: Path,
+                 index_config: Optional[Dict[str, Any]] = None, normalized: bool = False,
+                 bm25: Optional[BM25Index] = None, embeddings: Optional[np.ndarray] = None,
+                 ids: Optional[np.ndarray] = None, version: Optional[str] = None):
+        self.index = index
+        self.chunks = chunks
+        self.path = path
+        # Sürümlü veritabanında snapshot'ın sürüm adı (manifest'ten)
+        self.version = version
+        # İndeks türü ve arama parametreleri (model_info.json'dan)
+        self.index_config = index_config or {}
+        # Vektörler L2 normalize ise sorgular da normalize edilir (kosinüs benzerliği)
+        self.normalized = normalized
+        # Aynı chunk sırasıyla kurulmuş BM25 indeksi (yoksa None)
+        self.bm25 = bm25
+        # İndeksle aynı sıradaki ham embedding'ler (küçük filtreli bölümlerin tam taraması için)
+        self.embeddings = embeddings
+        # Kaynak dosya, dönem ve etiket başına chunk pozisyonları
+        self.partitions = MetadataPartitions.build(chunks)
+        # İndeks chunk id'leriyle adresleniyorsa her pozisyonun FAISS id'si (konumsal indekste None)
+        self.ids = ids
+        self._id_order = np.argsort(ids) if ids is not None else None
+        self.loaded_at = datetime.now().isoformat()
+
+    def positions_of(self, labels: np.ndarray) -> np.ndarray:
+        """FAISS sonuç id'lerini chunk pozisyonlarına çevirir"""
+        if self.ids is None:
+            return labels
+        return self._id_order[np.searchsorted(self.ids, labels, sorter=self._id_order)]
+
+    def labels_of(self, positions: np.ndarray) -> np.ndarray:
+        """Chunk pozisyonlarını FAISS id'lerine (ID seçicisi için) çevirir"""
+        return self.ids[positions] if self.ids is not None else positions
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "version": self.version,
+            "total_vectors": int(self.index.ntotal),
+            "total_chunks": len(self.chunks),
+            "index_config": self.index_config,
+            "normalized": self.normalized,
+            "bm25_terms": len(self.bm25.vocabulary) if self.bm25 is not None else None,
+            "partitions": self.partitions.summary(),
+            "loaded_at": self.loaded_at
+        }
+
+
+def load_index_snapshot(vector_db_path: Optional[str] = None) -> IndexSnapshot:
+    """Vektör veritabanı dizininden FAISS indeksini ve chunk metadata'sını yükler"""
+    vector_db_path = Path(vector_db_path) if vector_db_path is not None else DEFAULT_VECTOR_DB_PATH
+    # Sürümlü veritabanında CURRENT'ın gösterdiği sürüm okunur
+    vector_db_path = resolve_snapshot_dir(vector_db_path)
+    # Dosyalar manifest'le uyuşmuyorsa (eksik/yarım kopyalanmış sürüm) yükleme yapılmaz
+    manifest = verify_snapshot(vector_db_path, checksums=RAG_VERIFY_CHECKSUMS)
+    
+    print(f"Vektör indeksi yükleniyor... ({manifest['version'] if manifest else vector_db_path})")
+    faiss_index_path = vector_db_path / "faiss_index.bin"
+    if not faiss_index_path.exists():
+        raise FileNotFoundError(f"FAISS indeks dosyası bulunamadı: {faiss_index_path}")
+    
+    if RAG_MMAP and ChunkStore.exists(vector_db_path):
+        # İndeks ve chunk'lar mmap ile açılır, yalnızca bulunan chunk'lar okunur
+        index = read_index_mmap(faiss_index_path)
+        chunks = ChunkStore(vector_db_path)
+    else:
+        index = faiss.read_index(str(faiss_index_path))
+        
+        # Chunk metadata'larını yükle
+        chunks_metadata_path = vector_db_path / "chunks_metadata.json"
+        if not chunks_metadata_path.exists():
+            raise FileNotFoundError(f"Chunks metadata dosyası bulunamadı: {chunks_metadata_path}")
+        
+        with open(chunks_metadata_path, 'r', encoding='utf-8') as f:
+            chunks = json.load(f)
+    
+    # İndeks oluşturulurken seçilen arama parametrelerini (nprobe, efSearch) uygula
+    model_info = {}
+    model_info_path = vector_db_path / "model_info.json"
+    if model_info_path.exists():
+        with open(model_info_path, 'r', encoding='utf-8') as f:
+            model_info = json.load(f)
+    index_config = model_info.get("index_params", {})
+    apply_search_params(index, index_config.get("search_params", {}))
+    
+    # Ingestion sırasında kurulmuş BM25 indeksi (hibrit arama için)
+    bm25 = BM25Index.load(vector_db_path, mmap=RAG_MMAP) if BM25Index.exists(vector_db_path) else None
+    
+    embeddings = None
+    embeddings_path = vector_db_path / "embeddings.npy"
+    if embeddings_path.exists():
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+        if embeddings.shape[0] != index.ntotal:
+            embeddings = None
+    
+    ids = None
+    if model_info.get("id_mapped", False):
+        # FAISS id'leri chunk id'lerinden türetilir; sonuçlar bu sırayla pozisyonlara çevrilir
+        ids = chunk_int_ids(chunks.chunk_ids() if isinstance(chunks, ChunkStore) else (chunk["id"] for chunk in chunks))
+    
+    return IndexSnapshot(index, chunks, vector_db_path, index_config, model_info.get("normalized", False), bm25,
+                         embeddings, ids, manifest["version"] if manifest else None)
+
+
+def load_llm(llm_model_path: str = "stabilityai/stablelm-2-zephyr-1_6b"):
+    """RAG için tokenizer ve LLM'i yükler (GPU yoksa seçili CPU backend'i ile)"""
+    print("LLM modeli yükleniyor...")
+    cuda = torch.cuda.is_available()
+    tokenizer = AutoTokenizer.from_pretrained(llm_model_path)
+    model = AutoModelForCausalLM.from_pretrained(
+        llm_model_path,
+        # CPU'da float16 matmul'lar yavaştır; fp32 yüklenip backend'e göre nicemlenir
+        torch_dtype=torch.float16 if cuda else torch.float32,
+        device_map="auto" if cuda else None,
+        trust_remote_code=True,
+        low_cpu_mem_usage=True
+    )
+    model.eval()
+    if not cuda:
+        model = optimize_for_cpu(model)
+    return tokenizer, model
+
+
 class RAGSystem:
     def __init__(self, 
                  llm_model_path: str = "stabilityai/stablelm-2-zephyr-1_6b",
                  embedding_model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
-                 vector_db_path: str = None):
+                 vector_db_path: str = None,
+                 embedding_model=None,
+                 tokenizer=None,
+                 model=None,
+                 snapshot: Optional[IndexSnapshot] = None,
+                 reranker=None,
+                 decoder=None):
+        """Verilmeyen bileşenleri yükler; verilenler (ör. RAGService'ten) aynen kullanılır.
+        
+        reranker (CrossEncoderReranker) verilirse retrieve() adayları yeniden sıralar.
+        decoder verilmezse önek önbellekli bir StreamingDecoder oluşturulur.
+        """
        
-        if vector_db_path is None:
-            # Mevcut dosyanın bulunduğu dizini al
-            current_file_dir = Path(__file__).parent
-            self.vector_db_path = current_file_dir / "vector_database"
-        else:
-            self.vector_db_path = Path(vector_db_path)
-        
+        self.vector_db_path = Path(vector_db_path) if vector_db_path is not None else DEFAULT_VECTOR_DB_PATH
         self.llm_model_path = llm_model_path
         
         print("RAG sistemi başlatılıyor...")
         print(f"Vektör veritabanı yolu: {self.vector_db_path}")
         
         # Embedding modelini yükle
-        print("Embedding modeli yükleniyor...")
-        self.embedding_model = SentenceTransformer(embedding_model_name)
+        if embedding_model is None:
+            print("Embedding modeli yükleniyor...")
+            embedding_model = SentenceTransformer(embedding_model_name)
+        self.embedding_model = embedding_model
         
         # LLM modelini yükle
-        print("LLM modeli yükleniyor...")
-        self.tokenizer = AutoTokenizer.from_pretrained(self.llm_model_path)
-        self.model = AutoModelForCausalLM.from_pretrained(
-            self.llm_model_path,
-            torch_dtype=torch.float16,
-            device_map="auto",
-            trust_remote_code=True
+        if model is None or tokenizer is None:
+            tokenizer, model = load_llm(self.llm_model_path)
+        self.tokenizer = tokenizer
+        self.model = model
+        if decoder is None:
+            decoder = StreamingDecoder(self.model, self.tokenizer, PrefixKVCache(self.model, self.tokenizer))
+        self.decoder = decoder
+        self.context_packer = ContextPacker(
+            self.tokenizer,
+            max_model_tokens=getattr(self.model.config, "max_position_embeddings", None) or 4096,
+            max_context_tokens=RAG_CONTEXT_TOKENS or None
         )
+        self.register_prompt_prefix()
         
-        # FAISS indeksini yükle
-        print("Vektör indeksi yükleniyor...")
-        faiss_index_path = self.vector_db_path / "faiss_index.bin"
-        if not faiss_index_path.exists():
-            raise FileNotFoundError(f"FAISS indeks dosyası bulunamadı: {faiss_index_path}")
-        
-        self.index = faiss.read_index(str(faiss_index_path))
-        
-        # Chunk metadata'larını yükle
-        chunks_metadata_path = self.vector_db_path / "chunks_metadata.json"
-        if not chunks_metadata_path.exists():
-            raise FileNotFoundError(f"Chunks metadata dosyası bulunamadı: {chunks_metadata_path}")
-        
-        with open(chunks_metadata_path, 'r', encoding='utf-8') as f:
-            self.chunks = json.load(f)
+        # FAISS indeksini ve chunk metadata'larını yükle
+        if snapshot is None:
+            snapshot = load_index_snapshot(self.vector_db_path)
+        self.snapshot = snapshot
+        self.reranker = reranker
         
         print("RAG sistemi hazır!")
     
-    def search_similar_chunks(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    @property
+    def index(self) -> faiss.Index:
+        return self.snapshot.index
+    
+    @property
+    def chunks(self) -> List[Dict[str, Any]]:
+        return self.snapshot.chunks
+    
+    def search_similar_chunks(self, query: str, top_k: int = 5,
+                              filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """En benzer chunk'ları döndürür.
+        
+        filters ({"source_file": ..., "stage": ..., "tags": ...}) verilirse arama
+        yalnızca uyan chunk'lar arasında yapılır; genel top-k alınıp sonradan elenmez.
+        """
+        # İndeks ve metadata'yı aynı snapshot'tan oku
+        snapshot = self.snapshot
+        positions = snapshot.partitions.positions(filters)
+        if positions is not None and len(positions) == 0:
+            return []
+        
+        # BM25 indeksi varsa dense ve kelime tabanlı sonuçlar RRF ile birleştirilir
+        hybrid = RAG_HYBRID and snapshot.bm25 is not None
+        candidate_k = top_k * HYBRID_CANDIDATE_FACTOR if hybrid else top_k
+        
         # Sorgu embedding'i oluştur
-        query_embedding = self.embedding_model.encode([query])
+        query_embedding = self.embedding_model.encode([query]).astype('float32')
+        if snapshot.normalized:
+            query_embedding = normalize_vectors(query_embedding)
         
         # En yakın vektörleri bul
-        distances, indices = self.index.search(query_embedding.astype('float32'), top_k)
+        dense_hits = self._dense_search(snapshot, query_embedding, candidate_k, positions)
+        
+        if not hybrid:
+            # Sonuçları formatla
+            results = []
+            for idx, distance in dense_hits:
+                chunk = snapshot.chunks[idx]
+                results.append({
+                    "id": chunk["id"],
+                    "content": chunk["content"],
+                    "metadata": chunk["metadata"],
+                    "similarity_score": distance
+                })
+            return results
+        
+        lexical_hits = snapshot.bm25.search(query, candidate_k, positions)
+        dense_scores = dict(dense_hits)
+        lexical_scores = dict(lexical_hits)
+        fused = reciprocal_rank_fusion([[idx for idx, _ in dense_hits], [idx for idx, _ in lexical_hits]])
         
-        # Sonuçları formatla
         results = []
-        for distance, idx in zip(distances[0], indices[0]):
-            chunk = self.chunks[idx]
+        for idx, fused_score in fused[:top_k]:
+            chunk = snapshot.chunks[idx]
             results.append({
+                "id": chunk["id"],
                 "content": chunk["content"],
                 "metadata": chunk["metadata"],
-                "similarity_score": float(distance)
+                "similarity_score": fused_score,
+                "dense_score": dense_scores.get(idx),
+                "bm25_score": lexical_scores.get(idx)
             })
-        
         return results
     
-    def create_context(self, similar_chunks: List[Dict[str, Any]]) -> str:
-        """Benzer chunk'lardan context oluşturur"""
-        context_parts = []
-        
-        for i, chunk in enumerate(similar_chunks, 1):
-            context_parts.append(f"Source {i} (File: {chunk['metadata']['source_file']}):")
-            context_parts.append(chunk['content'])
-            context_parts.append("")  # Boş satır
-        
-        return "\n".join(context_parts)
+    def _dense_search(self, snapshot: IndexSnapshot, query_embedding: np.ndarray, k: int,
+                      positions: Optional[np.ndarray] = None) -> List[tuple]:
+        """(chunk pozisyonu, skor) listesi; positions verilirse yalnızca o chunk'lar aranır"""
+        if positions is None:
+            distances, indices = snapshot.index.search(query_embedding, k)
+        elif snapshot.embeddings is not None and len(positions) <= EXACT_SCAN_MAX:
+            # Küçük bölüm doğrudan taranır (IVF'de nprobe dışında kalan chunk'lar da bulunur)
+            vectors = np.asarray(snapshot.embeddings[positions], dtype=np.float32)
+            if snapshot.normalized:
+                vectors = normalize_vectors(vectors)
+            if snapshot.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                scores = vectors @ query_embedding[0]
+                order = np.argsort(-scores, kind="stable")[:k]
+            else:
+                scores = ((vectors - query_embedding[0]) ** 2).sum(axis=1)
+                order = np.argsort(scores, kind="stable")[:k]
+            return [(int(positions[row]), float(scores[row])) for row in order]
+        else:
+            selector = faiss.IDSelectorBatch(snapshot.labels_of(positions))
+            distances, indices = snapshot.index.search(
+                query_embedding, k, params=selector_search_params(snapshot.index, selector)
+            )
+        found = indices[0] >= 0
+        positions = snapshot.positions_of(indices[0][found])
+        return [(int(idx), float(distance)) for distance, idx in zip(distances[0][found], positions)]
+    
+    def stage_filters(self, query: str, stage: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Dönem (verilmemişse ve RAG_STAGE_FILTER açıksa sorgudan tahmin edilen) için filtre"""
+        if stage is None and RAG_STAGE_FILTER:
+            stage = detect_stage(query)
+        return stage_filter(stage)
+    
+    def retrieve(self, query: str, top_k: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """LLM'e verilecek chunk'ları döndürür.
+        
+        Reranker varsa RERANK_CANDIDATES aday alınır, cross-encoder ile tek
+        batch'te puanlanır ve en iyi top_k tanesi tutulur.
+        """
+        if self.reranker is None:
+            return self.search_similar_chunks(query, top_k, filters)
+        candidates = self.search_similar_chunks(query, max(RERANK_CANDIDATES, top_k), filters)
+        return self.reranker.rerank(query, candidates, top_k)
+    
+    def create_context(self, similar_chunks: List[Dict[str, Any]], query: str = "",
+                       max_new_tokens: int = 256) -> str:
+        """Benzer chunk'lardan token bütçesine sığan context oluşturur.
+        
+        Bütçe, prompt'un geri kalanı ve max_new_tokens modelin bağlam
+        penceresine sığacak şekilde sorguya göre hesaplanır.
+        """
+        budget = self.context_packer.context_budget(self.build_prompt(query, ""), max_new_tokens)
+        return self.context_packer.pack(similar_chunks, budget)["context"]
+    
+    def register_prompt_prefix(self):
+        """Prompt'un context'ten önceki sabit kısmının KV cache'ini decoder'ın önek önbelleğine kaydeder"""
+        prefix_cache = getattr(self.decoder, "prefix_cache", None)
+        if prefix_cache is None:
+            return
+        prefix_cache.register(
+            "health_rag_info",
+            prompt_prefix(PROMPT_TEMPLATE, "{context}"),
+            adapter_name=getattr(self.decoder, "adapter_name", None),
+            version=self.llm_model_path
+        )
+    
+    def prefix_past_key_values(self, input_ids, attention_mask=None):
+        """model.generate için kayıtlı önekin KV cache'i (eşleşme yoksa None)"""
+        prefix_cache = getattr(self.decoder, "prefix_cache", None)
+        if prefix_cache is None:
+            return None
+        return prefix_cache.past_key_values_for(input_ids, attention_mask, getattr(self.decoder, "adapter_name", None))
+    
+    def build_prompt(self, query: str, context: str) -> str:
+        return PROMPT_TEMPLATE.format(context=context, query=query)
+    
+    def encode_prompt(self, query: str, context: str, max_new_tokens: int = 256):
+        """Prompt'u tokenize eder; sığmazsa sorudan değil context'ten keser"""
+        prompt = self.build_prompt(query, context)
+        inputs = self.tokenizer(prompt, return_tensors="pt")
+        limit = self.context_packer.max_model_tokens - max_new_tokens
+        if inputs["input_ids"].shape[1] > limit:
+            budget = self.context_packer.context_budget(self.build_prompt(query, ""), max_new_tokens)
+            context = self.context_packer.truncate_text(context, budget)
+            prompt = self.build_prompt(query, context)
+            inputs = self.tokenizer(prompt, return_tensors="pt")
+        return prompt, inputs
+    
+    def sampling_params(self, max_new_tokens: int = 256) -> SamplingParams:
+        """RAG yanıtlarının örnekleme ayarları (generate() varsayılanı top_k=50 dahil)"""
+        return SamplingParams(
+            max_new_tokens=max_new_tokens,
+            temperature=0.7,
+            top_p=1.0,
+            repetition_penalty=1.1,
+            prompt_lookup_num_tokens=RAG_PROMPT_LOOKUP_TOKENS
+        )
     
     def generate_response(self, query: str, context: str, max_new_tokens: int = 256) -> str:
-        """LLM ile yanıt üretir"""
-        # Prompt template oluştur
-        prompt = f"""<|system|>
-You are an expert health consultant specializing in pregnancy and postpartum care.
-Use the following information to answer questions. Provide complete, helpful responses.
-Never mention sources, references, or file names in your response.
-Always give complete answers without cutting off mid-sentence.
-
-{context}
-
-<|user|>
-{query}
-
-<|assistant|>"""
-        
-        # Tokenize et
-        inputs = self.tokenizer(prompt, return_tensors="pt", padding=True, truncation=True).to(self.model.device)
-        
-        # Yanıt üret
-        with torch.no_grad():
-            outputs = self.model.generate(
-                inputs['input_ids'],
-                attention_mask=inputs.get('attention_mask', None),
-                max_new_tokens=max_new_tokens,
-                temperature=0.7,
-                do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id,
-                repetition_penalty=1.1
-            )
-        
-        # Yanıtı decode et
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # Prompt'u çıkar, sadece yanıtı al
-        response = response.replace(prompt, "").strip()
-        
-        return response
+        """LLM ile yanıt üretir.
+        
+        model.generate yerine decoder kullanılır; önek önbelleği ve prompt-lookup
+        taslakları streaming ile aynı şekilde uygulanır (generate'in assisted
+        decoding'i önceden doldurulmuş cache ile çalışmaz).
+        """
+        _, inputs = self.encode_prompt(query, context, max_new_tokens)
+        response = "".join(self.decoder.stream_text(
+            inputs['input_ids'],
+            inputs.get('attention_mask', None),
+            self.sampling_params(max_new_tokens)
+        ))
+        return response.strip()
     
     def generate_response_streaming(self, query: str, context: str, max_new_tokens: int = 256):
         """LLM ile yanıt üretir (streaming)"""
-        # Prompt template oluştur
-        prompt = f"""<|system|>
-You are an expert health consultant specializing in pregnancy and postpartum care.
-Use the following information to answer questions. Provide complete, helpful responses.
-Never mention sources, references, or file names in your response.
-Always give complete answers without cutting off mid-sentence.
-
-{context}
-
-<|user|>
-{query}
-
-<|assistant|>"""
+        _, inputs = self.encode_prompt(query, context, max_new_tokens)
         
-        # Tokenize et
-        inputs = self.tokenizer(prompt, return_tensors="pt", padding=True, truncation=True).to(self.model.device)
-        
-        # Streaming yanıt üret
-        with torch.no_grad():
-            for _ in range(max_new_tokens):
-                outputs = self.model.generate(
-                    inputs['input_ids'],
-                    attention_mask=inputs.get('attention_mask', None),
-                    max_new_tokens=1,
-                    do_sample=True,
-                    temperature=0.7,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                    eos_token_id=self.tokenizer.eos_token_id,
-                    use_cache=True,
-                    repetition_penalty=1.1
-                )
-                
-                # Yeni token'ı al
-                new_token = outputs[0][-1:]
-                
-                # EOS token kontrolü
-                if new_token.item() == self.tokenizer.eos_token_id:
-                    break
-                
-                # Token'ı decode et ve yield et
-                new_text = self.tokenizer.decode(new_token, skip_special_tokens=True)
-                if new_text.strip():
-                    yield new_text
-                
-                # Input'ları güncelle
-                inputs['input_ids'] = outputs
-                # Update attention mask for next iteration
-                if 'attention_mask' in inputs:
-                    attention_mask = inputs['attention_mask']
-                    inputs['attention_mask'] = torch.cat([attention_mask, torch.ones(1, 1, device=attention_mask.device)], dim=1)
+        # Streaming yanıt üret (prompt bir kez işlenir, KV cache tekrar kullanılır)
+        params = self.sampling_params(max_new_tokens)
+        yield from self.decoder.stream_text(inputs['input_ids'], inputs.get('attention_mask', None), params)
     
     def answer_question(self, query: str, top_k: int = 5) -> Dict[str, Any]:
         """Ana RAG fonksiyonu - soruyu yanıtlar"""
@@ -186,10 +442,10 @@ Always give complete answers without cutting off mid-sentence.
         
         # 1. Benzer chunk'ları ara
         print("Searching for similar documents...")
-        similar_chunks = self.search_similar_chunks(query, top_k)
+        similar_chunks = self.retrieve(query, top_k)
         
         # 2. Context oluştur
-        context = self.create_context(similar_chunks)
+        context = self.create_context(similar_chunks, query)
         
         # 3. LLM ile yanıt üret
         print("Generating response...")
@@ -218,10 +474,10 @@ Always give complete answers without cutting off mid-sentence.
         
         # 1. Benzer chunk'ları ara
         print("Searching for similar documents...")
-        similar_chunks = self.search_similar_chunks(query, top_k)
+        similar_chunks = self.retrieve(query, top_k)
         
         # 2. Context oluştur
-        context = self.create_context(similar_chunks)
+        context = self.create_context(similar_chunks, query)
         
         # 3. LLM ile streaming yanıt üret
         print("Generating response...")
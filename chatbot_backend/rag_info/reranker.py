@@ -0,0 +1,99 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+DEFAULT_RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class CrossEncoderReranker:
+    """Aday chunk'ları sorguyla birlikte cross-encoder ile puanlayıp yeniden sıralar.
+
+    Tüm (sorgu, chunk) çiftleri tek batch'li forward pass'te puanlanır. Skorlar
+    (sorgu hash'i, chunk id) anahtarıyla LRU önbellekte tutulur; aynı soru
+    tekrar geldiğinde yalnızca yeni adaylar puanlanır.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_RERANKER_MODEL, model=None,
+                 cache_size: int = 4096, batch_size: int = 32, device: Optional[str] = None):
+        self.model_name = model_name
+        self.model = model
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.device = device
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """Cross-encoder modelini (yoksa) yükler"""
+        if self.model is not None:
+            return self.model
+        with self._load_lock:
+            if self.model is None:
+                from sentence_transformers import CrossEncoder
+                print(f"Reranker modeli yükleniyor: {self.model_name}")
+                self.model = CrossEncoder(self.model_name, device=self.device)
+        return self.model
+
+    def score(self, query: str, chunks: List[Dict[str, Any]]) -> np.ndarray:
+        """Her chunk için sorguyla ilgililik skorunu döndürür"""
+        query_key = hashlib.sha1(query.encode("utf-8")).hexdigest()
+        keys = [(query_key, _chunk_key(chunk)) for chunk in chunks]
+        scores = np.zeros(len(chunks), dtype=np.float32)
+
+        missing = []
+        with self._lock:
+            for position, key in enumerate(keys):
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+                    scores[position] = cached
+                    self.hits += 1
+                else:
+                    missing.append(position)
+
+        if missing:
+            pairs = [(query, chunks[position]["content"]) for position in missing]
+            predicted = np.asarray(
+                self.load().predict(pairs, batch_size=self.batch_size, show_progress_bar=False),
+                dtype=np.float32
+            ).reshape(-1)
+            with self._lock:
+                for position, value in zip(missing, predicted):
+                    scores[position] = value
+                    self._cache[keys[position]] = float(value)
+                    self._cache.move_to_end(keys[position])
+                    self.misses += 1
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        return scores
+
+    def rerank(self, query: str, chunks: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+        """Chunk'ları cross-encoder skoruna göre sıralar ve en iyi top_k tanesini döndürür"""
+        if not chunks:
+            return []
+        scores = self.score(query, chunks)
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [{**chunks[position], "rerank_score": float(scores[position])} for position in order]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "loaded": self.model is not None,
+            "cache_entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+def _chunk_key(chunk: Dict[str, Any]) -> str:
+    # Chunk id belge yeniden işlendiğinde aynı kalabilir; içerik hash'i eski skorların kullanılmasını önler
+    content_hash = hashlib.sha1(chunk["content"].encode("utf-8")).hexdigest()[:16]
+    return f"{chunk.get('id', '')}:{content_hash}"
@@ -0,0 +1,403 @@
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Optional, Callable, Tuple
+
+import numpy as np
+import faiss
+
+from index_builder import build_index, with_ids, apply_search_params, normalize_vectors
+from chunk_store import write_chunk_store
+from bm25_index import BM25Index
+
+# Vektör veritabanı dizininde etkin sürümün adını tutan dosya ve sürüm dizinleri
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+# Her sürüm dizininde dosya boyutları ve sha256 özetleriyle yazılan manifest
+MANIFEST_FILE = "manifest.json"
+# Silinmeden tutulan en eski sürüm sayısı (açık sorgular eski sürümü okumaya devam edebilir)
+KEEP_VERSIONS = int(os.getenv("VECTOR_DB_KEEP_VERSIONS", "3"))
+
+INDEX_FILE = "faiss_index.bin"
+CHUNKS_FILE = "chunks_metadata.json"
+MODEL_INFO_FILE = "model_info.json"
+# Chunk embedding'leri (indeksi yeniden kurmak ve küçük bölümleri tam taramak için)
+EMBEDDINGS_FILE = "embeddings.npy"
+EMBEDDINGS_META_FILE = "embeddings_meta.json"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(file_path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_int_id(chunk_id: str) -> int:
+    """md5 chunk id'sinden (DocumentProcessor._generate_chunk_id) FAISS'in int64 id'si"""
+    return int(chunk_id[:16], 16) & 0x7FFF_FFFF_FFFF_FFFF
+
+
+def chunk_int_ids(chunk_ids: Iterable[str]) -> np.ndarray:
+    return np.fromiter((chunk_int_id(chunk_id) for chunk_id in chunk_ids), dtype=np.int64)
+
+
+def current_version(vector_db_path) -> Optional[str]:
+    """CURRENT'ın gösterdiği sürümün adı; sürümlü değilse None"""
+    current = Path(vector_db_path) / CURRENT_FILE
+    if not current.exists():
+        return None
+    return current.read_text(encoding="utf-8").strip()
+
+
+def resolve_snapshot_dir(vector_db_path) -> Path:
+    """CURRENT'ın gösterdiği sürüm dizini; sürümlü değilse dizinin kendisi"""
+    root = Path(vector_db_path)
+    version = current_version(root)
+    return root / VERSIONS_DIR / version if version is not None else root
+
+
+def read_manifest(snapshot_dir) -> Optional[Dict[str, Any]]:
+    manifest_path = Path(snapshot_dir) / MANIFEST_FILE
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def verify_snapshot(snapshot_dir, checksums: bool = False) -> Optional[Dict[str, Any]]:
+    """Sürüm dizinindeki dosyaları manifest'e göre doğrular, manifest'i döndürür.
+
+    Varsayılan olarak dosya varlığı ve boyutu, checksums=True ile sha256
+    özetleri de kontrol edilir. Manifest'i olmayan (eski) dizinlerde None döner.
+    """
+    snapshot_dir = Path(snapshot_dir)
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None:
+        return None
+    for name, entry in manifest["files"].items():
+        file_path = snapshot_dir / name
+        if not file_path.exists() or file_path.stat().st_size != entry["bytes"]:
+            raise ValueError(f"Snapshot {manifest['version']}: {name} eksik ya da boyutu farklı")
+        if checksums and file_hash(file_path) != entry["sha256"]:
+            raise ValueError(f"Snapshot {manifest['version']}: {name} özeti manifest'le uyuşmuyor")
+    return manifest
+
+
+def version_names(vector_db_path) -> List[str]:
+    """versions/ altındaki sürüm dizinlerinin adları (eskiden yeniye, staging hariç)"""
+    versions = Path(vector_db_path) / VERSIONS_DIR
+    if not versions.exists():
+        return []
+    return sorted(path.name for path in versions.iterdir() if not path.name.startswith(".") and path.is_dir())
+
+
+def check_version(vector_db_path, version) -> str:
+    """Dışarıdan gelen sürüm adını diskteki sürümlerle karşılaştırır.
+
+    Yalnızca versions/ altında listelenen bir ad kabul edilir; ayraç içeren,
+    mutlak ya da ".." ile dışarı çıkan değerler dosya sistemine dokunulmadan
+    ValueError ile reddedilir.
+    """
+    if not isinstance(version, str) or version not in version_names(vector_db_path):
+        raise ValueError(f"Snapshot sürümü bulunamadı: {version}")
+    return version
+
+
+def list_versions(vector_db_path) -> List[Dict[str, Any]]:
+    """Diskteki sürümlerin manifest özetleri (eskiden yeniye)"""
+    current = current_version(vector_db_path)
+    result = []
+    for name in version_names(vector_db_path):
+        path = Path(vector_db_path) / VERSIONS_DIR / name
+        manifest = read_manifest(path) or {"version": name}
+        result.append({
+            **{key: value for key, value in manifest.items() if key != "files"},
+            "current": path.name == current
+        })
+    return result
+
+
+def _write_pointer(root: Path, version: str):
+    pointer = root / f".{CURRENT_FILE}.tmp"
+    with open(pointer, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer, root / CURRENT_FILE)
+
+
+def activate_version(vector_db_path, version: str) -> Dict[str, Any]:
+    """Diskteki bir sürümü (ör. geri almak için) doğrulayıp etkin sürüm yapar"""
+    root = Path(vector_db_path)
+    snapshot_dir = root / VERSIONS_DIR / check_version(root, version)
+    manifest = verify_snapshot(snapshot_dir, checksums=True) or {"version": version}
+    _write_pointer(root, version)
+    return manifest
+
+
+def _fsync_tree(path: Path):
+    for file_path in path.iterdir():
+        with open(file_path, "rb") as f:
+            os.fsync(f.fileno())
+    # Dizin girdileri de diske yazılmalı (Windows'ta dizin açılamaz)
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def write_snapshot(output_dir, write_files: Callable[[Path], None], info: Optional[Dict[str, Any]] = None,
+                   keep_versions: int = KEEP_VERSIONS) -> Path:
+    """Dosyaları yeni bir sürüm dizinine yazar ve CURRENT'ı atomik olarak o sürüme çevirir.
+
+    Okuyucular ya eski ya yeni sürümün tamamını görür; yarım yazılmış
+    indeks ya da indeksle uyuşmayan metadata hiçbir zaman okunmaz. Sürüm
+    dizinine dosya boyutları/özetleri ve info ile bir manifest eklenir.
+    """
+    root = Path(output_dir)
+    versions = root / VERSIONS_DIR
+    versions.mkdir(parents=True, exist_ok=True)
+
+    version = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    staging = versions / f".{version}.tmp"
+    staging.mkdir()
+    try:
+        write_files(staging)
+        manifest = {
+            "version": version,
+            "created_at": datetime.now().isoformat(),
+            "parent": current_version(root),
+            **(info or {}),
+            "files": {
+                file_path.name: {"bytes": file_path.stat().st_size, "sha256": file_hash(file_path)}
+                for file_path in sorted(staging.iterdir())
+            }
+        }
+        with open(staging / MANIFEST_FILE, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        _fsync_tree(staging)
+        os.rename(staging, versions / version)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    _write_pointer(root, version)
+
+    # Sürüm adları zaman damgası olduğundan ada göre sıralama yaşa göre sıralamadır
+    all_versions = sorted(path for path in versions.iterdir() if not path.name.startswith("."))
+    for path in all_versions[:-max(keep_versions, 1)]:
+        shutil.rmtree(path, ignore_errors=True)
+    return versions / version
+
+
+class VectorStore:
+    """Chunk id'leriyle adreslenen FAISS indeksi, chunk'lar ve embedding'leri.
+
+    Her vektörün FAISS id'si chunk'ın md5 id'sinden türetilir (IVF'de
+    listelerde, diğer indekslerde IndexIDMap2 ile). Bu yüzden bir belgenin
+    chunk'ları upsert/delete ile indeksin geri kalanına dokunmadan
+    değiştirilebilir. Silmeyi desteklemeyen indekslerde (HNSW) indeks
+    saklanan embedding'lerden yeniden kurulur, hiçbir chunk yeniden embed
+    edilmez. save() her seferinde yeni bir sürüm dizini yazar ve CURRENT'ı
+    atomik olarak değiştirir.
+    """
+
+    def __init__(self, index: faiss.Index, chunks: List[Dict[str, Any]], embeddings: np.ndarray,
+                 model_name: str, index_config: Dict[str, Any]):
+        self.index = index
+        self.chunks = list(chunks)
+        # Ham (normalize edilmemiş) embedding'ler, chunks ile aynı sırada
+        self.embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(self.chunks), -1)
+        self.model_name = model_name
+        self.index_config = index_config
+        self._rows = {chunk_int_id(chunk["id"]): row for row, chunk in enumerate(self.chunks)}
+
+    @classmethod
+    def create(cls, chunks: List[Dict[str, Any]], embeddings: np.ndarray, index: faiss.Index,
+               index_config: Dict[str, Any], model_name: str) -> "VectorStore":
+        """Konumsal olarak kurulmuş (ör. select_index) indeksten id'li depo oluşturur"""
+        vectors = normalize_vectors(embeddings)
+        index = with_ids(index, vectors, chunk_int_ids(chunk["id"] for chunk in chunks))
+        return cls(index, chunks, embeddings, model_name, index_config)
+
+    @staticmethod
+    def exists(vector_db_path) -> bool:
+        path = resolve_snapshot_dir(vector_db_path)
+        return all((path / name).exists() for name in
+                   (INDEX_FILE, CHUNKS_FILE, MODEL_INFO_FILE, EMBEDDINGS_FILE, EMBEDDINGS_META_FILE))
+
+    @classmethod
+    def load(cls, vector_db_path) -> "VectorStore":
+        """Etkin sürümü yükler; eski konumsal indeksler aynı yapılandırmayla id'li olarak yeniden kurulur"""
+        path = resolve_snapshot_dir(vector_db_path)
+        with open(path / MODEL_INFO_FILE, "r", encoding="utf-8") as f:
+            model_info = json.load(f)
+        with open(path / CHUNKS_FILE, "r", encoding="utf-8") as f:
+            chunks = json.load(f)
+        with open(path / EMBEDDINGS_META_FILE, "r", encoding="utf-8") as f:
+            embeddings_meta = json.load(f)
+        if embeddings_meta["ids"] != [chunk["id"] for chunk in chunks]:
+            raise ValueError("Embedding'ler chunk metadata'sıyla aynı sırada değil")
+        embeddings = np.load(path / EMBEDDINGS_FILE)
+
+        index_config = model_info.get("index_params") or {"type": "Flat", "search_params": {}}
+        index = faiss.read_index(str(path / INDEX_FILE))
+        if not (model_info.get("id_mapped", False) and index.ntotal == len(chunks)):
+            print("Konumsal indeks id'li indekse dönüştürülüyor")
+            index = build_index(normalize_vectors(embeddings), index_config,
+                                chunk_int_ids(chunk["id"] for chunk in chunks))
+        apply_search_params(index, index_config.get("search_params", {}))
+        return cls(index, chunks, embeddings, model_info["model_name"], index_config)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def get(self, chunk_id: str) -> Optional[Dict[str, Any]]:
+        row = self._rows.get(chunk_int_id(chunk_id))
+        return self.chunks[row] if row is not None else None
+
+    def embedding(self, chunk_id: str) -> Optional[np.ndarray]:
+        row = self._rows.get(chunk_int_id(chunk_id))
+        return self.embeddings[row] if row is not None else None
+
+    def upsert(self, chunks: List[Dict[str, Any]], embeddings: np.ndarray) -> Dict[str, int]:
+        """Chunk'ları ekler ya da aynı id'li chunk'ların yerine koyar.
+
+        Aynı çağrıda bir id birden fazla geçerse sonuncusu geçerlidir.
+        {"inserted", "updated"} döndürür.
+        """
+        chunks = list(chunks)
+        if not chunks:
+            return {"inserted": 0, "updated": 0}
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(chunks), -1)
+
+        latest: Dict[int, int] = {}
+        for position, chunk in enumerate(chunks):
+            latest[chunk_int_id(chunk["id"])] = position
+        for int_id, position in latest.items():
+            row = self._rows.get(int_id)
+            if row is not None and self.chunks[row]["id"] != chunks[position]["id"]:
+                raise ValueError(f"Chunk id çakışması: {chunks[position]['id']} / {self.chunks[row]['id']}")
+
+        updated = [int_id for int_id in latest if int_id in self._rows]
+        removed = self._remove_from_index(updated)
+
+        new_rows = []
+        for int_id, position in latest.items():
+            row = self._rows.get(int_id)
+            if row is None:
+                self._rows[int_id] = len(self.chunks)
+                self.chunks.append(chunks[position])
+                new_rows.append(position)
+            else:
+                self.chunks[row] = chunks[position]
+                self.embeddings[row] = embeddings[position]
+        if new_rows:
+            self.embeddings = np.concatenate([self.embeddings, embeddings[new_rows]])
+
+        if removed:
+            positions = list(latest.values())
+            self.index.add_with_ids(normalize_vectors(embeddings[positions]),
+                                    np.fromiter(latest.keys(), dtype=np.int64))
+        else:
+            self.rebuild_index()
+        return {"inserted": len(new_rows), "updated": len(updated)}
+
+    def delete(self, chunk_ids: Iterable[str]) -> int:
+        """Verilen id'li chunk'ları siler, silinen chunk sayısını döndürür"""
+        int_ids = [int_id for int_id in dict.fromkeys(chunk_int_id(chunk_id) for chunk_id in chunk_ids)
+                   if int_id in self._rows]
+        if not int_ids:
+            return 0
+        removed = self._remove_from_index(int_ids)
+
+        keep = np.ones(len(self.chunks), dtype=bool)
+        keep[[self._rows[int_id] for int_id in int_ids]] = False
+        self.chunks = [chunk for chunk, kept in zip(self.chunks, keep) if kept]
+        self.embeddings = self.embeddings[keep]
+        self._rows = {chunk_int_id(chunk["id"]): row for row, chunk in enumerate(self.chunks)}
+
+        if not removed:
+            self.rebuild_index()
+        return len(int_ids)
+
+    def rebuild_index(self, index_config: Optional[Dict[str, Any]] = None):
+        """İndeksi saklanan embedding'lerden (aynı ya da verilen yapılandırmayla) yeniden kurar"""
+        if index_config is not None:
+            self.index_config = index_config
+        self.index = build_index(normalize_vectors(self.embeddings), self.index_config,
+                                 chunk_int_ids(chunk["id"] for chunk in self.chunks))
+
+    def replace_index(self, index: faiss.Index, index_config: Dict[str, Any]):
+        """Aynı chunk sırasıyla konumsal kurulmuş yeni bir indeksi (ör. select_index) devreye alır"""
+        self.index = with_ids(index, normalize_vectors(self.embeddings),
+                              chunk_int_ids(chunk["id"] for chunk in self.chunks))
+        self.index_config = index_config
+
+    def _remove_from_index(self, int_ids: List[int]) -> bool:
+        """Vektörleri indeksten siler; indeks silmeyi desteklemiyorsa False döner"""
+        if not int_ids:
+            return True
+        try:
+            self.index.remove_ids(faiss.IDSelectorBatch(np.asarray(int_ids, dtype=np.int64)))
+        except RuntimeError:
+            return False
+        return True
+
+    def search(self, query_embedding: np.ndarray, k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
+        """Tek sorgu için (chunk, benzerlik) listesi"""
+        distances, labels = self.index.search(normalize_vectors(query_embedding), k)
+        return [(self.chunks[self._rows[int(label)]], float(distance))
+                for distance, label in zip(distances[0], labels[0]) if label >= 0]
+
+    def model_info(self) -> Dict[str, Any]:
+        return {
+            "model_name": self.model_name,
+            "vector_dimension": int(self.embeddings.shape[1]),
+            "total_vectors": len(self.chunks),
+            "index_type": self.index_config["type"],
+            "index_params": self.index_config,
+            "metric": "inner_product",
+            "normalized": True,
+            "id_mapped": True
+        }
+
+    def write_files(self, output_path: Path):
+        faiss.write_index(self.index, str(output_path / INDEX_FILE))
+        with open(output_path / CHUNKS_FILE, "w", encoding="utf-8") as f:
+            json.dump(self.chunks, f, ensure_ascii=False, indent=2)
+
+        # Soğuk başlangıç için mmap ile açılan kompakt chunk deposu ve aynı sırayla BM25 indeksi
+        write_chunk_store(self.chunks, output_path)
+        BM25Index.build(chunk["content"] for chunk in self.chunks).save(output_path)
+
+        np.save(output_path / EMBEDDINGS_FILE, self.embeddings)
+        with open(output_path / EMBEDDINGS_META_FILE, "w", encoding="utf-8") as f:
+            json.dump({
+                "model_name": self.model_name,
+                "ids": [chunk["id"] for chunk in self.chunks],
+                "content_hashes": [content_hash(chunk["content"]) for chunk in self.chunks]
+            }, f)
+        with open(output_path / MODEL_INFO_FILE, "w", encoding="utf-8") as f:
+            json.dump(self.model_info(), f, ensure_ascii=False, indent=2)
+
+    def save(self, output_dir: str = "vector_database") -> Path:
+        """Depoyu yeni bir sürüm olarak kaydeder ve etkin sürüm yapar"""
+        path = write_snapshot(output_dir, self.write_files, {
+            "chunks": len(self.chunks),
+            "model_name": self.model_name,
+            "index_type": self.index_config["type"]
+        })
+        print(f"Vektör veri tabanı kaydedildi: {path} ({len(self.chunks)} chunk)")
+        return path
@@ -0,0 +1,124 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_message(message):
+    """Önbellek anahtarı için mesajı küçük harfe çevirir, boşlukları ve sondaki noktalamayı temizler"""
+    message = ' '.join(str(message).lower().split())
+    return re.sub(r"[\s?!.,;:]+$", "", message)
+
+
+class _CacheEntry:
+    def __init__(self, response, embedding, created_at):
+        self.response = response
+        self.embedding = embedding
+        self.created_at = created_at
+
+
+class ResponseCache:
+    """LLM yanıtları için iki katmanlı önbellek.
+
+    1. Normalize edilmiş mesaj üzerinde birebir eşleşme (LRU).
+    2. Niyet tahmininde hesaplanan MiniLM embedding'i ile anlamsal eşleşme:
+       aynı niyet ve model sürümündeki girişlerle kosinüs benzerliği
+       similarity_threshold'un üzerindeyse kayıtlı yanıt döndürülür.
+
+    Girişler (niyet, model/adapter sürümü) bölümlerinde tutulur; model ya da
+    indeks değiştiğinde eski yanıtlar eşleşmez. Her giriş ttl_seconds sonra
+    geçersiz olur, toplam giriş sayısı max_entries ile sınırlıdır.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, similarity_threshold=0.95, semantic=True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.semantic = semantic
+        # (niyet, sürüm, normalize mesaj) -> _CacheEntry, en eski kullanılan başta
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def get(self, intent, version, message, embedding=None):
+        """Önbellekteki yanıtı ve eşleşme türünü ("exact"/"semantic") döndürür, yoksa (None, None)"""
+        key = (intent, version, normalize_message(message))
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry, now):
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry.response, "exact"
+            if entry is not None:
+                del self._entries[key]
+
+            if self.semantic and embedding is not None:
+                match_key = self._semantic_match(intent, version, _unit_vector(embedding), now)
+                if match_key is not None:
+                    self._entries.move_to_end(match_key)
+                    self.semantic_hits += 1
+                    return self._entries[match_key].response, "semantic"
+
+            self.misses += 1
+            return None, None
+
+    def put(self, intent, version, message, response, embedding=None):
+        """Yanıtı önbelleğe ekler, sınır aşılırsa en eski kullanılan girişleri çıkarır"""
+        key = (intent, version, normalize_message(message))
+        vector = _unit_vector(embedding) if embedding is not None else None
+
+        with self._lock:
+            self._entries[key] = _CacheEntry(response, vector, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds is not None and now - entry.created_at > self.ttl_seconds
+
+    def _semantic_match(self, intent, version, vector, now):
+        """Aynı bölümdeki en benzer girişin anahtarını döndürür (eşik altındaysa None)"""
+        keys = []
+        vectors = []
+        for key, entry in list(self._entries.items()):
+            if key[0] != intent or key[1] != version or entry.embedding is None:
+                continue
+            if self._expired(entry, now):
+                del self._entries[key]
+                continue
+            keys.append(key)
+            vectors.append(entry.embedding)
+
+        if not keys:
+            return None
+
+        similarities = np.stack(vectors) @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        return keys[best]
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses
+        }
+
+
+def _unit_vector(embedding):
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
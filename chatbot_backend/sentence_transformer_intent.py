@@ -9,6 +9,12 @@ import os
 import json
 from sklearn.preprocessing import StandardScaler
 
+from bulk_embedder import BulkEmbedder
+from intent_head import LinearIntentHead, IdentityScaler, fit_intent_head, HEAD_FILENAME
+
+# Kullanılacak niyet sınıflandırıcısı: "auto" (intent_head.npz varsa onu kullan), "svc", "head"
+INTENT_HEAD = os.getenv("INTENT_HEAD", "auto")
+
 def load_and_combine_data(file_path1="maternal_health_data.csv", file_path2="Expanded_Maternal_Health_Support_Dataset__v2_.csv"):
     try:
         # İlk dosyayı yükle
@@ -67,13 +73,14 @@ def create_embeddings(texts, model_name='all-MiniLM-L6-v2'):
     
     print("Embedding'ler oluşturuluyor...")
     # Metinleri embedding'lere dönüştür
-    embeddings = model.encode(texts, show_progress_bar=True, batch_size=32)
+    embeddings = BulkEmbedder(model, model_name).encode(texts, show_progress_bar=True)
     
     return embeddings, model
 
 def train_and_save_model(data_path1="maternal_health_data.csv", 
                         data_path2="Expanded_Maternal_Health_Support_Dataset__v2_.csv", 
-                        model_dir="sentence_transformer_models"):
+                        model_dir="sentence_transformer_models",
+                        head_kind="logistic"):
     
 
     
@@ -158,6 +165,9 @@ def train_and_save_model(data_path1="maternal_health_data.csv",
     print(f"Scaler kaydedildi: {scaler_path}")
     print(f"Sentence Transformer modeli kaydedildi: {sentence_model_path}")
     
+    # Hızlı lineer head'i eğit ve kaydet (SVC yerine tek matris çarpımı)
+    head = train_intent_head(X_train, y_train, X_test, y_test, model_dir, head_kind)
+    
     #Model bilgilerini kaydet
     model_info = {
         'categories': model.classes_.tolist(),
@@ -165,7 +175,8 @@ def train_and_save_model(data_path1="maternal_health_data.csv",
         'n_samples': len(texts),
         'training_samples': X_train.shape[0],
         'test_samples': X_test.shape[0],
-        'sentence_transformer_model': 'all-MiniLM-L6-v2'
+        'sentence_transformer_model': 'all-MiniLM-L6-v2',
+        'intent_head': {'kind': head.kind, 'temperature': head.temperature}
     }
     
     info_path = os.path.join(model_dir, "model_info.json")
@@ -174,11 +185,44 @@ def train_and_save_model(data_path1="maternal_health_data.csv",
     
     print(f"Model bilgileri kaydedildi: {info_path}")
 
+def train_intent_head(X_train, y_train, X_test, y_test, model_dir="sentence_transformer_models", kind="logistic"):
+    """Lineer/centroid head'i eğitir, test setinde değerlendirir ve intent_head.npz olarak kaydeder"""
+    # Sıcaklık kalibrasyonu için eğitim setinden doğrulama ayır
+    X_fit, X_val, y_fit, y_val = train_test_split(
+        X_train, y_train, test_size=0.2, random_state=42, stratify=y_train
+    )
+    head = fit_intent_head(X_fit, y_fit, X_val, y_val, kind=kind)
+    
+    print(f"\n{kind} head (sıcaklık: {head.temperature:.3f}):")
+    print(classification_report(y_test, head.predict(X_test)))
+    
+    os.makedirs(model_dir, exist_ok=True)
+    head_path = os.path.join(model_dir, HEAD_FILENAME)
+    head.save(head_path)
+    print(f"Niyet head'i kaydedildi: {head_path}")
+    return head
+
 def load_models(model_dir="sentence_transformer_models"):
     model_path = os.path.join(model_dir, "intent_model.pkl")
     scaler_path = os.path.join(model_dir, "scaler.pkl")
+    head_path = os.path.join(model_dir, HEAD_FILENAME)
     sentence_model_path = os.path.join(model_dir, "sentence_transformer")
     
+    # Hızlı head: scaler W ve b'ye katlı olduğundan boş scaler ile döndürülür
+    use_head = INTENT_HEAD == "head" or (INTENT_HEAD == "auto" and os.path.exists(head_path))
+    if use_head:
+        if not all(os.path.exists(path) for path in [head_path, sentence_model_path]):
+            print(f"Hata: Gerekli model dosyaları '{model_dir}' dizininde bulunamadı.")
+            return None, None, None
+        try:
+            model = LinearIntentHead.load(head_path)
+            sentence_model = SentenceTransformer(sentence_model_path)
+            print(f"Tüm modeller başarıyla yüklendi ({model.kind} head).")
+            return model, IdentityScaler(), sentence_model
+        except Exception as e:
+            print(f"Hata: Model yüklenirken bir sorun oluştu - {e}")
+            return None, None, None
+    
     if not all(os.path.exists(path) for path in [model_path, scaler_path, sentence_model_path]):
         print(f"Hata: Gerekli model dosyaları '{model_dir}' dizininde bulunamadı.")
 
@@ -201,41 +245,62 @@ def load_models(model_dir="sentence_transformer_models"):
         print(f"Hata: Model yüklenirken bir sorun oluştu - {e}")
         return None, None, None
 
+def clean_query(user_query):
+    """Mesajdaki fazla boşlukları temizler"""
+    if isinstance(user_query, str):
+        return ' '.join(user_query.split())
+    return str(user_query)
+
 def predict_intent(user_query, sentence_model, scaler, model, confidence_threshold=0.6):
 
+    return predict_intents([user_query], sentence_model, scaler, model, confidence_threshold)[0]
+
+def predict_intents(user_queries, sentence_model, scaler, model, confidence_threshold=0.6, batch_size=32,
+                    return_embeddings=False):
+    """Birden fazla mesajı tek encoder çağrısı ve tek scaler/model çağrısıyla sınıflandırır.
+    
+    Her mesaj için (niyet, güven) döndürür; eşik altındaki mesajlar "anlasilamadi" olur.
+    return_embeddings=True ise (sonuçlar, embedding'ler) döndürülür; embedding
+    üretilemediyse embedding'ler None olur.
+    """
     if not all([sentence_model, scaler, model]):
-        return "modeller_yuklenemedi", 0.0
+        results = [("modeller_yuklenemedi", 0.0) for _ in user_queries]
+        return (results, None) if return_embeddings else results
+    
+    if len(user_queries) == 0:
+        return ([], None) if return_embeddings else []
+    
+    query_embeddings = None
     
     try:
-        # Metni temizle
-        if isinstance(user_query, str):
-            cleaned_query = ' '.join(user_query.split())
-        else:
-            cleaned_query = str(user_query)
-        
-        # Sentence Transformer ile embedding oluştur
-        query_embedding = sentence_model.encode([cleaned_query])
-        
-        # Embedding'i normalize et
-        query_embedding_scaled = scaler.transform(query_embedding)
+        # Metinleri temizle
+        cleaned_queries = [clean_query(query) for query in user_queries]
         
-        # Tahmin olasılıklarını al
-        probabilities = model.predict_proba(query_embedding_scaled)[0]
+        # Sentence Transformer ile tüm mesajların embedding'lerini tek seferde oluştur
+        query_embeddings = sentence_model.encode(cleaned_queries, batch_size=batch_size)
         
-        # En yüksek olasılıklı niyeti ve güven skorunu bul
-        max_prob_idx = np.argmax(probabilities)
-        max_prob = probabilities[max_prob_idx]
-        predicted_intent = model.classes_[max_prob_idx]
+        # Embedding'leri normalize et ve tüm satırların olasılıklarını al
+        probabilities = model.predict_proba(scaler.transform(query_embeddings))
         
-        # Güven eşiği kontrolü
-        if max_prob < confidence_threshold:
-            return "anlasilamadi", max_prob
+        # Her satır için en yüksek olasılıklı niyeti ve güven skorunu bul
+        max_prob_idx = np.argmax(probabilities, axis=1)
+        max_probs = probabilities[np.arange(len(cleaned_queries)), max_prob_idx]
         
-        return predicted_intent, max_prob
+        results = []
+        for idx, max_prob in zip(max_prob_idx, max_probs):
+            # numpy skalerleri jsonify edilemez; güven skoru Python float'ı olarak döner
+            max_prob = float(max_prob)
+            # Güven eşiği kontrolü
+            if max_prob < confidence_threshold:
+                results.append(("anlasilamadi", max_prob))
+            else:
+                results.append((model.classes_[idx], max_prob))
+        return (results, query_embeddings) if return_embeddings else results
         
     except Exception as e:
         print(f"Hata: Tahmin sırasında bir sorun oluştu - {e}")
-        return "hata_olustu", 0.0
+        results = [("hata_olustu", 0.0) for _ in user_queries]
+        return (results, query_embeddings) if return_embeddings else results
 
 #def get_intent_examples():
 #    examples = {
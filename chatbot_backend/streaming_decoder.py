@@ -0,0 +1,334 @@
+import torch
+from transformers import (
+    LogitsProcessorList,
+    RepetitionPenaltyLogitsProcessor,
+    NoRepeatNGramLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper
+)
+
+
+class SamplingParams:
+    """Bir üretim isteğinin örnekleme ayarları (model.generate parametreleriyle aynı anlamda)"""
+
+    def __init__(self, max_new_tokens=512, temperature=0.7, top_p=0.9, top_k=50, repetition_penalty=1.0,
+                 no_repeat_ngram_size=0, do_sample=True, stop_strings=None, prompt_lookup_num_tokens=0,
+                 max_matching_ngram_size=3):
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        # generate() örneklemede varsayılan olarak top_k=50 uygular
+        self.top_k = top_k
+        self.repetition_penalty = repetition_penalty
+        self.no_repeat_ngram_size = no_repeat_ngram_size
+        self.do_sample = do_sample
+        # Bu metinlerden biri üretildiğinde yanıt (metin hariç) sonlandırılır
+        self.stop_strings = stop_strings or []
+        # > 0 ise her adımda prompt'taki n-gram eşleşmesinden en fazla bu kadar taslak token doğrulanır
+        self.prompt_lookup_num_tokens = prompt_lookup_num_tokens
+        self.max_matching_ngram_size = max_matching_ngram_size
+
+
+def build_logits_processors(params):
+    """SamplingParams'a göre generate() ile aynı sırada logits işlemcilerini oluşturur"""
+    processors = LogitsProcessorList()
+    if params.repetition_penalty is not None and params.repetition_penalty != 1.0:
+        processors.append(RepetitionPenaltyLogitsProcessor(penalty=params.repetition_penalty))
+    if params.no_repeat_ngram_size:
+        processors.append(NoRepeatNGramLogitsProcessor(params.no_repeat_ngram_size))
+    if params.do_sample:
+        if params.temperature is not None and params.temperature != 1.0:
+            processors.append(TemperatureLogitsWarper(params.temperature))
+        if params.top_k:
+            processors.append(TopKLogitsWarper(top_k=params.top_k))
+        if params.top_p is not None and params.top_p < 1.0:
+            processors.append(TopPLogitsWarper(top_p=params.top_p))
+    return processors
+
+
+def select_next_token(scores, params):
+    """İşlenmiş skorlardan bir sonraki token'ı seçer (örnekleme ya da greedy)"""
+    if params.do_sample:
+        probs = torch.softmax(scores.float(), dim=-1)
+        return torch.multinomial(probs, num_samples=1).squeeze(1)
+    return torch.argmax(scores, dim=-1)
+
+
+def cache_to_layers(past_key_values):
+    """past_key_values'ı katman başına (key, value) tensör listesine çevirir"""
+    if hasattr(past_key_values, "layers"):
+        return [(layer.keys, layer.values) for layer in past_key_values.layers]
+    if hasattr(past_key_values, "key_cache"):
+        return list(zip(past_key_values.key_cache, past_key_values.value_cache))
+    return [(keys, values) for keys, values in past_key_values]
+
+
+def layers_to_cache(layers):
+    """(key, value) tensör listesinden modele verilebilecek cache nesnesi oluşturur"""
+    try:
+        from transformers import DynamicCache
+    except ImportError:
+        # Eski transformers sürümleri tuple formatını kullanır
+        return tuple((keys, values) for keys, values in layers)
+
+    cache = DynamicCache()
+    for layer_idx, (keys, values) in enumerate(layers):
+        cache.update(keys, values, layer_idx)
+    return cache
+
+
+def crop_cache(past_key_values, length):
+    """Cache'i ilk length pozisyona kırpar (reddedilen taslak token'ları atılır)"""
+    if hasattr(past_key_values, "crop"):
+        # Negatif değer sondan o kadar pozisyon siler (pozitif uzunluk yeni sürümlerde kullanımdan kalktı)
+        past_key_values.crop(length - past_key_values.get_seq_length())
+        return past_key_values
+    return layers_to_cache([
+        (keys[:, :, :length], values[:, :, :length]) for keys, values in cache_to_layers(past_key_values)
+    ])
+
+
+class PromptLookup:
+    """Prompt ve üretilen dizideki n-gram'lardan taslak token önerir (ikinci bir model gerekmez).
+
+    Her n-gram (1..max_ngram) için ardından gelen token'ın pozisyonu bir sözlükte
+    tutulur ve dizi uzadıkça güncellenir; dizinin son n-gram'ının önceki en yakın
+    geçişi bulunup devamı taslak olarak döndürülür. Uzun n-gram'lar önce denenir.
+    RAG yanıtları context'ten uzun parçalar aktardığı için taslaklar çoğunlukla tutar.
+    """
+
+    def __init__(self, token_ids, max_ngram=3, num_tokens=10):
+        self.max_ngram = max_ngram
+        self.num_tokens = num_tokens
+        self.tokens = []
+        self._continuations = {}
+        self.extend(token_ids)
+
+    def extend(self, token_ids):
+        for token_id in token_ids:
+            position = len(self.tokens)
+            for n in range(1, min(self.max_ngram, position) + 1):
+                self._continuations[tuple(self.tokens[position - n:position])] = position
+            self.tokens.append(token_id)
+
+    def propose(self, limit=None):
+        limit = self.num_tokens if limit is None else min(limit, self.num_tokens)
+        if limit <= 0:
+            return []
+        for n in range(min(self.max_ngram, len(self.tokens)), 0, -1):
+            start = self._continuations.get(tuple(self.tokens[-n:]))
+            if start is not None:
+                return self.tokens[start:start + limit]
+        return []
+
+
+def truncate_at_stop_strings(text_stream, stop_strings):
+    """Metin akışını durdurma metinlerinden birinde keser.
+
+    Durdurma metninin başlangıcı olabilecek son karakterler, bir sonraki parça
+    gelene kadar bekletilir; böylece durdurma metni istemciye hiç gönderilmez.
+    """
+    if not stop_strings:
+        yield from text_stream
+        return
+
+    holdback = max(len(stop) for stop in stop_strings) - 1
+    pending = ""
+    for text in text_stream:
+        pending += text
+        positions = [pending.find(stop) for stop in stop_strings if stop in pending]
+        if positions:
+            head = pending[:min(positions)]
+            if head:
+                yield head
+            return
+        if len(pending) > holdback:
+            cut = len(pending) - holdback
+            yield pending[:cut]
+            pending = pending[cut:]
+    if pending:
+        yield pending
+
+
+class IncrementalDetokenizer:
+    """Token id'lerini parça parça metne çevirir.
+
+    Tüm diziyi her adımda decode etmek yerine yalnızca son pencereyi decode eder;
+    yarım kalmış UTF-8 karakterleri bir sonraki token'a kadar bekletir.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.token_ids = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+
+    def push(self, token_id):
+        self.token_ids.append(token_id)
+        prefix_text = self.tokenizer.decode(
+            self.token_ids[self.prefix_offset:self.read_offset], skip_special_tokens=True
+        )
+        new_text = self.tokenizer.decode(self.token_ids[self.prefix_offset:], skip_special_tokens=True)
+        if len(new_text) > len(prefix_text) and not new_text.endswith("�"):
+            self.prefix_offset = self.read_offset
+            self.read_offset = len(self.token_ids)
+            return new_text[len(prefix_text):]
+        return ""
+
+
+class StreamingDecoder:
+    """KV cache'i adımlar arasında taşıyarak token token üretim yapar.
+
+    Prompt yalnızca bir kez (prefill) işlenir; sonraki her adımda modele sadece
+    son token ve past_key_values verilir. Örnekleme ayarları generate() ile
+    aynı logits işlemcileriyle uygulanır.
+
+    prefix_cache (PrefixKVCache) verilirse prompt kayıtlı bir sabit önekle
+    başladığında önek yeniden işlenmez, prefill önekin KV cache'inden başlar.
+
+    params.prompt_lookup_num_tokens > 0 ise spekülatif çözümleme yapılır: prompt'tan
+    önerilen taslak token'lar tek forward'da doğrulanır, uyuşan en uzun önek kabul
+    edilir. Her pozisyonda token yine modelin dağılımından seçilip taslakla
+    karşılaştırıldığı için çıktı greedy'de aynı, örneklemede aynı dağılımdandır.
+    """
+
+    def __init__(self, model, tokenizer, prefix_cache=None, adapter_name=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix_cache = prefix_cache
+        # Paylaşılan base modelde önek önbelleği adapter'a göre seçilir
+        self.adapter_name = adapter_name
+
+        self.draft_tokens = 0
+        self.accepted_tokens = 0
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def _eos_token_ids(self):
+        eos_token_id = self.tokenizer.eos_token_id
+        if eos_token_id is None:
+            return set()
+        if isinstance(eos_token_id, (list, tuple)):
+            return set(eos_token_id)
+        return {eos_token_id}
+
+    def generate_token_ids(self, input_ids, attention_mask=None, params=None):
+        """Prompt'u bir kez işler ve üretilen token id'lerini tek tek döndürür (EOS hariç).
+
+        Tek bir dizi (batch boyutu 1) üretir; toplu istekler ayrı ayrı çağrılmalıdır.
+        """
+        if input_ids.dim() != 2 or input_ids.shape[0] != 1:
+            raise ValueError(f"generate_token_ids tek dizi bekler, input_ids boyutu: {tuple(input_ids.shape)}")
+        params = params or SamplingParams()
+        processors = build_logits_processors(params)
+        eos_token_ids = self._eos_token_ids()
+
+        input_ids = input_ids.to(self.device)
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        attention_mask = attention_mask.to(self.device)
+
+        # Logits işlemcileri (repetition penalty, n-gram) tüm diziyi görmeli
+        sequence = input_ids
+        past_key_values = None
+        step_input = input_ids
+        unpadded = bool(attention_mask.all())
+        if self.prefix_cache is not None and unpadded:
+            prefix = self.prefix_cache.match(input_ids[0].tolist(), self.adapter_name)
+            if prefix is not None:
+                past_key_values = layers_to_cache(prefix.layers)
+                step_input = input_ids[:, len(prefix):]
+
+        if params.prompt_lookup_num_tokens > 0 and unpadded:
+            yield from self._generate_speculative(sequence, step_input, past_key_values, params, processors,
+                                                  eos_token_ids)
+            return
+
+        with torch.no_grad():
+            for _ in range(params.max_new_tokens):
+                outputs = self.model(
+                    input_ids=step_input,
+                    attention_mask=attention_mask,
+                    past_key_values=past_key_values,
+                    use_cache=True
+                )
+                past_key_values = outputs.past_key_values
+                scores = processors(sequence, outputs.logits[:, -1, :])
+                next_token = select_next_token(scores, params)
+
+                token_id = next_token.item()
+                if token_id in eos_token_ids:
+                    break
+
+                yield token_id
+
+                step_input = next_token.unsqueeze(-1)
+                sequence = torch.cat([sequence, step_input], dim=-1)
+                attention_mask = torch.cat(
+                    [attention_mask, attention_mask.new_ones((attention_mask.shape[0], 1))], dim=-1
+                )
+
+    def _generate_speculative(self, sequence, step_input, past_key_values, params, processors, eos_token_ids):
+        """Prompt-lookup taslaklarıyla üretim (tek dizi, dolgusuz).
+
+        Her forward'a cache'te olmayan token'lar ve taslak birlikte verilir;
+        taslağın i. pozisyonundaki logits'ten seçilen token taslakla aynıysa
+        sonraki pozisyona geçilir. İlk uyuşmazlıkta seçilen token çıktıya eklenir
+        ve cache reddedilen taslak token'lardan önceki uzunluğa kırpılır.
+        """
+        lookup = PromptLookup(sequence[0].tolist(), params.max_matching_ngram_size, params.prompt_lookup_num_tokens)
+        cached = sequence.shape[1] - step_input.shape[1]
+        generated = 0
+
+        with torch.no_grad():
+            while generated < params.max_new_tokens:
+                # Kabul edilen taslaklar ve son seçilen token max_new_tokens'ı aşmamalı
+                draft = lookup.propose(params.max_new_tokens - generated - 1)
+                model_input = torch.cat([step_input, step_input.new_tensor([draft])], dim=-1) if draft else step_input
+                outputs = self.model(
+                    input_ids=model_input,
+                    attention_mask=torch.ones((1, cached + model_input.shape[1]), dtype=torch.long, device=self.device),
+                    past_key_values=past_key_values,
+                    use_cache=True
+                )
+                past_key_values = outputs.past_key_values
+                # Son prompt/önceki token'ın ve her taslak token'ın sonrasını tahmin eden logits
+                logits = outputs.logits[:, step_input.shape[1] - 1:, :]
+
+                accepted = 0
+                for position in range(len(draft) + 1):
+                    scores = processors(sequence, logits[:, position, :])
+                    token_id = select_next_token(scores, params).item()
+                    if token_id in eos_token_ids:
+                        return
+
+                    yield token_id
+                    generated += 1
+                    lookup.extend([token_id])
+                    sequence = torch.cat([sequence, sequence.new_tensor([[token_id]])], dim=-1)
+                    if position == len(draft) or token_id != draft[position]:
+                        break
+                    accepted += 1
+
+                self.draft_tokens += len(draft)
+                self.accepted_tokens += accepted
+                # Cache: önceki token'lar + işlenen girdi + kabul edilen taslaklar
+                cached += step_input.shape[1] + accepted
+                if accepted < len(draft):
+                    past_key_values = crop_cache(past_key_values, cached)
+                step_input = sequence[:, -1:]
+
+    def stream_text(self, input_ids, attention_mask=None, params=None):
+        """Üretilen metni parça parça döndürür"""
+        params = params or SamplingParams()
+        yield from truncate_at_stop_strings(self._stream_text(input_ids, attention_mask, params), params.stop_strings)
+
+    def _stream_text(self, input_ids, attention_mask, params):
+        detokenizer = IncrementalDetokenizer(self.tokenizer)
+        for token_id in self.generate_token_ids(input_ids, attention_mask, params):
+            text = detokenizer.push(token_id)
+            if text:
+                yield text
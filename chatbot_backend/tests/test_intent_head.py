@@ -0,0 +1,54 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_head import LinearIntentHead, IdentityScaler
+from sentence_transformer_intent import predict_intents
+
+
+class FakeEncoder:
+    """Mesajı sabit bir embedding'e eşleyen SentenceTransformer yerine geçen encoder"""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def encode(self, texts, batch_size=32):
+        return np.stack([self.embeddings[text] for text in texts]).astype(np.float32)
+
+
+def make_head():
+    # İlk boyut "other_category", ikinci boyut "nutrition" sınıfını seçer
+    return LinearIntentHead(np.eye(2) * 10, np.zeros(2), ["other_category", "nutrition"])
+
+
+ENCODER = FakeEncoder({
+    "confident": np.array([1.0, 0.0]),
+    "unsure": np.array([0.0, 0.0])
+})
+
+
+def test_predict_intents_returns_python_floats():
+    results = predict_intents(["confident", "unsure"], ENCODER, IdentityScaler(), make_head())
+
+    assert [intent for intent, _ in results] == ["other_category", "anlasilamadi"]
+    for _, confidence in results:
+        assert type(confidence) is float
+
+
+def test_chat_result_is_jsonifiable_with_head_loaded():
+    import api_chatbot
+
+    bot = api_chatbot.APIChatbot.__new__(api_chatbot.APIChatbot)
+    bot.intent_model = make_head()
+    bot.scaler = IdentityScaler()
+    bot.sentence_model = ENCODER
+    bot.intent_batcher = lambda message: bot.classify_user_messages([message])[0]
+
+    with api_chatbot.app.app_context():
+        for message in ("confident", "unsure"):
+            result = bot.process_user_message(message)
+            payload = api_chatbot.jsonify(result).get_json()
+            assert payload["confidence"] == result["confidence"]
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rag_info"))
+
+from metadata_filter import detect_stage
+
+
+@pytest.mark.parametrize("text, stage", [
+    # Anahtar kelimeyi başka bir kelimenin içinde taşıyan metinler dönem etiketi almamalı
+    ("Please elaborate on the laboratory results.", "general"),
+    ("The laboratory staff were collaborating on the report.", "general"),
+    ("An unexpecting visitor arrived at the clinic.", "general"),
+    ("Infantry training schedules are posted weekly.", "general"),
+    # Tam kelime, çoğul ve kök eşleşmeleri korunmalı
+    ("Early labor often starts with irregular contractions.", "pregnancy"),
+    ("She is pregnant and in her second trimester.", "pregnancy"),
+    ("Women expecting twins need more frequent ultrasounds.", "pregnancy"),
+    ("Breastfeeding newborns every few hours supports lactation.", "postpartum"),
+    ("Lochia is normal during the puerperium.", "postpartum"),
+])
+def test_detect_stage_matches_whole_words(text, stage):
+    assert detect_stage(text) == stage
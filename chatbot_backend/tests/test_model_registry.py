@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_registry import ModelRegistry, ModelKey
+
+
+def write_adapter(path, mtime):
+    weights = os.path.join(path, "adapter_model.safetensors")
+    with open(weights, "wb") as f:
+        f.write(b"weights")
+    os.utime(weights, (mtime, mtime))
+
+
+def test_adapter_version_is_fixed_at_load_time(tmp_path):
+    adapter = str(tmp_path)
+    write_adapter(adapter, 1_000_000)
+    key = ModelKey("base", adapter, "cpu", "float32")
+    registry = ModelRegistry()
+
+    assert registry.loaded_adapter_version(key, adapter) is None
+    registry.get_or_load(key, lambda key: object())
+    assert registry.loaded_adapter_version(key, adapter) == "1000000"
+
+    # Adapter diskte yeniden eğitilse de yüklü model eski sürümle anılır
+    write_adapter(adapter, 2_000_000)
+    assert registry.loaded_adapter_version(key, adapter) == "1000000"
+
+    registry.unload(key)
+    assert registry.loaded_adapter_version(key, adapter) is None
+
+
+def test_shared_key_records_every_adapter(tmp_path):
+    first, second = str(tmp_path / "a"), str(tmp_path / "b")
+    for path, mtime in ((first, 1_000_000), (second, 2_000_000)):
+        os.makedirs(path)
+        write_adapter(path, mtime)
+    key = ModelKey("base", (first, second), "cpu", "float32")
+    registry = ModelRegistry()
+    registry.get_or_load(key, lambda key: object())
+
+    assert registry.loaded_adapter_version(key, first) == "1000000"
+    assert registry.loaded_adapter_version(key, second) == "2000000"